@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""convert_to_csv Benchmark
+Export time should grow linearly with the number of steps per test
+(constant time per step)"""
+
+import os
+import tempfile
+import timeit
+from tspec import TestSpec
+from tspec import QCTest
+
+NUM_TESTS = 20
+STEPS_PER_TEST = (100, 1000, 5000, 20000)
+
+def build_spec(steps_per_test):
+    """Build a test spec with a fixed number of steps per test
+    :param steps_per_test number of steps per test"""
+    test_spec = TestSpec("Benchmark")
+    for test_idx in range(NUM_TESTS):
+        test = QCTest("Subject\\Benchmark", "Level", "Area", True)
+        test.set_id("Test_%d" % test_idx)
+        for step_idx in range(steps_per_test):
+            test.add_step(step_idx + 1, "Step %d description" % step_idx, "Step %d result" % step_idx)
+        test_spec.add_test(test)
+    return test_spec
+
+def main():
+    """Run benchmark"""
+    csv_path = os.path.join(tempfile.mkdtemp(), "bench.csv")
+    print("%15s %12s %15s" % ("steps/test", "time (s)", "us/step"))
+    for steps_per_test in STEPS_PER_TEST:
+        test_spec = build_spec(steps_per_test)
+        elapsed = min(timeit.repeat(lambda: test_spec.convert_to_csv(csv_path), number=1, repeat=3))
+        print("%15d %12.4f %15.3f" % (steps_per_test, elapsed, \
+                                      1e6 * elapsed / (NUM_TESTS * steps_per_test)))
+    os.remove(csv_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""CSV Import Benchmark
+Reads a 1M-row tspec csv file back, streaming (read_csv_tests) and into
+a TestSpec object (TestSpec.from_csv)"""
+
+import os
+import tempfile
+import time
+from tspec import TestSpec
+from tspec import TestSpecWriter
+from tspec import TestTemplate
+from tspec import QCTest
+from tspec import read_csv_tests
+
+NUM_TESTS = 100000
+STEPS_PER_TEST = 10
+
+def write_csv(csv_path):
+    """Write a NUM_TESTS x STEPS_PER_TEST rows csv file
+    :param csv_path tspec csv path"""
+    template = TestTemplate("Test_{idx}", \
+                            [("Step %d of test {idx}" % step, "Result %d" % step) \
+                             for step in range(STEPS_PER_TEST)], \
+                            [("idx", range(NUM_TESTS))], QCTest, \
+                            test_subject="Subject\\Benchmark", test_level="Level", \
+                            test_area="Area", is_automated=True)
+    with TestSpecWriter(csv_path) as writer:
+        writer.write_tests(template)
+
+def main():
+    """Run benchmark"""
+    csv_path = os.path.join(tempfile.mkdtemp(), "bench.csv")
+    write_csv(csv_path)
+    num_rows = NUM_TESTS * STEPS_PER_TEST
+    print("%d rows (%.1f MB)" % (num_rows, os.path.getsize(csv_path) / 2.0**20))
+    start = time.time()
+    num_tests = 0
+    for _ in read_csv_tests(csv_path):
+        num_tests += 1
+    elapsed = time.time() - start
+    print("read_csv_tests:     %6.2f s (%8.0f rows/s, %d tests)" % (elapsed, num_rows / elapsed, num_tests))
+    start = time.time()
+    test_spec = TestSpec.from_csv(csv_path)
+    elapsed = time.time() - start
+    print("TestSpec.from_csv:  %6.2f s (%8.0f rows/s, %d tests)" % (elapsed, num_rows / elapsed, \
+                                                                   len(test_spec.tests)))
+    os.remove(csv_path)
+
+if __name__ == '__main__':
+    main()
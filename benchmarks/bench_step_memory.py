@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""TestStep Memory Benchmark
+Compares the per-step memory footprint of the slotted TestStep against
+the original (__dict__ based) TestStep class"""
+
+import sys
+from tspec import TestStep
+
+NUM_STEPS = 1000000
+
+class LegacyTestStep(object):
+    """Original TestStep Class (one __dict__ per instance)"""
+    def __init__(self, step_id=0, description="", expected_result="", **kwargs):
+        """LegacyTestStep constructor"""
+        self.step_id = step_id
+        self.description = description
+        self.expected_result = expected_result
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+def legacy_step_size(step):
+    """Size of a LegacyTestStep object (object + attribute dict)
+    :param step LegacyTestStep object"""
+    return sys.getsizeof(step) + sys.getsizeof(step.__dict__)
+
+def step_size(step):
+    """Size of a TestStep object (object + custom attributes dict)
+    :param step TestStep object"""
+    extras = TestStep._extras.__get__(step)
+    return sys.getsizeof(step) + (sys.getsizeof(extras) if extras is not None else 0)
+
+def main():
+    """Run benchmark"""
+    print("%25s %15s %15s %15s" % ("", "legacy (B)", "slotted (B)", "saving"))
+    for label, kwargs in (("standard fields", {}), ("with custom attribute", {'owner': "me"})):
+        legacy = legacy_step_size(LegacyTestStep(1, "description", "result", **kwargs))
+        slotted = step_size(TestStep(1, "description", "result", **kwargs))
+        print("%25s %15d %15d %14.1f%%" % (label, legacy, slotted, 100.0 * (legacy - slotted) / legacy))
+    legacy = legacy_step_size(LegacyTestStep(1, "description", "result"))
+    slotted = step_size(TestStep(1, "description", "result"))
+    print("\n%d steps (objects only): %.1f MB (legacy) vs %.1f MB (slotted)" \
+          % (NUM_STEPS, NUM_STEPS * legacy / 2.0**20, NUM_STEPS * slotted / 2.0**20))
+
+if __name__ == '__main__':
+    main()
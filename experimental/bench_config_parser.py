@@ -0,0 +1,76 @@
+"""TestSpecConfigParser Benchmark
+Parser throughput (lines per second) on a generated multi-megabyte .tspec file"""
+import os
+import re
+import tempfile
+import time
+from tspec_config_parser import LEXER
+from tspec_config_parser import TestSpecConfigCache
+from tspec_config_parser import TestSpecConfigParser
+from tspec_config_parser import get_directive
+
+NUM_TESTS = 20000
+STEPS_PER_TEST = 5
+
+def write_config(config_path):
+    """Write a NUM_TESTS x STEPS_PER_TEST .tspec file
+    :param config_path .tspec file path"""
+    with open(config_path, 'w') as config:
+        config.write("# Generated Test Spec Configuration File\n\nTSPEC Benchmark\n\n")
+        for test_idx in range(NUM_TESTS):
+            config.write("START_TEST Benchmark Test %d\n\n" % test_idx)
+            for step_idx in range(STEPS_PER_TEST):
+                config.write("START_STEP %d\n" % (step_idx + 1))
+                config.write("DESCRIPTION Do step %d of test %d\n" % (step_idx, test_idx))
+                config.write("RESULT Step %d of test %d is done\n" % (step_idx, test_idx))
+                config.write("END_STEP\n\n")
+            config.write("END_TEST\n\n")
+
+def get_directive_sequential(line):
+    """Previous lexer: one re.match per directive until one matches"""
+    for directive, pattern in LEXER.iteritems():
+        match = re.match(pattern, line)
+        if match:
+            return directive, match.groupdict()
+    return None
+
+def main():
+    """Run benchmark"""
+    config_path = os.path.join(tempfile.mkdtemp(), "bench.tspec")
+    write_config(config_path)
+    with open(config_path) as config:
+        lines = config.readlines()
+    print("%d lines (%.1f MB)" % (len(lines), os.path.getsize(config_path) / 2.0**20))
+    for label, lexer in (("sequential re.match", get_directive_sequential), \
+                         ("master pattern", get_directive)):
+        start = time.time()
+        for line in lines:
+            lexer(line)
+        elapsed = time.time() - start
+        print("%-30s %10.0f lines/s" % (label, len(lines) / elapsed))
+    start = time.time()
+    TestSpecConfigParser(config_path).generate_tspec()
+    elapsed = time.time() - start
+    print("%-30s %10.0f lines/s" % ("generate_tspec", len(lines) / elapsed))
+    start = time.time()
+    TestSpecConfigParser(config_path, use_mmap=True).generate_tspec()
+    elapsed = time.time() - start
+    print("%-30s %10.0f lines/s" % ("generate_tspec (mmap)", len(lines) / elapsed))
+    csv_path = os.path.join(os.path.dirname(config_path), "bench.csv")
+    start = time.time()
+    TestSpecConfigParser(config_path).generate_csv(csv_path)
+    elapsed = time.time() - start
+    print("%-30s %10.0f lines/s" % ("generate_csv", len(lines) / elapsed))
+    os.remove(csv_path)
+    cache = TestSpecConfigCache(os.path.join(os.path.dirname(config_path), "cache"))
+    for label in ("generate_tspec (cold cache)", "generate_tspec (warm cache)"):
+        start = time.time()
+        TestSpecConfigParser(config_path, cache).generate_tspec()
+        elapsed = time.time() - start
+        print("%-30s %10.0f lines/s" % (label, len(lines) / elapsed))
+    cache.max_size = 0
+    cache.evict()
+    os.remove(config_path)
+
+if __name__ == '__main__':
+    main()
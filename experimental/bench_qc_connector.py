@@ -0,0 +1,336 @@
+"""QCConnector Benchmark
+HTML stripping throughput (fields per second) on a corpus of QC step fields
+and export throughput (tests per second) on a simulated OTA subject tree"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from cStringIO import StringIO
+from tspec import QCTest
+from tspec import TestSpec
+from HTMLParser import HTMLParser
+from qc_connector import MLStripper
+from qc_connector import QCConnector
+from qc_connector import QCLookupCache
+from qc_connector import QCTestExporter
+from qc_connector import TagStripper
+from qc_connector import strip_tags
+from qc_simulator import SimulatedServer
+
+NUM_STEPS = 20000
+DISTINCT_FIELDS = 500
+TREE_FANOUT = 4
+TREE_DEPTH = 5
+TESTS_PER_FOLDER = 10
+STEPS_PER_TEST = 5
+DEEP_TREE_DEPTH = 5000
+LATENCY_TREE_DEPTH = 3
+LATENCY = 0.001
+CHANGED_TESTS = 0.01
+UPLOAD_TESTS = 1000
+UPLOAD_FOLDERS = 20
+LOOKUP_PASSES = 5
+RUN_HISTORY_TESTS = 1000
+RUN_HISTORY_RUNS_PER_TEST = 1000
+PREFETCH_RUNS_PER_TEST = 5
+PREFETCH_LATENCY = 0.00005
+CONSUMER_WORK = 0.0002
+
+def make_corpus():
+    """Generate step names, descriptions and expected results the way QC stores
+    them (HTML with a small vocabulary that repeats a lot)"""
+    random.seed(0)
+    fields = []
+    for idx in range(DISTINCT_FIELDS):
+        fields.append('<html><body><div align="left"><font face="Arial">'
+                      '<span style="font-size:8pt">Step %d: open the &quot;Calculator&quot; '
+                      '&amp; type <b>%d + %d</b></span></font></div></body></html>' \
+                      % (idx, idx, idx * 2))
+    return [random.choice(fields) for _ in range(3 * NUM_STEPS)]
+
+def strip_tags_unshared(html):
+    """Previous strip_tags: one HTMLParser and one MLStripper per field"""
+    parser = HTMLParser()
+    stripper = MLStripper()
+    html = parser.unescape(html)
+    stripper.feed(html)
+    return stripper.get_data()
+
+def recursive_export_unbuffered(csv_file, node):
+    """Previous QCConnector.recursive_export"""
+    csv_file.write('%s,%s\n' % (node.Name, strip_tags(node.Description)))
+    if node.Count <= 0:
+        tests = node.FindTests('')
+        if tests:
+            for test in tests:
+                design_step_factory = test.DesignStepFactory
+                csv_file.write(',%s,%s\n' % (test.ID, test.Name))
+                for design_step in design_step_factory.NewList(''):
+                    step_name = strip_tags(design_step.StepName)
+                    step_description = strip_tags(design_step.StepDescription)
+                    step_expected_result = strip_tags(design_step.StepExpectedResult)
+                    csv_file.write(',,,,%s,%s,%s\n' %(step_name,
+                                                      step_description,
+                                                      step_expected_result))
+                csv_file.flush()
+    else:
+        for child in node.NewList():
+            if child:
+                recursive_export_unbuffered(csv_file, child)
+                csv_file.write('\n')
+
+def export_buffered(csv_file, node):
+    """QCTestExporter"""
+    exporter = QCTestExporter(csv_file)
+    exporter.export_node(node)
+    exporter.flush()
+
+def create_session(server, lookup_cache=None):
+    """Open a logged-in session on the simulated server"""
+    session = QCConnector("http://qc.example.com/qcbin", server.connect(), lookup_cache)
+    session.login_and_connect("user", "password", "DOMAIN", "PROJECT")
+    return session
+
+def bench_export():
+    """Export throughput and OTA calls per test on a simulated subject tree"""
+    logging.getLogger().setLevel(logging.WARN)
+    server = SimulatedServer(TREE_FANOUT, TREE_DEPTH, TESTS_PER_FOLDER, STEPS_PER_TEST)
+    num_tests = len(server.tests)
+    print("%d tests, %d steps per test" % (num_tests, STEPS_PER_TEST))
+    csv_path = os.path.join(tempfile.mkdtemp(), "bench.csv")
+    for label, export in (("recursive, unbuffered", recursive_export_unbuffered), \
+                          ("QCTestExporter", export_buffered)):
+        root = server.connect().TreeManager.NodeByPath(server.root)
+        server.reset_calls()
+        with open(csv_path, 'wb') as csv_file:
+            start = time.time()
+            export(csv_file, root)
+            elapsed = time.time() - start
+        print("%-30s %10.0f tests/s %8.1f OTA calls/test" \
+              % (label, num_tests / elapsed, server.get_num_calls() / float(num_tests)))
+    # Same export with a round trip latency, serial and over a session pool
+    server = SimulatedServer(TREE_FANOUT, LATENCY_TREE_DEPTH, TESTS_PER_FOLDER, \
+                             STEPS_PER_TEST, latency=LATENCY)
+    num_tests = len(server.tests)
+    print("%d tests, %.1f ms per OTA call" % (num_tests, LATENCY * 1000))
+    session = create_session(server)
+    server.reset_calls()
+    start = time.time()
+    session.export_tests(server.root, csv_path)
+    elapsed = time.time() - start
+    print("%-30s %10.0f tests/s %8d OTA calls" % ("export_tests", num_tests / elapsed, \
+                                                 server.get_num_calls()))
+    with open(csv_path) as csv_file:
+        serial_csv = csv_file.read()
+    for sessions in (2, 4, 8):
+        server.reset_calls()
+        start = time.time()
+        session.export_tests_concurrent(server.root, lambda: create_session(server), csv_path, \
+                                        sessions=sessions, split_depth=2)
+        elapsed = time.time() - start
+        with open(csv_path) as csv_file:
+            assert csv_file.read() == serial_csv
+        print("%-30s %10.0f tests/s %8d OTA calls" \
+              % ("export_tests_concurrent (%d)" % sessions, num_tests / elapsed, \
+                 server.get_num_calls()))
+    os.remove(csv_path)
+    # A single chain of folders deeper than the recursion limit
+    deep_tree = SimulatedServer(1, DEEP_TREE_DEPTH, 1, 1)
+    root = deep_tree.connect().TreeManager.NodeByPath(deep_tree.root)
+    try:
+        recursive_export_unbuffered(StringIO(), root)
+    except RuntimeError:
+        print("%-30s %10s" % ("recursive, depth %d" % DEEP_TREE_DEPTH, "failed"))
+    export_buffered(StringIO(), root)
+    print("%-30s %10s (recursion limit %d)" % ("QCTestExporter, depth %d" % DEEP_TREE_DEPTH, \
+                                              "ok", sys.getrecursionlimit()))
+
+def bench_incremental():
+    """Full vs incremental export after changing CHANGED_TESTS of the tests"""
+    server = SimulatedServer(TREE_FANOUT, TREE_DEPTH, TESTS_PER_FOLDER, STEPS_PER_TEST)
+    num_tests = len(server.tests)
+    temp_dir = tempfile.mkdtemp()
+    csv_path = os.path.join(temp_dir, "bench.csv")
+    manifest_path = os.path.join(temp_dir, "bench.manifest")
+    session = create_session(server)
+    session.export_tests_incremental(server.root, manifest_path, csv_path)
+    random.seed(0)
+    for test_id in random.sample(sorted(server.tests), int(num_tests * CHANGED_TESTS)):
+        server.modify_test(test_id, step_description="<p>Changed</p>")
+    print("%d tests, %d changed" % (num_tests, int(num_tests * CHANGED_TESTS)))
+    for label, export in (("export_tests", session.export_tests), \
+                          ("export_tests_incremental", \
+                           lambda node_path, csv_path: \
+                           session.export_tests_incremental(node_path, manifest_path, csv_path))):
+        server.reset_calls()
+        start = time.time()
+        export(server.root, csv_path)
+        elapsed = time.time() - start
+        print("%-30s %10.0f tests/s %8.1f OTA calls/test" \
+              % (label, num_tests / elapsed, server.get_num_calls() / float(num_tests)))
+    os.remove(csv_path)
+    os.remove(manifest_path)
+
+def bench_bulk_export():
+    """Per-object vs bulk (SQL) export with a round trip latency"""
+    server = SimulatedServer(TREE_FANOUT, LATENCY_TREE_DEPTH, TESTS_PER_FOLDER, \
+                             STEPS_PER_TEST, latency=LATENCY)
+    num_tests = len(server.tests)
+    csv_path = os.path.join(tempfile.mkdtemp(), "bench.csv")
+    session = create_session(server)
+    print("%d tests, %.1f ms per round trip" % (num_tests, LATENCY * 1000))
+    for label, bulk in (("export_tests", False), ("export_tests, bulk", True)):
+        server.reset_calls()
+        start = time.time()
+        session.export_tests(server.root, csv_path, bulk=bulk)
+        elapsed = time.time() - start
+        round_trips = sum([count for name, count in server.calls.iteritems() \
+                           if not name.startswith("Recordset.")])
+        print("%-30s %10.0f tests/s %8.1f round trips/test %8.1f OTA calls/test" \
+              % (label, num_tests / elapsed, round_trips / float(num_tests), \
+                 server.get_num_calls() / float(num_tests)))
+    os.remove(csv_path)
+
+def make_upload_spec():
+    """TestSpec of UPLOAD_TESTS tests spread over UPLOAD_FOLDERS folders"""
+    test_spec = TestSpec("Upload Benchmark")
+    for test_idx in range(UPLOAD_TESTS):
+        test = QCTest("Subject\\Upload\\Folder_%d" % (test_idx * UPLOAD_FOLDERS // UPLOAD_TESTS))
+        test.set_id("Upload Test %d" % test_idx)
+        for step_idx in range(STEPS_PER_TEST):
+            test.add_step(step_idx + 1, "Do step %d" % step_idx, \
+                          "Step %d is done" % step_idx if step_idx % 2 else "")
+        test_spec.add_test(test)
+    return test_spec
+
+def upload_uncached(session, test_spec):
+    """Upload without folder cache: one NodeByPath per test, every field sent"""
+    for test in test_spec.iter_tests():
+        # Folders are created once, then looked up again for every test
+        session.get_test_uploader().get_folder(test.test_subject)
+        folder = session.tree_manager.NodeByPath(test.test_subject)
+        qc_test = folder.TestFactory.AddItem(None)
+        qc_test.Name = test.get_id()
+        qc_test.Post()
+        for step in test.get_test_steps():
+            design_step = qc_test.DesignStepFactory.AddItem(None)
+            design_step.StepName = str(step.get_id())
+            design_step.StepDescription = step.get_description()
+            design_step.StepExpectedResult = step.get_expected_result()
+            design_step.Post()
+
+def bench_upload():
+    """Upload throughput and OTA calls per test"""
+    test_spec = make_upload_spec()
+    print("%d tests in %d folders, %.1f ms per OTA call" \
+          % (UPLOAD_TESTS, UPLOAD_FOLDERS, LATENCY * 1000))
+    for label, sessions in (("uncached, one by one", None), ("upload_tspec", 0), \
+                            ("upload_tspec (4)", 4), ("upload_tspec (8)", 8)):
+        server = SimulatedServer(1, 0, 0, latency=LATENCY)
+        session = create_session(server)
+        server.reset_calls()
+        start = time.time()
+        if sessions is None:
+            upload_uncached(session, test_spec)
+        elif sessions == 0:
+            session.upload_tspec(test_spec, server.root)
+        else:
+            session.upload_tspec(test_spec, server.root, lambda: create_session(server), sessions)
+        elapsed = time.time() - start
+        assert len(server.tests) == UPLOAD_TESTS
+        print("%-30s %10.0f tests/s %8.1f OTA calls/test" \
+              % (label, UPLOAD_TESTS / elapsed, server.get_num_calls() / float(UPLOAD_TESTS)))
+
+def bench_lookup_cache():
+    """Repeated tree walks (children counts) and test filters, with and
+    without the lookup cache"""
+    server = SimulatedServer(TREE_FANOUT, LATENCY_TREE_DEPTH, TESTS_PER_FOLDER, \
+                             STEPS_PER_TEST, latency=LATENCY)
+    folder_paths = []
+    stack = [server.root_folder]
+    while stack:
+        folder = stack.pop()
+        folder_paths.append(folder.path)
+        stack.extend(folder.children)
+    filters = ["[Filter]{TS_SUBJECT:%s}" % path for path in folder_paths[:20]]
+    print("%d passes over %d folders and %d filters, %.1f ms per OTA call" \
+          % (LOOKUP_PASSES, len(folder_paths), len(filters), LATENCY * 1000))
+    for label, lookup_cache in (("no cache", QCLookupCache(max_size=0)), \
+                                ("QCLookupCache", QCLookupCache())):
+        session = create_session(server, lookup_cache)
+        session.get_tree_manager()
+        test_factory = session.get_test_factory()
+        server.reset_calls()
+        start = time.time()
+        for _ in range(LOOKUP_PASSES):
+            for folder_path in folder_paths:
+                session.get_children_count(folder_path)
+            for filt in filters:
+                test_factory.new_list(filt)
+        elapsed = time.time() - start
+        num_lookups = LOOKUP_PASSES * (len(folder_paths) + len(filters))
+        print("%-30s %10.0f lookups/s %8d OTA calls (%d hits, %d misses)" \
+              % (label, num_lookups / elapsed, server.get_num_calls(), \
+                 lookup_cache.hits, lookup_cache.misses))
+
+def bench_paging():
+    """Run history paging: largest list held by the client on a large history
+    (the simulated server shares the process, so RSS says little), and
+    background prefetch overlapping a consumer that does some work per record"""
+    server = SimulatedServer(RUN_HISTORY_TESTS, 1, 1, 0, RUN_HISTORY_RUNS_PER_TEST)
+    fields = ['RN_RUN_ID', 'RN_TEST_ID', 'RN_STATUS']
+    print("%d runs" % len(server.runs))
+    session = create_session(server)
+    run_factory = session.get_run_factory()
+    # Without the Command object the largest run ID is unknown (whole list)
+    for label, allow_command, create in \
+            (("iter_records (whole list)", False, None), \
+             ("iter_records (ID windows)", True, None), \
+             ("iter_records (prefetch)", True, lambda: create_session(server))):
+        server.allow_command = allow_command
+        server.reset_calls()
+        statuses = {}
+        start = time.time()
+        for record in run_factory.iter_records('', fields, create_session=create):
+            statuses[record.RN_STATUS] = statuses.get(record.RN_STATUS, 0) + 1
+        elapsed = time.time() - start
+        assert sum(statuses.values()) == len(server.runs)
+        print("%-30s %10.0f runs/s %8d largest OTA list" \
+              % (label, len(server.runs) / elapsed, server.largest_list))
+    server = SimulatedServer(RUN_HISTORY_TESTS, 1, 1, 0, PREFETCH_RUNS_PER_TEST, \
+                             latency=PREFETCH_LATENCY)
+    print("%d runs, %.2f ms per OTA call, %.2f ms of work per run" \
+          % (len(server.runs), PREFETCH_LATENCY * 1000, CONSUMER_WORK * 1000))
+    run_factory = create_session(server).get_run_factory()
+    for label, create in (("iter_records", None), \
+                          ("iter_records (prefetch)", lambda: create_session(server))):
+        start = time.time()
+        for page in run_factory.iter_pages('', fields, create_session=create):
+            time.sleep(CONSUMER_WORK * len(page))
+        elapsed = time.time() - start
+        print("%-30s %10.0f runs/s" % (label, len(server.runs) / elapsed))
+
+def main():
+    """Run benchmark"""
+    corpus = make_corpus()
+    print("%d fields (%d distinct)" % (len(corpus), len(set(corpus))))
+    expected = [strip_tags_unshared(html) for html in corpus]
+    for label, strip in (("new stripper per field", strip_tags_unshared), \
+                         ("reused stripper", TagStripper(cache_size=0).strip_tags), \
+                         ("reused stripper + LRU cache", TagStripper().strip_tags)):
+        start = time.time()
+        stripped = [strip(html) for html in corpus]
+        elapsed = time.time() - start
+        assert stripped == expected
+        print("%-30s %10.0f fields/s" % (label, len(corpus) / elapsed))
+    bench_export()
+    bench_incremental()
+    bench_bulk_export()
+    bench_upload()
+    bench_lookup_cache()
+    bench_paging()
+
+if __name__ == '__main__':
+    main()
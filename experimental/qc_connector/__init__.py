@@ -7,29 +7,120 @@ A simple QC Toolbox module
 Docstrings: http://www.python.org/dev/peps/pep-0257/
 """
 
+import os
+import csv
+import sys
+import time
+import sqlite3
 import logging
+from collections import OrderedDict
+from collections import namedtuple
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+from threading import Condition
+from threading import Lock
+from threading import Thread
+from threading import local
+from Queue import Empty
+from Queue import Queue
 from HTMLParser import HTMLParser
-from win32com.client import Dispatch
+from HTMLParser import HTMLParseError
+from tspec import sqlite_dumps
+from tspec import sqlite_loads
+try:
+    from win32com.client import Dispatch
+except ImportError:
+    # Not on Windows (QCConnector needs a quality_center stand-in, see qc_simulator)
+    Dispatch = None
+try:
+    from pythoncom import CoInitialize
+    from pythoncom import CoUninitialize
+except ImportError:
+    CoInitialize = CoUninitialize = None
 
 # Log Configuration
 FORMAT = "%(levelname)-4s %(message)s"
 logging.basicConfig(format=FORMAT, level=logging.INFO)
 
+# Number of stripped HTML fields kept by strip_tags
+STRIP_TAGS_CACHE_SIZE = 4096
+
+# Lookup cache (nodes, children counts and factory lists): entries and lifetime (seconds)
+LOOKUP_CACHE_SIZE = 1024
+LOOKUP_CACHE_TTL = 60
+
+# Factory list paging: records per page and pages fetched ahead
+PAGE_SIZE = 1000
+PREFETCH_PAGES = 2
+# Largest ID window (in page sizes), i.e. largest OTA list fetched at a time
+ID_WINDOW_GROWTH = 8
+# Factory -> (table, ID field), lists are fetched one ID window at a time
+FACTORY_ID_FIELDS = {'TestFactory': ('TEST', 'TS_TEST_ID'),
+                     'RunFactory': ('RUN', 'RN_RUN_ID')}
+MAX_ID_QUERY = "SELECT MAX(%s) AS MAX_ID FROM %s"
+
+# Export CSV layout and number of rows buffered between writes
+EXPORT_CSV_HEADER = ['', 'test_id', 'test_name', '', '', \
+                     'step_id', 'step_description', 'step_expected_result']
+EXPORT_CHUNK_SIZE = 1000
+
+# Concurrent export: number of sessions and subtree size kept in memory (bytes)
+DEFAULT_SESSIONS = 4
+EXPORT_SPOOL_SIZE = 2**20
+
+# Incremental export: test version stamp field and manifest commit interval (tests)
+TEST_MODIFIED_FIELD = "TS_VTS"
+MANIFEST_CHECKPOINT_SIZE = 500
+# Upload: number of tests per batch (batches never span folders)
+UPLOAD_BATCH_SIZE = 50
+# Upload: test attribute -> QC test field (user fields are project specific,
+# flags are written as 'Y'/'N', other attributes are not uploaded)
+UPLOAD_TEST_FIELDS = {'test_level': 'TS_USER_01',
+                      'test_area': 'TS_USER_02',
+                      'is_automated': 'TS_USER_03'}
+
+# Bulk export queries (OTA Command object), folders are matched on the
+# absolute path code of the subtree root
+BULK_FOLDER_QUERY = "SELECT AL_ABSOLUTE_PATH FROM ALL_LISTS WHERE AL_ITEM_ID = %d"
+BULK_TESTS_QUERY = """SELECT TS_SUBJECT, TS_TEST_ID, TS_NAME FROM TEST, ALL_LISTS
+WHERE TS_SUBJECT = AL_ITEM_ID AND AL_ABSOLUTE_PATH LIKE '%s%%'
+ORDER BY TS_SUBJECT, TS_TEST_ID"""
+BULK_STEPS_QUERY = """SELECT DS_TEST_ID, DS_STEP_NAME, DS_DESCRIPTION, DS_EXPECTED
+FROM DESSTEPS, TEST, ALL_LISTS
+WHERE DS_TEST_ID = TS_TEST_ID AND TS_SUBJECT = AL_ITEM_ID AND AL_ABSOLUTE_PATH LIKE '%s%%'
+ORDER BY DS_TEST_ID, DS_STEP_ORDER"""
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS tests (test_id INTEGER PRIMARY KEY, modified TEXT,
+                                  rows BLOB, run INTEGER NOT NULL);
+"""
+
 class QCConnector(object):
     """QCConnector Class"""
 
-    def __init__(self, url):
+    def __init__(self, url, quality_center=None, lookup_cache=None):
         """QCConnector Constructor
-        :param url quality center server URL"""
+        :param url quality center server URL
+        :param quality_center TDConnection object (defaults to a new
+        TDApiOle80.TDConnection, see qc_simulator for a stand-in)
+        :param lookup_cache QCLookupCache object (lookups are not cached by
+        default, cached nodes and lists are shared and may be up to ttl old)"""
         assert url, "QC Server URL is not defined"
+        assert quality_center or Dispatch, "win32com is not available"
         self.url = url
         self.username = None
         self.domain = None
         self.project = None
         self.tree_manager = None
         self.test_folder_factory = None
+        self.test_uploader = None
+        self.lookup_cache = lookup_cache if lookup_cache is not None else QCLookupCache(0)
         logging.info("Initializing connection to %s", url)
-        self.quality_center = Dispatch("TDApiOle80.TDConnection")
+        self.dispatched = quality_center is None
+        if self.dispatched:
+            quality_center = Dispatch("TDApiOle80.TDConnection")
+        self.quality_center = quality_center
         self.quality_center.InitConnection(url)
         logging.info("Connection is ready")
 
@@ -98,7 +189,7 @@ class QCConnector(object):
         self.domain = None
         logging.info("Resetting project")
         self.project = None
-        self.__init__(self.url)
+        self.__init__(self.url, None if self.dispatched else self.quality_center)
 
     def get_tree_manager(self):
         """Tree Manager"""
@@ -112,13 +203,22 @@ class QCConnector(object):
         self.test_folder_factory = self.quality_center.TestFolderFactory
         return self.test_folder_factory
 
+    def get_test_uploader(self):
+        """Test Uploader (keeps the folder nodes resolved by this session)"""
+        if self.test_uploader is None:
+            if not self.tree_manager:
+                self.get_tree_manager()
+            self.test_uploader = QCTestUploader(self)
+        return self.test_uploader
+
     def get_node_by_path(self, node_path):
         """Get Node By Path
         :param node_path quality center node path"""
         assert node_path, "Node path is not defined"
         if self.tree_manager:
             logging.info("Accessing node %s", node_path)
-            return self.tree_manager.NodeByPath(node_path)
+            return self.lookup_cache.get(('node', node_path), \
+                                         lambda: self.tree_manager.NodeByPath(node_path))
         else:
             logging.error("No tree manager defined.")
             logging.error("Call method QCConnector.get_tree_manager")
@@ -135,61 +235,1008 @@ class QCConnector(object):
     def get_children_count(self, node_path):
         """Get child count
         :param node_path parent node path"""
-        parent_node = self.get_node_by_path(node_path)
-        return parent_node.Count
+        return self.lookup_cache.get(('count', node_path), \
+                                     lambda: self.get_node_by_path(node_path).Count)
+
+    def invalidate_cache(self, node_path=None):
+        """Drop cached lookups
+        :param node_path drop the nodes and children counts of this subtree
+        only (default: drop everything)"""
+        if node_path is None:
+            self.lookup_cache.invalidate()
+        else:
+            self.lookup_cache.invalidate_path(node_path)
 
     def recursive_export(self, csv_file, node):
-        """Recursive Export
+        """Export a node and its subtree (see QCTestExporter)
         :param csv_file
         :param node"""
-        assert node, "Node is not defined"
-        logging.info("Exporting tests from node %s", node.Name)
-        csv_file.write('%s,%s\n' % (node.Name, strip_tags(node.Description)))
-        if node.Count <= 0:
-            # Get all tests
-            tests = node.FindTests('')
-            if tests:
-                for test in tests:
-                    design_step_factory = test.DesignStepFactory
-                    csv_file.write(',%s,%s\n' % (test.ID, test.Name))
-                    for design_step in design_step_factory.NewList(''):
-                        # Get Step Info
-                        step_name = strip_tags(design_step.StepName)
-                        step_description = strip_tags(design_step.StepDescription)
-                        step_expected_result = strip_tags(design_step.StepExpectedResult)
-                        # Write Step
-                        csv_file.write(',,,,%s,%s,%s\n' %(step_name,
-                                                          step_description,
-                                                          step_expected_result))
-                    csv_file.flush()
-        else:
-            for child in node.NewList():
-                if child:
-                    self.recursive_export(csv_file, child)
-                    csv_file.write('\n')
+        exporter = QCTestExporter(csv_file)
+        exporter.export_node(node)
+        exporter.flush()
 
-    def export_tests(self, node_path, csv_path="./tests.csv"):
+    def export_tests(self, node_path, csv_path="./tests.csv", bulk=False):
         """Export tests from CSV
         :param node_path quality center node path
-        :param csv_path"""
+        :param csv_path
+        :param bulk fetch the tests and design steps with a few SQL queries
+        (falls back to the per-object walk if they fail)"""
         # Open CSV file
         logging.debug("Opening file %s", csv_path)
-        csv_file = open(csv_path, 'w')
-        # Write CSV header
-        csv_file.write(',test_id,test_name,,,step_id,step_description,step_expected_result\n')
-        # Get QC node
-        self.get_tree_manager()
-        node = self.get_node_by_path(node_path)
-        # Export tests to CSV
-        logging.info("Exporting tests to %s", csv_path)
-        self.recursive_export(csv_file, node)
+        with open(csv_path, 'wb') as csv_file:
+            if bulk:
+                exporter = QCBulkExporter(csv_file, self.quality_center)
+            else:
+                exporter = QCTestExporter(csv_file)
+            # Write CSV header
+            exporter.write_header()
+            # Get QC node
+            self.get_tree_manager()
+            node = self.get_node_by_path(node_path)
+            # Export tests to CSV
+            logging.info("Exporting tests to %s", csv_path)
+            exporter.export_node(node)
+            exporter.flush()
+            logging.info("Exported %d tests (%d steps)", exporter.num_tests, exporter.num_steps)
         # Close CSV file
-        logging.debug("Closing file %s", csv_path)
-        csv_file.close()
+        logging.debug("Closed file %s", csv_path)
+
+    def split_tree(self, node, split_depth):
+        """Walk the top of the tree, yielding the CSV rows above split_depth
+        (as lists) and the subtrees at split_depth (as node paths) in
+        serial export order
+        :param node subject node
+        :param split_depth depth at which the tree is split"""
+        stack = [(node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node is None:
+                yield []
+            elif depth >= split_depth or node.Count <= 0:
+                yield node.Path
+            else:
+                yield [to_csv_field(node.Name), strip_tags(node.Description)]
+                children = [child for child in node.NewList() if child]
+                for child in reversed(children):
+                    stack.append((None, depth))
+                    stack.append((child, depth + 1))
+
+    def export_tests_concurrent(self, node_path, create_session, csv_path="./tests.csv", \
+                                sessions=DEFAULT_SESSIONS, split_depth=1):
+        """Export tests to CSV, exporting the subtrees at split_depth
+        concurrently (one QC session each). The CSV file is identical to the
+        one written by export_tests
+        :param node_path quality center node path
+        :param create_session function returning a new logged-in and
+        connected QCConnector (called once per session, in its own thread)
+        :param csv_path
+        :param sessions number of sessions
+        :param split_depth depth at which the tree is split (1 = children of
+        the exported node)"""
+        logging.debug("Opening file %s", csv_path)
+        with open(csv_path, 'wb') as csv_file:
+            exporter = QCTestExporter(csv_file)
+            exporter.write_header()
+            self.get_tree_manager()
+            segments = list(self.split_tree(self.get_node_by_path(node_path), split_depth))
+            subtrees = [segment for segment in segments if not isinstance(segment, list)]
+            logging.info("Exporting %d subtrees to %s (%d sessions)", \
+                         len(subtrees), csv_path, sessions)
+            with QCSessionPool(create_session, sessions) as pool:
+                results = pool.imap(export_subtree, subtrees)
+                for segment in segments:
+                    if isinstance(segment, list):
+                        exporter.write_row(segment)
+                        continue
+                    # Subtree CSV rows, in tree order
+                    exporter.flush()
+                    subtree_csv, num_tests, num_steps = results.next()
+                    copyfileobj(subtree_csv, csv_file)
+                    subtree_csv.close()
+                    exporter.num_tests += num_tests
+                    exporter.num_steps += num_steps
+            exporter.flush()
+            logging.info("Exported %d tests (%d steps)", exporter.num_tests, exporter.num_steps)
+        logging.debug("Closed file %s", csv_path)
+
+    def export_tests_incremental(self, node_path, manifest_path, csv_path="./tests.csv"):
+        """Export tests to CSV, fetching design steps only for the tests that
+        are new or changed since the last export (see QCExportManifest).
+        An interrupted export resumes from its last checkpoint
+        :param node_path quality center node path
+        :param manifest_path manifest database path
+        :param csv_path"""
+        manifest = QCExportManifest(manifest_path)
+        try:
+            if not manifest.begin(node_path):
+                return False
+            # The previous CSV file is only replaced once the export is complete
+            temp_path = csv_path + ".tmp"
+            try:
+                with open(temp_path, 'wb') as csv_file:
+                    exporter = QCIncrementalExporter(csv_file, manifest)
+                    exporter.write_header()
+                    self.get_tree_manager()
+                    logging.info("Exporting tests to %s", csv_path)
+                    exporter.export_node(self.get_node_by_path(node_path))
+                    exporter.flush()
+            except:
+                # Drop the partial CSV file (the manifest keeps the checkpoints)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+            os.rename(temp_path, csv_path)
+            manifest.finish()
+        finally:
+            manifest.close()
+        logging.info("Exported %d tests (%d fetched, %d unchanged)", exporter.num_tests, \
+                     exporter.num_fetched, exporter.num_unchanged)
+        return True
+
+    def iter_upload_batches(self, test_spec, node_path, batch_size):
+        """Generate (folder path, tests) batches of consecutive tests in the same
+        folder, creating each folder (in this session) before its first batch
+        :param test_spec TestSpec object
+        :param node_path folder of the tests without a test_subject
+        :param batch_size maximum number of tests per batch"""
+        uploader = self.get_test_uploader()
+        folder_path = None
+        batch = []
+        for test in test_spec.iter_tests():
+            test_folder_path = getattr(test, 'test_subject', None) or node_path
+            if batch and (test_folder_path != folder_path or len(batch) >= batch_size):
+                yield folder_path, batch
+                batch = []
+            if test_folder_path != folder_path:
+                folder_path = test_folder_path
+                uploader.get_folder(folder_path)
+            batch.append(test)
+        if batch:
+            yield folder_path, batch
+
+    def upload_tspec(self, test_spec, node_path, create_session=None, \
+                     sessions=DEFAULT_SESSIONS, batch_size=UPLOAD_BATCH_SIZE):
+        """Upload a TestSpec: folders, tests and design steps are created in
+        batches of tests of the same folder, over a QCSessionPool if
+        create_session is given (folders are always created by this session)
+        :param test_spec TestSpec object
+        :param node_path folder of the tests without a test_subject (QCTest)
+        :param create_session function returning a new logged-in and
+        connected QCConnector (see export_tests_concurrent)
+        :param sessions number of sessions
+        :param batch_size maximum number of tests per batch"""
+        start = time.time()
+        num_tests = 0
+        num_steps = 0
+        batches = self.iter_upload_batches(test_spec, node_path, batch_size)
+        if create_session is None:
+            results = (upload_batch(self, batch) for batch in batches)
+            for batch_tests, batch_steps in results:
+                num_tests += batch_tests
+                num_steps += batch_steps
+        else:
+            with QCSessionPool(create_session, sessions) as pool:
+                for batch_tests, batch_steps in pool.imap(upload_batch, batches):
+                    num_tests += batch_tests
+                    num_steps += batch_steps
+        elapsed = max(time.time() - start, 1e-6)
+        logging.info("Uploaded %d tests (%d steps, %d new folders) in %.1f s (%.0f tests/s)", \
+                     num_tests, num_steps, self.get_test_uploader().num_folders, elapsed, \
+                     num_tests / elapsed)
+        # Cached children counts and test lists are stale
+        self.invalidate_cache()
+        return True
+
+
+def upload_batch(session, batch):
+    """Upload a batch of tests (QCSessionPool task)
+    :param session QCConnector session
+    :param batch (folder path, tests)
+    :return (number of tests, number of steps)"""
+    folder_path, tests = batch
+    uploader = session.get_test_uploader()
+    folder = uploader.get_folder(folder_path)
+    num_steps = 0
+    for test in tests:
+        num_steps += uploader.upload_test(test, folder)
+    return len(tests), num_steps
+
+def export_subtree(session, node_path):
+    """Export a subtree into a temporary file (QCSessionPool task)
+    :param session QCConnector session
+    :param node_path subtree node path
+    :return (rewound CSV file, number of tests, number of steps)"""
+    if not session.tree_manager:
+        session.get_tree_manager()
+    subtree_csv = SpooledTemporaryFile(EXPORT_SPOOL_SIZE)
+    exporter = QCTestExporter(subtree_csv)
+    exporter.export_node(session.get_node_by_path(node_path))
+    exporter.flush()
+    subtree_csv.seek(0)
+    return subtree_csv, exporter.num_tests, exporter.num_steps
+
+class QCSessionPool(object):
+    """QCSessionPool Class
+    Pool of QC sessions, each one owned by a worker thread (COM objects must
+    stay in the thread that created them)"""
+
+    def __init__(self, create_session, size=DEFAULT_SESSIONS):
+        """QCSessionPool Constructor
+        :param create_session function returning a new logged-in and
+        connected QCConnector
+        :param size number of sessions"""
+        assert size > 0, "Number of sessions must be positive"
+        self.create_session = create_session
+        self.size = size
+        self.tasks = Queue()
+        self.results = {}
+        self.done = Condition()
+        self.workers = [Thread(target=self.run_worker) for _ in range(size)]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def run_worker(self):
+        """Worker thread: open a session and run tasks until told to stop"""
+        if CoInitialize:
+            CoInitialize()
+        try:
+            session = self.create_session()
+        except Exception:
+            logging.error("Unable to open QC session: %s", sys.exc_info()[1])
+            session = None
+            session_error = sys.exc_info()
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    break
+                task_id, function, args = task
+                if session is None:
+                    result = (False, session_error)
+                else:
+                    try:
+                        result = (True, function(session, *args))
+                    except Exception:
+                        result = (False, sys.exc_info())
+                with self.done:
+                    self.results[task_id] = result
+                    self.done.notify_all()
+        finally:
+            if session is not None:
+                session.disconnect_and_logout()
+            if CoUninitialize:
+                CoUninitialize()
+
+    def get_result(self, task_id):
+        """Wait for a task result (re-raises task errors)
+        :param task_id task number"""
+        with self.done:
+            while task_id not in self.results:
+                self.done.wait()
+            success, result = self.results.pop(task_id)
+        if not success:
+            raise result[0], result[1], result[2]
+        return result
+
+    def imap(self, function, iterable):
+        """Run function(session, item) for each item, generating the results
+        in order (at most 2 * size tasks are queued ahead)
+        :param function task function
+        :param iterable task arguments"""
+        iterable = iter(iterable)
+        num_tasks = 0
+        next_task = 0
+        for item in iterable:
+            self.tasks.put((num_tasks, function, (item,)))
+            num_tasks += 1
+            if num_tasks - next_task >= 2 * self.size:
+                yield self.get_result(next_task)
+                next_task += 1
+        while next_task < num_tasks:
+            yield self.get_result(next_task)
+            next_task += 1
+
+    def close(self):
+        """Close every session"""
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def to_csv_field(value):
+    """Encode OTA values for the csv module (unicode is written as UTF-8)
+    :param value OTA property value"""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+class QCTestExporter(object):
+    """QCTestExporter Class
+    Export engine: walks the subject tree with an explicit stack (no recursion
+    limit on deep trees) and writes properly quoted CSV rows in chunks"""
+
+    def __init__(self, csv_file, chunk_size=EXPORT_CHUNK_SIZE):
+        """QCTestExporter Constructor
+        :param csv_file open CSV file
+        :param chunk_size number of rows buffered between writes"""
+        self.csv_file = csv_file
+        self.writer = csv.writer(csv_file, lineterminator='\n')
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.num_tests = 0
+        self.num_steps = 0
+
+    def write_row(self, row):
+        """Buffer a CSV row (written once chunk_size rows are buffered)
+        :param row list of fields"""
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows"""
+        self.writer.writerows(self.rows)
+        del self.rows[:]
+        self.csv_file.flush()
+
+    def write_header(self):
+        """Write CSV header"""
+        self.write_row(EXPORT_CSV_HEADER)
+
+    def get_test_rows(self, test):
+        """Get the CSV rows of a test and its design steps
+        :param test OTA test"""
+        rows = [['', test.ID, to_csv_field(test.Name)]]
+        for design_step in test.DesignStepFactory.NewList(''):
+            rows.append(['', '', '', '', \
+                         strip_tags(design_step.StepName), \
+                         strip_tags(design_step.StepDescription), \
+                         strip_tags(design_step.StepExpectedResult)])
+        return rows
+
+    def write_test_rows(self, rows):
+        """Write the CSV rows of a test
+        :param rows test row followed by its design step rows"""
+        for row in rows:
+            self.write_row(row)
+        self.num_tests += 1
+        self.num_steps += len(rows) - 1
+
+    def export_test(self, test):
+        """Export a test and its design steps
+        :param test OTA test"""
+        self.write_test_rows(self.get_test_rows(test))
+
+    def export_leaf(self, node):
+        """Export the tests of a node without children
+        :param node OTA subject node"""
+        tests = node.FindTests('')
+        if tests:
+            for test in tests:
+                self.export_test(test)
+
+    def export_node(self, node):
+        """Export a node and its subtree (depth-first, children in list order,
+        one blank row after each child)
+        :param node OTA subject node"""
+        assert node, "Node is not defined"
+        # None marks the end of a child subtree
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                self.write_row([])
+                continue
+            logging.info("Exporting tests from node %s", node.Name)
+            self.write_row([to_csv_field(node.Name), strip_tags(node.Description)])
+            if node.Count <= 0:
+                self.export_leaf(node)
+            else:
+                children = [child for child in node.NewList() if child]
+                for child in reversed(children):
+                    stack.append(None)
+                    stack.append(child)
+
+class QCIncrementalExporter(QCTestExporter):
+    """QCIncrementalExporter Class
+    Export engine that reuses the manifest rows of unchanged tests"""
+
+    def __init__(self, csv_file, manifest, chunk_size=EXPORT_CHUNK_SIZE):
+        """QCIncrementalExporter Constructor
+        :param csv_file open CSV file
+        :param manifest QCExportManifest object
+        :param chunk_size number of rows buffered between writes"""
+        QCTestExporter.__init__(self, csv_file, chunk_size)
+        self.manifest = manifest
+        self.num_fetched = 0
+        self.num_unchanged = 0
+
+    def export_test(self, test):
+        """Export a test (design steps are only fetched if the test changed)
+        :param test OTA test"""
+        test_id = test.ID
+        modified = test.Field(TEST_MODIFIED_FIELD)
+        entry = self.manifest.get_test(test_id)
+        if entry is not None and entry[0] == modified:
+            rows = entry[1]
+            self.manifest.touch_test(test_id)
+            self.num_unchanged += 1
+        else:
+            rows = self.get_test_rows(test)
+            self.manifest.put_test(test_id, modified, rows)
+            self.num_fetched += 1
+        self.write_test_rows(rows)
+
+class QCBulkExporter(QCTestExporter):
+    """QCBulkExporter Class
+    Export engine that fetches the tests and design steps of the whole
+    subtree with a few SQL queries (OTA Command object) and groups them by
+    folder, instead of listing the design steps of every test. Falls back to
+    the per-object walk if the queries fail (e.g. Command is not allowed) or
+    if some of the fetched tests were not found in the subtree (the CSV rows
+    of the subtree are then rewritten, the CSV file must be seekable)"""
+
+    def __init__(self, csv_file, quality_center, chunk_size=EXPORT_CHUNK_SIZE):
+        """QCBulkExporter Constructor
+        :param csv_file open CSV file
+        :param quality_center TDConnection object
+        :param chunk_size number of rows buffered between writes"""
+        QCTestExporter.__init__(self, csv_file, chunk_size)
+        self.quality_center = quality_center
+        self.tests = None
+        self.num_fetched = 0
+
+    def load_tests(self, node):
+        """Fetch the CSV rows of the tests of a subtree, grouped by folder ID
+        (all of them are kept in memory until they are exported)
+        :param node OTA subject node
+        :return True if the tests were fetched"""
+        self.tests = None
+        self.num_fetched = 0
+        try:
+            paths = list(iter_query(self.quality_center, \
+                                    BULK_FOLDER_QUERY % int(node.NodeID), ['AL_ABSOLUTE_PATH']))
+            if len(paths) != 1:
+                logging.error("Failed to find the absolute path of node %s", node.Name)
+                return False
+            folder_code = paths[0][0].replace("'", "''")
+            # Record set IDs may be strings or longs (COM), keys are ints
+            steps = {}
+            for test_id, name, description, expected in \
+                    iter_query(self.quality_center, BULK_STEPS_QUERY % folder_code, \
+                               ['DS_TEST_ID', 'DS_STEP_NAME', 'DS_DESCRIPTION', 'DS_EXPECTED']):
+                steps.setdefault(int(test_id), []).append( \
+                    ['', '', '', '', strip_tags(name or ''), \
+                     strip_tags(description or ''), strip_tags(expected or '')])
+            tests = {}
+            for folder_id, test_id, name in \
+                    iter_query(self.quality_center, BULK_TESTS_QUERY % folder_code, \
+                               ['TS_SUBJECT', 'TS_TEST_ID', 'TS_NAME']):
+                rows = [['', int(test_id), to_csv_field(name)]]
+                rows.extend(steps.pop(int(test_id), []))
+                tests.setdefault(int(folder_id), []).append(rows)
+                self.num_fetched += 1
+        except Exception as err:
+            logging.error("Failed to fetch the tests of node %s (%s)", node.Name, err)
+            return False
+        self.tests = tests
+        return True
+
+    def export_leaf(self, node):
+        """Export the tests of a node without children
+        :param node OTA subject node"""
+        if self.tests is None:
+            QCTestExporter.export_leaf(self, node)
+            return
+        for rows in self.tests.pop(int(node.NodeID), []):
+            self.write_test_rows(rows)
+
+    def export_node(self, node):
+        """Export a node and its subtree (see QCTestExporter.export_node)
+        :param node OTA subject node"""
+        assert node, "Node is not defined"
+        if not self.load_tests(node):
+            logging.info("Exporting tests one at a time")
+            QCTestExporter.export_node(self, node)
+            return
+        self.flush()
+        start = self.csv_file.tell()
+        num_tests = self.num_tests
+        num_steps = self.num_steps
+        QCTestExporter.export_node(self, node)
+        self.tests = None
+        if self.num_tests - num_tests != self.num_fetched:
+            logging.error("Exported %d of the %d tests fetched for node %s", \
+                          self.num_tests - num_tests, self.num_fetched, node.Name)
+            logging.info("Exporting tests one at a time")
+            del self.rows[:]
+            self.csv_file.seek(start)
+            self.csv_file.truncate()
+            self.num_tests = num_tests
+            self.num_steps = num_steps
+            QCTestExporter.export_node(self, node)
+
+class QCExportManifest(object):
+    """QCExportManifest Class
+    SQLite manifest of exported tests: ID, last-modified stamp and CSV rows.
+    Each export is a numbered run; tests are committed every checkpoint_size
+    tests, so an interrupted run resumes without fetching them again, and
+    tests that were not seen by a complete run are removed"""
+
+    def __init__(self, manifest_path, checkpoint_size=MANIFEST_CHECKPOINT_SIZE):
+        """QCExportManifest Constructor
+        :param manifest_path manifest database path
+        :param checkpoint_size number of tests between commits"""
+        self.manifest_path = manifest_path
+        self.checkpoint_size = checkpoint_size
+        self.connection = sqlite3.connect(manifest_path)
+        self.connection.text_factory = str
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(MANIFEST_SCHEMA)
+        self.run = None
+        self.touched = []
+        self.pending = 0
 
+    def get_meta(self, key):
+        """Get manifest property
+        :param key property name"""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return sqlite_loads(row[0]) if row else None
 
-class QCTestFactory(object):
+    def set_meta(self, key, value):
+        """Set manifest property
+        :param key property name
+        :param value property value"""
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", \
+                                (key, sqlite_dumps(value)))
+
+    def begin(self, node_path):
+        """Start (or resume) an export run
+        :param node_path quality center node path"""
+        stored_path = self.get_meta('node_path')
+        if stored_path is not None and stored_path != node_path:
+            logging.error("Manifest %s belongs to node %s", self.manifest_path, stored_path)
+            return False
+        self.run = self.get_meta('run') or 0
+        if self.get_meta('complete') is False:
+            logging.info("Resuming export run %d from its last checkpoint", self.run)
+        else:
+            self.run += 1
+        self.set_meta('node_path', node_path)
+        self.set_meta('run', self.run)
+        self.set_meta('complete', False)
+        self.connection.commit()
+        return True
+
+    def get_test(self, test_id):
+        """Get the stored (modified, rows) of a test (None if there is no such test)
+        :param test_id test ID"""
+        row = self.connection.execute("SELECT modified, rows FROM tests WHERE test_id = ?", \
+                                      (test_id,)).fetchone()
+        return (row[0], sqlite_loads(row[1])) if row else None
+
+    def put_test(self, test_id, modified, rows):
+        """Store a fetched test
+        :param test_id test ID
+        :param modified last-modified stamp
+        :param rows CSV rows"""
+        self.connection.execute("INSERT OR REPLACE INTO tests (test_id, modified, rows, run) " \
+                                "VALUES (?, ?, ?, ?)", \
+                                (test_id, str(modified), sqlite_dumps(rows), self.run))
+        self.add_pending()
+
+    def touch_test(self, test_id):
+        """Mark an unchanged test as seen by this run
+        :param test_id test ID"""
+        self.touched.append((self.run, test_id))
+        self.add_pending()
+
+    def add_pending(self):
+        """Count a pending change (checkpoint every checkpoint_size changes)"""
+        self.pending += 1
+        if self.pending >= self.checkpoint_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Commit pending changes"""
+        self.connection.executemany("UPDATE tests SET run = ? WHERE test_id = ?", self.touched)
+        del self.touched[:]
+        self.connection.commit()
+        self.pending = 0
+
+    def finish(self):
+        """Complete the export run (removes the tests it did not see)"""
+        self.checkpoint()
+        self.connection.execute("DELETE FROM tests WHERE run != ?", (self.run,))
+        self.set_meta('complete', True)
+        self.connection.commit()
+
+    def close(self):
+        """Close the manifest (pending changes are kept as a checkpoint)"""
+        if self.connection is not None:
+            self.checkpoint()
+            self.connection.close()
+            self.connection = None
+
+class QCTestUploader(object):
+    """QCTestUploader Class
+    Creates folders, tests and design steps through one session, keeping
+    the folder nodes it has already resolved (or created)"""
+
+    def __init__(self, qcconnector, test_fields=UPLOAD_TEST_FIELDS):
+        """QCTestUploader Constructor
+        :param qcconnector QCConnector session (with a tree manager)
+        :param test_fields test attribute -> QC test field"""
+        self.qcconnector = qcconnector
+        self.test_fields = sorted(test_fields.items())
+        self.folders = {}
+        self.num_folders = 0
+
+    def get_folder(self, folder_path):
+        """Get a folder node, creating the missing folders of its path
+        :param folder_path folder path, e.g. 'Subject\\Calculators'"""
+        folder = self.folders.get(folder_path)
+        if folder is not None:
+            return folder
+        # Closest existing ancestor
+        path = folder_path
+        missing = []
+        while path not in self.folders:
+            try:
+                self.folders[path] = self.qcconnector.tree_manager.NodeByPath(path)
+            except Exception:
+                if "\\" not in path:
+                    logging.error("Unable to find root folder %s", path)
+                    raise
+                path, name = path.rsplit("\\", 1)
+                missing.append(name)
+        for name in reversed(missing):
+            logging.info("Creating folder %s\\%s", path, name)
+            folder = self.folders[path].AddNode(name)
+            folder.Post()
+            self.qcconnector.invalidate_cache(path)
+            path = "%s\\%s" % (path, name)
+            self.folders[path] = folder
+            self.num_folders += 1
+        return self.folders[folder_path]
+
+    def upload_test(self, test, folder):
+        """Create a test and its design steps (empty fields are not sent).
+        The test attributes of test_fields are written to their QC fields
+        (the test_subject of a QCTest is its folder)
+        :param test Test object
+        :param folder folder node
+        :return number of design steps"""
+        qc_test = folder.TestFactory.AddItem(None)
+        qc_test.Name = test.get_id()
+        for attrib, field in self.test_fields:
+            value = getattr(test, attrib, None)
+            if isinstance(value, bool):
+                value = 'Y' if value else 'N'
+            if value is not None and value != '':
+                qc_test.SetField(field, value)
+        qc_test.Post()
+        test_steps = test.get_test_steps()
+        if test_steps:
+            design_step_factory = qc_test.DesignStepFactory
+            for step in test_steps:
+                design_step = design_step_factory.AddItem(None)
+                design_step.StepName = str(step.get_id())
+                if step.get_description():
+                    design_step.StepDescription = step.get_description()
+                if step.get_expected_result():
+                    design_step.StepExpectedResult = step.get_expected_result()
+                design_step.Post()
+        return len(test_steps)
+
+class QCLookupCache(object):
+    """QCLookupCache Class
+    LRU cache of QC lookups keyed on (kind, node path or filter text), e.g.
+    ('node', 'Subject\\Calculators') or ('tests', '[Filter]{TS_NAME:Casio}').
+    Entries expire ttl seconds after they were loaded"""
+
+    def __init__(self, max_size=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL):
+        """QCLookupCache Constructor
+        :param max_size number of entries to keep (0 disables the cache)
+        :param ttl entry lifetime (seconds)"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, load):
+        """Get a cached value (load() is called on a miss or an expired entry)
+        :param key cache key
+        :param load function returning the value"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] > time.time():
+                # Most recently used entries go last
+                self.entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = load()
+        if self.max_size > 0:
+            with self.lock:
+                self.entries[key] = (time.time() + self.ttl, value)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, key=None):
+        """Drop a cached lookup
+        :param key cache key (default: drop everything)"""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def invalidate_path(self, node_path):
+        """Drop the cached nodes and children counts of a subtree
+        :param node_path subtree node path"""
+        prefix = node_path + "\\"
+        with self.lock:
+            for key in self.entries.keys():
+                if key[0] in ('node', 'count') and \
+                   (key[1] == node_path or key[1].startswith(prefix)):
+                    del self.entries[key]
+
+    def clear(self):
+        """Clear the cache and the hit/miss counters"""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+def iter_factory_pages(factory, filt, fields, page_size=PAGE_SIZE, id_field=None, max_id=None):
+    """Generate the records of a factory list a page at a time
+    :param factory OTA factory
+    :param filt TDFilter.Text argument
+    :param fields field names, e.g. ['RN_RUN_ID', 'RN_STATUS']
+    :param page_size number of records per page
+    :param id_field ID field of the factory, e.g. 'RN_RUN_ID' (with max_id:
+    the list is fetched one ID window at a time, see iter_id_windows,
+    otherwise NewList fetches the whole list and memory is bounded by the
+    OTA list)
+    :param max_id largest ID (records added later are left out)
+    :return lists of namedtuples (one attribute per field)"""
+    record_type = namedtuple('QCRecord', fields)
+    if id_field is None or max_id is None:
+        new_list = factory.NewList(filt)
+        lists = [(new_list, new_list.Count)]
+    else:
+        lists = iter_id_windows(factory, filt, id_field, max_id, page_size)
+    page = []
+    for new_list, count in lists:
+        for idx in xrange(1, count + 1):
+            item = new_list.Item(idx)
+            page.append(record_type._make([item.Field(field) for field in fields]))
+            if len(page) >= page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+def iter_id_windows(factory, filt, id_field, max_id, window_size=PAGE_SIZE):
+    """Generate the lists of consecutive ID windows (low < ID <= high, in ID
+    order), so that only one window is fetched from the server at a time.
+    Each window is sized from the density of the previous one (to hold about
+    window_size records), between window_size and ID_WINDOW_GROWTH *
+    window_size IDs, so a list never holds more than ID_WINDOW_GROWTH *
+    window_size records
+    :param factory OTA factory
+    :param filt TDFilter.Text argument
+    :param id_field ID field of the factory
+    :param max_id largest ID
+    :param window_size number of IDs per window (at least)
+    :return (OTA list, number of records)"""
+    tdfilter = factory.Filter
+    low = 0
+    window = window_size
+    while low < max_id:
+        high = min(low + window, max_id)
+        tdfilter.Text = filt
+        tdfilter.SetFilter(id_field, "> %d And <= %d" % (low, high))
+        new_list = factory.NewList(tdfilter.Text)
+        count = new_list.Count
+        yield new_list, count
+        if count:
+            window = (high - low) * window_size // count
+        else:
+            window = window_size * ID_WINDOW_GROWTH
+        window = min(max(window, window_size), window_size * ID_WINDOW_GROWTH)
+        low = high
+
+def get_max_id(quality_center, factory_name):
+    """Get the largest ID of a factory (through the OTA Command object)
+    :param quality_center TDConnection object
+    :param factory_name TDConnection factory property, e.g. 'RunFactory'
+    :return largest ID (0 if there are no records, None if it is unknown)"""
+    if factory_name not in FACTORY_ID_FIELDS:
+        return None
+    table_name, id_field = FACTORY_ID_FIELDS[factory_name]
+    try:
+        rows = list(iter_query(quality_center, MAX_ID_QUERY % (id_field, table_name), ['MAX_ID']))
+    except Exception as err:
+        logging.warning("Unable to get the largest %s (%s), fetching whole lists", id_field, err)
+        return None
+    return int(rows[0][0] or 0) if rows else 0
+
+def iter_list_pages(quality_center, factory_name, filt, fields, page_size=PAGE_SIZE, \
+                    factory=None):
+    """Generate the records of a factory list a page at a time, one ID window
+    at a time if the largest ID is known (see iter_factory_pages)
+    :param quality_center TDConnection object
+    :param factory_name TDConnection factory property, e.g. 'RunFactory'
+    :param filt TDFilter.Text argument
+    :param fields field names
+    :param page_size number of records per page
+    :param factory OTA factory (defaults to the factory_name property)"""
+    if factory is None:
+        factory = getattr(quality_center, factory_name)
+    id_field = FACTORY_ID_FIELDS.get(factory_name, (None, None))[1]
+    max_id = None
+    # Filters on the ID field itself are left as they are
+    if id_field is not None and id_field not in filt:
+        max_id = get_max_id(quality_center, factory_name)
+    return iter_factory_pages(factory, filt, fields, page_size, id_field, max_id)
+
+def iter_query(quality_center, query, columns):
+    """Run a SQL query through the OTA Command object
+    :param quality_center TDConnection object
+    :param query SQL query
+    :param columns names of the columns to read
+    :return tuples of column values (one per record)"""
+    command = quality_center.Command
+    command.CommandText = query
+    recordset = command.Execute()
+    count = recordset.RecordCount
+    if count > 0:
+        recordset.First()
+    for idx in xrange(count):
+        if idx:
+            recordset.Next()
+        yield tuple([recordset.FieldValue(column) for column in columns])
+
+class QCPagePrefetcher(object):
+    """QCPagePrefetcher Class
+    Fetches the pages of a factory list in a background thread, at most
+    prefetch_pages pages ahead of the consumer. The thread opens its own
+    session (COM objects must stay in the thread that created them)"""
+
+    def __init__(self, create_session, factory_name, filt, fields, \
+                 page_size=PAGE_SIZE, prefetch_pages=PREFETCH_PAGES):
+        """QCPagePrefetcher Constructor
+        :param create_session function returning a new logged-in and
+        connected QCConnector
+        :param factory_name TDConnection factory property, e.g. 'RunFactory'
+        :param filt TDFilter.Text argument
+        :param fields field names
+        :param page_size number of records per page
+        :param prefetch_pages number of pages fetched ahead"""
+        self.create_session = create_session
+        self.factory_name = factory_name
+        self.filt = filt
+        self.fields = fields
+        self.page_size = page_size
+        self.pages = Queue(maxsize=prefetch_pages)
+        self.stopped = False
+        self.worker = Thread(target=self.run_worker)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def run_worker(self):
+        """Worker thread: fetch pages until the list ends or the consumer stops"""
+        if CoInitialize:
+            CoInitialize()
+        session = None
+        try:
+            session = self.create_session()
+            for page in iter_list_pages(session.quality_center, self.factory_name, \
+                                        self.filt, self.fields, self.page_size):
+                if self.stopped:
+                    return
+                self.pages.put((True, page))
+            self.pages.put((True, None))
+        except Exception:
+            logging.error("Unable to fetch %s list: %s", self.factory_name, sys.exc_info()[1])
+            self.pages.put((False, sys.exc_info()))
+        finally:
+            if session is not None:
+                session.disconnect_and_logout()
+            if CoUninitialize:
+                CoUninitialize()
+
+    def iter_pages(self):
+        """Generate the fetched pages (re-raises fetch errors)"""
+        try:
+            while True:
+                success, page = self.pages.get()
+                if not success:
+                    raise page[0], page[1], page[2]
+                if page is None:
+                    break
+                yield page
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the worker thread"""
+        self.stopped = True
+        while self.worker.is_alive():
+            # Unblock the worker if the queue is full
+            try:
+                self.pages.get(timeout=0.1)
+            except Empty:
+                pass
+        self.worker.join()
+
+class QCFactory(object):
+    """QCFactory Class
+    Paging iterators shared by the factory wrappers"""
+    FACTORY_NAME = None
+    NAME_FIELD = None
+
+    def get_factory(self):
+        """Get the OTA factory"""
+        raise NotImplementedError
+
+    def iter_pages(self, filt, fields, page_size=PAGE_SIZE, create_session=None, \
+                   prefetch_pages=PREFETCH_PAGES):
+        """Generate the records of a list (uncached) a page at a time
+        :param filt TDFilter.Text argument
+        :param fields field names
+        :param page_size number of records per page
+        :param create_session function returning a new logged-in and
+        connected QCConnector: if given, the next pages are fetched in the
+        background (see QCPagePrefetcher)
+        :param prefetch_pages number of pages fetched ahead"""
+        if create_session is None:
+            return iter_list_pages(self.qcconnector.quality_center, self.FACTORY_NAME, \
+                                   filt, fields, page_size, self.get_factory())
+        return QCPagePrefetcher(create_session, self.FACTORY_NAME, filt, fields, \
+                                page_size, prefetch_pages).iter_pages()
+
+    def iter_records(self, filt, fields, page_size=PAGE_SIZE, create_session=None, \
+                     prefetch_pages=PREFETCH_PAGES):
+        """Generate the records of a list (constant memory, see iter_pages)
+        :param filt TDFilter.Text argument
+        :param fields field names
+        :param page_size number of records per page
+        :param create_session function returning a new logged-in and
+        connected QCConnector (background prefetch)
+        :param prefetch_pages number of pages fetched ahead"""
+        for page in self.iter_pages(filt, fields, page_size, create_session, prefetch_pages):
+            for record in page:
+                yield record
+
+    def print_list(self, filt):
+        """Print List
+        :param filt TDFilter.Text argument"""
+        for record in self.iter_records(filt, [self.NAME_FIELD]):
+            print(record[0])
+
+class QCTestFactory(QCFactory):
     """QCTestFactory Class"""
+    FACTORY_NAME = "TestFactory"
+    NAME_FIELD = "TS_NAME"
 
     def __init__(self, qcconnector):
         """QCTestFactory Constructor"""
@@ -197,20 +1244,20 @@ class QCTestFactory(object):
         self.qcconnector = qcconnector
         self.test_factory = qcconnector.quality_center.TestFactory
 
-    def new_list(self, filt):
-        """New List
-        :param filt TDFilter.Text argument"""
-        return self.test_factory.NewList(filt)
+    def get_factory(self):
+        """Get the OTA factory"""
+        return self.test_factory
 
-    def print_list(self, filt):
-        """Print List
+    def new_list(self, filt):
+        """New List (cached, see QCLookupCache)
         :param filt TDFilter.Text argument"""
-        new_list = self.new_list(filt)
-        for idx in range(1, len(new_list)+1):
-            print(new_list.Item(idx).Name)
+        return self.qcconnector.lookup_cache.get(('tests', filt), \
+                                                 lambda: self.test_factory.NewList(filt))
 
-class QCRunFactory(object):
+class QCRunFactory(QCFactory):
     """QCRunFactory Class"""
+    FACTORY_NAME = "RunFactory"
+    NAME_FIELD = "RN_RUN_NAME"
 
     def __init__(self, qcconnector):
         """QCRunFactory Constructor"""
@@ -218,17 +1265,15 @@ class QCRunFactory(object):
         self.qcconnector = qcconnector
         self.run_factory = qcconnector.quality_center.RunFactory
 
-    def new_list(self, filt):
-        """New List
-        :param filt TDFilter.Text argument"""
-        return self.run_factory.NewList(filt)
+    def get_factory(self):
+        """Get the OTA factory"""
+        return self.run_factory
 
-    def print_list(self, filt):
-        """Print List
+    def new_list(self, filt):
+        """New List (cached, see QCLookupCache)
         :param filt TDFilter.Text argument"""
-        new_list = self.new_list(filt)
-        for idx in range(1, len(new_list)+1):
-            print(new_list.Item(idx).Name)
+        return self.qcconnector.lookup_cache.get(('runs', filt), \
+                                                 lambda: self.run_factory.NewList(filt))
 
 class QCFactoryFilter(object):
     """QCFactoryFilter Class
@@ -262,6 +1307,25 @@ class MLStripper(HTMLParser):
         HTMLParser.__init__(self)
         self.fed = []
 
+    def reset(self):
+        """Reset the stripper (so that it can be fed a new document)"""
+        HTMLParser.reset(self)
+        self.fed = []
+
+    def strip(self, html):
+        """Strip HTML Tags (reusing this stripper)
+        Text after an unclosed tag is kept as it is and so is the rest of
+        the content after a parse error
+        :param html HTML content"""
+        self.reset()
+        try:
+            self.feed(self.unescape(html))
+            self.close()
+        except HTMLParseError as err:
+            logging.warning("Failed to strip HTML tags: %s", err)
+            self.fed.append(self.rawdata)
+        return self.get_data()
+
     def handle_data(self, data):
         """Handle data
         :param data"""
@@ -271,11 +1335,64 @@ class MLStripper(HTMLParser):
         """Get Data"""
         return ''.join(self.fed).encode('utf-8').strip()
 
+class TagStripper(object):
+    """TagStripper Class
+    Reusable HTML strippers (one per thread) with an LRU cache keyed on
+    the raw HTML (QC step names, descriptions and results repeat a lot)"""
+
+    def __init__(self, cache_size=STRIP_TAGS_CACHE_SIZE):
+        """TagStripper Constructor
+        :param cache_size number of stripped fields to keep (0 disables the cache)"""
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.local = local()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stripper(self):
+        """Get the HTML stripper of the current thread"""
+        try:
+            return self.local.stripper
+        except AttributeError:
+            self.local.stripper = MLStripper()
+            return self.local.stripper
+
+    def strip_tags(self, html):
+        """Strip HTML Tags
+        :param html HTML content"""
+        with self.lock:
+            try:
+                data = self.cache.pop(html)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                # Most recently used entries go last
+                self.cache[html] = data
+                return data
+        # Parse outside the lock (other threads use their own strippers)
+        data = self.get_stripper().strip(html)
+        if self.cache_size <= 0:
+            return data
+        with self.lock:
+            # Another thread may have stored it in the meantime
+            self.cache.pop(html, None)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+            self.cache[html] = data
+        return data
+
+    def clear(self):
+        """Clear the cache and the hit/miss counters"""
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+DEFAULT_TAG_STRIPPER = TagStripper()
+
 def strip_tags(html):
     """Strip HTML Tags
     :param html HTML content"""
-    parser = HTMLParser()
-    stripper = MLStripper()
-    html = parser.unescape(html)
-    stripper.feed(html)
-    return stripper.get_data()
+    return DEFAULT_TAG_STRIPPER.strip_tags(html)
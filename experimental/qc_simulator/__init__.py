@@ -0,0 +1,838 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""
+Module QC_SIMULATOR
+In-process stand-in for the QC OTA objects used by qc_connector
+Docstrings: http://www.python.org/dev/peps/pep-0257/
+"""
+
+import re
+import time
+import sqlite3
+from bisect import bisect_right
+from collections import Counter
+from threading import Lock
+from threading import RLock
+
+# Version stamps start at this date (seconds since the epoch) and tick once per change
+VERSION_STAMP_EPOCH = 1483228800
+
+# Statuses of the generated runs (by run ID)
+RUN_STATUSES = ["Passed", "Failed", "Passed", "Not Completed"]
+
+# Simulated filter text, e.g. "[Filter]{TS_NAME:Test 1}{RN_RUN_ID:> 100 And <= 200}"
+FILTER_FIELD = re.compile(r"\{(\w+):([^}]*)\}")
+
+# Numeric range condition, e.g. "> 100 And <= 200" (other conditions are exact matches)
+FILTER_RANGE = re.compile(r"^\s*([<>]=?)\s*(-?\d+)(?:\s+And\s+([<>]=?)\s*(-?\d+))?\s*$")
+
+# Folder IDs (AL_ITEM_ID) start at this value (QC numbers the root folder 2)
+ROOT_FOLDER_ID = 2
+
+# Absolute path codes: 3 letters per level, children numbered in list order
+ROOT_FOLDER_CODE = "AAA"
+CODE_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Project tables queried through the Command object (subset of the QC schema)
+DATABASE_SCHEMA = """
+CREATE TABLE ALL_LISTS (AL_ITEM_ID INTEGER PRIMARY KEY, AL_FATHER_ID INTEGER,
+                        AL_DESCRIPTION TEXT, AL_ABSOLUTE_PATH TEXT);
+CREATE TABLE TEST (TS_TEST_ID INTEGER PRIMARY KEY, TS_NAME TEXT, TS_SUBJECT INTEGER,
+                   TS_VTS TEXT);
+CREATE TABLE DESSTEPS (DS_ID INTEGER PRIMARY KEY, DS_TEST_ID INTEGER, DS_STEP_ORDER INTEGER,
+                       DS_STEP_NAME TEXT, DS_DESCRIPTION TEXT, DS_EXPECTED TEXT);
+CREATE TABLE RUN (RN_RUN_ID INTEGER PRIMARY KEY, RN_TEST_ID INTEGER, RN_RUN_NAME TEXT,
+                  RN_STATUS TEXT);
+"""
+
+class OTAError(Exception):
+    """OTAError Class
+    Raised where the OTA API raises a COM error"""
+    pass
+
+class SimulatedServer(object):
+    """SimulatedServer Class
+    Generated subject tree (fanout ** depth leaf folders, each holding
+    tests_per_folder tests) shared by every simulated connection.
+    Every OTA call (method call or property read) is counted in self.calls
+    and the size of the largest list fetched in self.largest_list
+    and waits latency seconds, like a round trip to the QC server (except
+    Recordset calls, which read the records fetched by Command.Execute)"""
+
+    def __init__(self, fanout=4, depth=3, tests_per_folder=10, steps_per_test=5, \
+                 runs_per_test=1, latency=0.0, root="Subject", allow_command=True):
+        """SimulatedServer Constructor
+        :param fanout number of subfolders per folder
+        :param depth number of folder levels under the root
+        :param tests_per_folder number of tests per leaf folder
+        :param steps_per_test number of design steps per test
+        :param runs_per_test number of runs per test
+        :param latency seconds per OTA call
+        :param root root folder name
+        :param allow_command False if TDConnection.Command is denied (like
+        for users without the required permission)"""
+        self.latency = latency
+        self.allow_command = allow_command
+        self.calls = Counter()
+        self.largest_list = 0
+        self.lock = Lock()
+        self.data_lock = RLock()
+        self.root = root
+        self.num_folders = 0
+        self.tests = {}
+        self.last_test_id = 0
+        self.clock = 0
+        self.runs = []
+        self.run_ids = []
+        self.database = None
+        self.root_folder = self.add_folder(root, None, "Root folder")
+        self.generate_tree(depth, fanout, tests_per_folder, steps_per_test, runs_per_test)
+
+    def generate_tree(self, depth, fanout, tests_per_folder, steps_per_test, runs_per_test):
+        """Generate folders, tests, design steps and runs (depth-first)"""
+        stack = [(self.root_folder, depth)]
+        while stack:
+            folder, level = stack.pop()
+            if level > 0:
+                children = []
+                for _ in range(fanout):
+                    name = "Folder_%d" % self.num_folders
+                    children.append(self.add_folder(name, folder, \
+                                                    "<html><body>Folder <b>%s</b></body></html>" % name))
+                stack.extend([(child, level - 1) for child in reversed(children)])
+                continue
+            for _ in range(tests_per_folder):
+                test = self.add_test(folder, "Test %d" % (len(self.tests) + 1))
+                for step_idx in range(steps_per_test):
+                    test.steps.append(DesignStepRecord( \
+                        "Step %d" % (step_idx + 1), \
+                        "<html><body>Run test %d, then type <b>%d</b></body></html>" \
+                        % (test.test_id, step_idx + 1), \
+                        "<html><body>The result is &quot;%d&quot;</body></html>" % (step_idx + 1)))
+                for _ in range(runs_per_test):
+                    run_id = len(self.runs) + 1
+                    self.runs.append(RunRecord(run_id, test.test_id, "Run_%d" % run_id, \
+                                               RUN_STATUSES[run_id % len(RUN_STATUSES)]))
+
+    def add_folder(self, name, parent, description=""):
+        """Add a folder (returns its record)
+        :param name folder name
+        :param parent parent folder record (None for the root)
+        :param description folder description"""
+        with self.data_lock:
+            if parent is not None and name in parent.children_by_name:
+                raise OTAError("Node already exists: %s" % name)
+            folder_id = ROOT_FOLDER_ID + self.num_folders
+            if parent is None:
+                code = ROOT_FOLDER_CODE
+            else:
+                code = parent.code + get_folder_code(len(parent.children))
+            folder = FolderRecord(folder_id, code, name, parent, description)
+            if parent is not None:
+                parent.children.append(folder)
+                parent.children_by_name[name] = folder
+            self.num_folders += 1
+            self.database = None
+            return folder
+
+    def add_test(self, folder, name):
+        """Add a test (returns its record)
+        :param folder test folder record
+        :param name test name"""
+        return self.post_test(TestRecord(None, name, folder, None))
+
+    def post_test(self, test):
+        """Store a new or changed test (returns its record)
+        :param test test record"""
+        with self.data_lock:
+            if test.test_id is None:
+                self.last_test_id += 1
+                test.test_id = self.last_test_id
+                self.tests[test.test_id] = test
+                test.folder.tests.append(test.test_id)
+            test.modified = self.get_version_stamp()
+            self.database = None
+            return test
+
+    def post_design_step(self, test, step):
+        """Store a new design step
+        :param test test record
+        :param step design step record"""
+        with self.data_lock:
+            test.steps.append(step)
+            test.modified = self.get_version_stamp()
+            self.database = None
+
+    def get_version_stamp(self):
+        """Get a new version stamp (QC 'YYYY-MM-DD HH:MM:SS' format)"""
+        with self.data_lock:
+            self.clock += 1
+            return time.strftime("%Y-%m-%d %H:%M:%S", \
+                                 time.gmtime(VERSION_STAMP_EPOCH + self.clock))
+
+    def modify_test(self, test_id, name=None, step_description=None):
+        """Change a test (and its version stamp)
+        :param test_id test ID
+        :param name new test name
+        :param step_description new description of every design step"""
+        with self.data_lock:
+            test = self.tests[test_id]
+            if name is not None:
+                test.name = name
+            if step_description is not None:
+                for step in test.steps:
+                    step.description = step_description
+            test.modified = self.get_version_stamp()
+            self.database = None
+
+    def remove_test(self, test_id):
+        """Delete a test
+        :param test_id test ID"""
+        with self.data_lock:
+            test = self.tests.pop(test_id)
+            test.folder.tests.remove(test_id)
+            self.database = None
+
+    def get_runs_between(self, low, high):
+        """Get the runs with low < run ID <= high (runs are kept in run ID order)
+        :param low lower bound (excluded)
+        :param high upper bound (included)"""
+        with self.data_lock:
+            if len(self.run_ids) != len(self.runs):
+                self.run_ids = [run.run_id for run in self.runs]
+            return self.runs[bisect_right(self.run_ids, low):bisect_right(self.run_ids, high)]
+
+    def get_database(self):
+        """Get an in-memory database holding a snapshot of the records
+        (rebuilt after every change)"""
+        with self.data_lock:
+            if self.database is not None:
+                return self.database
+            database = sqlite3.connect(":memory:", check_same_thread=False)
+            database.text_factory = str
+            database.executescript(DATABASE_SCHEMA)
+            folders = []
+            stack = [self.root_folder]
+            while stack:
+                folder = stack.pop()
+                folders.append(folder)
+                stack.extend(folder.children)
+            database.executemany("INSERT INTO ALL_LISTS VALUES (?, ?, ?, ?)", \
+                                 [(folder.folder_id, \
+                                   folder.parent.folder_id if folder.parent else None, \
+                                   folder.name, folder.code) for folder in folders])
+            database.executemany("INSERT INTO TEST VALUES (?, ?, ?, ?)", \
+                                 [(test.test_id, test.name, test.folder.folder_id, test.modified) \
+                                  for test in self.tests.itervalues()])
+            database.executemany("INSERT INTO DESSTEPS (DS_TEST_ID, DS_STEP_ORDER, DS_STEP_NAME, " \
+                                 "DS_DESCRIPTION, DS_EXPECTED) VALUES (?, ?, ?, ?, ?)", \
+                                 [(test.test_id, order + 1, step.name, step.description, \
+                                   step.expected_result) \
+                                  for test in self.tests.itervalues() \
+                                  for order, step in enumerate(test.steps)])
+            database.executemany("INSERT INTO RUN VALUES (?, ?, ?, ?)", \
+                                 [(run.run_id, run.test_id, run.name, run.status) \
+                                  for run in self.runs])
+            self.database = database
+            return database
+
+    def execute_sql(self, query):
+        """Run a Command query on the records
+        :param query SQL query
+        :return (column names, rows)"""
+        with self.data_lock:
+            try:
+                cursor = self.get_database().execute(query)
+            except sqlite3.Error as err:
+                raise OTAError("Failed to execute SQL: %s" % err)
+            if cursor.description is None:
+                return [], []
+            return [column[0].upper() for column in cursor.description], cursor.fetchall()
+
+    def find_folder(self, node_path):
+        """Get a folder record (None if there is no such folder)
+        :param node_path folder path, e.g. 'Subject\\Folder_1'"""
+        names = node_path.split("\\")
+        if names[0] != self.root:
+            return None
+        folder = self.root_folder
+        for name in names[1:]:
+            folder = folder.children_by_name.get(name)
+            if folder is None:
+                return None
+        return folder
+
+    def call(self, name, round_trip=True):
+        """Count (and wait for) an OTA call
+        :param name OTA call name, e.g. 'SubjectNode.NewList'
+        :param round_trip False for calls answered by the client"""
+        with self.lock:
+            self.calls[name] += 1
+        if self.latency and round_trip:
+            time.sleep(self.latency)
+
+    def get_num_calls(self):
+        """Get the total number of OTA calls"""
+        with self.lock:
+            return sum(self.calls.itervalues())
+
+    def reset_calls(self):
+        """Reset the OTA call counters"""
+        with self.lock:
+            self.calls.clear()
+            self.largest_list = 0
+
+    def connect(self):
+        """Open a new simulated connection"""
+        return SimulatedTDConnection(self)
+
+def get_folder_code(idx):
+    """Get the absolute path code of a child folder (e.g. 'AAB' for the second child)
+    :param idx child index (0-based)"""
+    letters = []
+    for _ in range(len(ROOT_FOLDER_CODE)):
+        idx, letter = divmod(idx, len(CODE_LETTERS))
+        letters.append(CODE_LETTERS[letter])
+    assert idx == 0, "Too many child folders"
+    return "".join(reversed(letters))
+
+class FolderRecord(object):
+    """FolderRecord Class"""
+    def __init__(self, folder_id, code, name, parent, description):
+        self.folder_id = folder_id
+        self.code = code
+        self.name = name
+        self.parent = parent
+        self.description = description
+        self.children = []
+        self.children_by_name = {}
+        self.tests = []
+
+    @property
+    def path(self):
+        """Folder path (from the root)"""
+        names = []
+        folder = self
+        while folder is not None:
+            names.append(folder.name)
+            folder = folder.parent
+        return "\\".join(reversed(names))
+
+class TestRecord(object):
+    """TestRecord Class"""
+    def __init__(self, test_id, name, folder, modified):
+        self.test_id = test_id
+        self.name = name
+        self.folder = folder
+        self.modified = modified
+        self.steps = []
+        self.fields = {}
+
+    @property
+    def folder_path(self):
+        """Test folder path"""
+        return self.folder.path
+
+class DesignStepRecord(object):
+    """DesignStepRecord Class"""
+    def __init__(self, name, description, expected_result):
+        self.name = name
+        self.description = description
+        self.expected_result = expected_result
+
+class RunRecord(object):
+    """RunRecord Class"""
+    __slots__ = ('run_id', 'test_id', 'name', 'status')
+
+    def __init__(self, run_id, test_id, name, status):
+        self.run_id = run_id
+        self.test_id = test_id
+        self.name = name
+        self.status = status
+
+
+class SimulatedObject(object):
+    """SimulatedObject Class
+    OTA object facade: reading one of PROPERTIES or writing one of WRITABLE
+    (property -> record attribute) is a counted OTA call"""
+    OTA_CLASS = None
+    ROUND_TRIP = True
+    PROPERTIES = {}
+    WRITABLE = {}
+    FIELDS = {}
+    USER_FIELDS = frozenset()
+
+    def __init__(self, server, record=None):
+        """SimulatedObject Constructor
+        :param server simulated server
+        :param record backing record"""
+        self.server = server
+        self.record = record
+
+    def __getattr__(self, name):
+        """Read an OTA property
+        :param name property name"""
+        if name not in self.PROPERTIES:
+            raise AttributeError(name)
+        self.server.call("%s.%s" % (self.OTA_CLASS, name), self.ROUND_TRIP)
+        return self.PROPERTIES[name](self)
+
+    def __setattr__(self, name, value):
+        """Write an OTA property
+        :param name property name
+        :param value property value"""
+        if name in self.WRITABLE:
+            self.server.call("%s.%s" % (self.OTA_CLASS, name))
+            setattr(self.record, self.WRITABLE[name], value)
+        else:
+            object.__setattr__(self, name, value)
+
+    def Field(self, name):
+        """Get a field value
+        :param name field name, e.g. 'TS_VTS' (see FIELDS)"""
+        self.server.call("%s.Field" % self.OTA_CLASS)
+        if name in self.USER_FIELDS:
+            return self.record.fields.get(name)
+        try:
+            return getattr(self.record, self.FIELDS[name])
+        except KeyError:
+            raise OTAError("Invalid field name: %s" % name)
+
+    def SetField(self, name, value):
+        """Set a field value (saved by Post)
+        :param name user field name, e.g. 'TS_USER_01' (see USER_FIELDS)
+        :param value field value"""
+        self.server.call("%s.SetField" % self.OTA_CLASS, False)
+        if name not in self.USER_FIELDS:
+            raise OTAError("Invalid field name: %s" % name)
+        self.record.fields[name] = value
+
+class SimulatedList(list):
+    """SimulatedList Class
+    OTA List (1-based Item access)"""
+
+    def __init__(self, server, items, wrap=None):
+        """SimulatedList Constructor
+        :param server simulated server
+        :param items list items
+        :param wrap function getting the OTA object of an item (items are
+        records wrapped on access, so that long lists stay small)"""
+        list.__init__(self, items)
+        self.server = server
+        self.wrap = wrap
+        with server.lock:
+            server.largest_list = max(server.largest_list, len(self))
+
+    def __getitem__(self, idx):
+        """Get an item (0-based, no OTA call)"""
+        item = list.__getitem__(self, idx)
+        return self.wrap(item) if self.wrap else item
+
+    def __iter__(self):
+        """Iterate over the items (no OTA calls)"""
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    @property
+    def Count(self):
+        """Number of items"""
+        self.server.call("List.Count")
+        return len(self)
+
+    def Item(self, idx):
+        """Get an item
+        :param idx item index (1-based)"""
+        self.server.call("List.Item")
+        return self[idx - 1]
+
+class SimulatedTDConnection(SimulatedObject):
+    """SimulatedTDConnection Class
+    Stand-in for TDApiOle80.TDConnection"""
+    OTA_CLASS = "TDConnection"
+    PROPERTIES = {'TreeManager': lambda self: SimulatedTreeManager(self.server),
+                  'TestFactory': lambda self: SimulatedTestFactory(self.server),
+                  'RunFactory': lambda self: SimulatedRunFactory(self.server),
+                  'TestFolderFactory': lambda self: SimulatedTestFolderFactory(self.server),
+                  'Command': lambda self: self.get_command()}
+
+    def get_command(self):
+        """Get a new Command object"""
+        if not self.server.allow_command:
+            raise OTAError("Permission denied: Command")
+        return SimulatedCommand(self.server, CommandRecord())
+
+    def InitConnection(self, url):
+        """Initialize connection
+        :param url quality center server URL"""
+        self.server.call("TDConnection.InitConnection")
+
+    def Login(self, username, password):
+        """Login"""
+        self.server.call("TDConnection.Login")
+
+    def Connect(self, domain, project):
+        """Connect to project"""
+        self.server.call("TDConnection.Connect")
+
+    def Logout(self):
+        """Logout"""
+        self.server.call("TDConnection.Logout")
+
+    def Disconnect(self):
+        """Disconnect from project"""
+        self.server.call("TDConnection.Disconnect")
+
+class SimulatedTreeManager(SimulatedObject):
+    """SimulatedTreeManager Class"""
+    OTA_CLASS = "TreeManager"
+
+    def NodeByPath(self, node_path):
+        """Get a subject node
+        :param node_path node path, e.g. 'Subject\\Folder_1'"""
+        self.server.call("TreeManager.NodeByPath")
+        folder = self.server.find_folder(node_path)
+        if folder is None:
+            raise OTAError("Node not found: %s" % node_path)
+        return SimulatedSubjectNode(self.server, folder)
+
+class SimulatedSubjectNode(SimulatedObject):
+    """SimulatedSubjectNode Class"""
+    OTA_CLASS = "SubjectNode"
+    PROPERTIES = {'NodeID': lambda self: self.record.folder_id,
+                  'Name': lambda self: self.record.name,
+                  'Path': lambda self: self.record.path,
+                  'Description': lambda self: self.record.description,
+                  'Count': lambda self: len(self.record.children),
+                  'TestFactory': lambda self: SimulatedTestFactory(self.server, self.record)}
+
+    def AddNode(self, name):
+        """Create a child node
+        :param name node name"""
+        self.server.call("SubjectNode.AddNode")
+        return SimulatedSubjectNode(self.server, self.server.add_folder(name, self.record))
+
+    def Post(self):
+        """Save the node"""
+        self.server.call("SubjectNode.Post")
+
+    def NewList(self):
+        """Get the child nodes"""
+        self.server.call("SubjectNode.NewList")
+        return SimulatedList(self.server, [SimulatedSubjectNode(self.server, folder) \
+                                           for folder in self.record.children])
+
+    def FindTests(self, pattern):
+        """Get the tests of this node (None if there are none)
+        :param pattern test name pattern ('' for all tests)"""
+        self.server.call("SubjectNode.FindTests")
+        tests = [SimulatedTest(self.server, self.server.tests[test_id]) \
+                 for test_id in self.record.tests \
+                 if pattern in self.server.tests[test_id].name]
+        return SimulatedList(self.server, tests) if tests else None
+
+class SimulatedTest(SimulatedObject):
+    """SimulatedTest Class"""
+    OTA_CLASS = "Test"
+    PROPERTIES = {'ID': lambda self: self.record.test_id,
+                  'Name': lambda self: self.record.name,
+                  'DesignStepFactory': lambda self: SimulatedDesignStepFactory(self.server, self.record)}
+    WRITABLE = {'Name': 'name'}
+    FIELDS = {'TS_TEST_ID': 'test_id', 'TS_NAME': 'name', 'TS_SUBJECT': 'folder_path', \
+              'TS_VTS': 'modified'}
+    USER_FIELDS = frozenset(["TS_USER_%02d" % idx for idx in range(1, 25)])
+
+    def Post(self):
+        """Save the test"""
+        self.server.call("Test.Post")
+        self.server.post_test(self.record)
+
+class SimulatedDesignStepFactory(SimulatedObject):
+    """SimulatedDesignStepFactory Class"""
+    OTA_CLASS = "DesignStepFactory"
+
+    def NewList(self, filt):
+        """Get the design steps of the test
+        :param filt TDFilter.Text argument"""
+        self.server.call("DesignStepFactory.NewList")
+        return SimulatedList(self.server, [SimulatedDesignStep(self.server, step) \
+                                           for step in self.record.steps])
+
+    def AddItem(self, item_data):
+        """Create a design step (saved by DesignStep.Post)
+        :param item_data None"""
+        self.server.call("DesignStepFactory.AddItem")
+        if self.record.test_id is None:
+            raise OTAError("Test must be posted before adding design steps")
+        return SimulatedDesignStep(self.server, DesignStepRecord("", "", ""), self.record)
+
+class SimulatedDesignStep(SimulatedObject):
+    """SimulatedDesignStep Class"""
+    OTA_CLASS = "DesignStep"
+    PROPERTIES = {'StepName': lambda self: self.record.name,
+                  'StepDescription': lambda self: self.record.description,
+                  'StepExpectedResult': lambda self: self.record.expected_result}
+    WRITABLE = {'StepName': 'name',
+                'StepDescription': 'description',
+                'StepExpectedResult': 'expected_result'}
+
+    def __init__(self, server, record, new_step_test=None):
+        """SimulatedDesignStep Constructor
+        :param server simulated server
+        :param record design step record
+        :param new_step_test test record of a design step that was not posted yet"""
+        SimulatedObject.__init__(self, server, record)
+        self.new_step_test = new_step_test
+
+    def Post(self):
+        """Save the design step"""
+        self.server.call("DesignStep.Post")
+        if self.new_step_test is not None:
+            self.server.post_design_step(self.new_step_test, self.record)
+            self.new_step_test = None
+
+class FilterRecord(object):
+    """FilterRecord Class
+    Column filters, e.g. {'RN_STATUS': 'Passed', 'RN_RUN_ID': '> 100 And <= 200'}"""
+    def __init__(self):
+        self.fields = {}
+
+    @property
+    def text(self):
+        """Filter text"""
+        return "[Filter]" + "".join(["{%s:%s}" % field for field in sorted(self.fields.items())])
+
+    @text.setter
+    def text(self, text):
+        """Replace the column filters
+        :param text filter text ('' clears the filter)"""
+        self.fields = dict(FILTER_FIELD.findall(text))
+
+def parse_condition(condition):
+    """Get the bounds of a range condition (None if it is an exact match)
+    :param condition column filter, e.g. '> 100 And <= 200'
+    :return (low, high): low < value <= high (None if there is no bound)"""
+    match = FILTER_RANGE.match(condition)
+    if match is None:
+        return None
+    low = high = None
+    for operator, value in (match.group(1, 2), match.group(3, 4)):
+        if operator is None:
+            continue
+        value = int(value)
+        if operator == ">":
+            low = value
+        elif operator == ">=":
+            low = value - 1
+        elif operator == "<":
+            high = value - 1
+        else:
+            high = value
+    return low, high
+
+def match_condition(value, condition, bounds):
+    """Check a record value against a column filter
+    :param value record value
+    :param condition column filter
+    :param bounds parse_condition(condition)"""
+    if bounds is None:
+        return str(value) == condition
+    low, high = bounds
+    return (low is None or value > low) and (high is None or value <= high)
+
+class SimulatedTDFilter(SimulatedObject):
+    """SimulatedTDFilter Class"""
+    OTA_CLASS = "TDFilter"
+    PROPERTIES = {'Text': lambda self: self.record.text}
+    WRITABLE = {'Text': 'text'}
+
+    def __init__(self, server):
+        """SimulatedTDFilter Constructor"""
+        SimulatedObject.__init__(self, server, FilterRecord())
+
+    def SetFilter(self, column_name, filt):
+        """Set a column filter (exact match or numeric range, e.g. '> 100 And <= 200')
+        :param column_name
+        :param filt"""
+        self.server.call("TDFilter.SetFilter")
+        self.record.fields[column_name] = filt
+
+class SimulatedFactory(SimulatedObject):
+    """SimulatedFactory Class
+    Factory whose NewList filters records on FIELDS"""
+    FIELDS = {}
+    ID_FIELD = None
+
+    def __init__(self, server):
+        """SimulatedFactory Constructor"""
+        SimulatedObject.__init__(self, server)
+        self.filter = SimulatedTDFilter(server)
+
+    @property
+    def Filter(self):
+        """Factory filter"""
+        self.server.call("%s.Filter" % self.OTA_CLASS)
+        return self.filter
+
+    def get_records(self):
+        """Get all records"""
+        raise NotImplementedError
+
+    def get_records_between(self, low, high):
+        """Get the records with low < ID <= high (None bounds are open)
+        :param low lower bound (excluded)
+        :param high upper bound (included)"""
+        id_attr = self.FIELDS[self.ID_FIELD]
+        return [record for record in self.get_records() \
+                if (low is None or getattr(record, id_attr) > low) and \
+                   (high is None or getattr(record, id_attr) <= high)]
+
+    def NewList(self, filt):
+        """Get the (filtered) records
+        :param filt TDFilter.Text argument ('' for all records)"""
+        self.server.call("%s.NewList" % self.OTA_CLASS)
+        conditions = [(column, self.FIELDS[column], value, parse_condition(value)) \
+                      for column, value in FILTER_FIELD.findall(filt)]
+        records = None
+        for column, _, _, bounds in conditions:
+            if column == self.ID_FIELD and bounds is not None:
+                records = self.get_records_between(*bounds)
+        if records is None:
+            records = self.get_records()
+        return SimulatedList(self.server, \
+                             [record for record in records \
+                              if all([match_condition(getattr(record, attr), value, bounds) \
+                                      for _, attr, value, bounds in conditions])], \
+                             self.wrap)
+
+    def wrap(self, record):
+        """Get the OTA object of a record"""
+        raise NotImplementedError
+
+class SimulatedTestFactory(SimulatedFactory):
+    """SimulatedTestFactory Class"""
+    OTA_CLASS = "TestFactory"
+    FIELDS = SimulatedTest.FIELDS
+    ID_FIELD = "TS_TEST_ID"
+
+    def __init__(self, server, folder=None):
+        """SimulatedTestFactory Constructor
+        :param server simulated server
+        :param folder folder record (SubjectNode.TestFactory) or None"""
+        SimulatedFactory.__init__(self, server)
+        self.folder = folder
+
+    def get_records(self):
+        if self.folder is not None:
+            return [self.server.tests[test_id] for test_id in self.folder.tests]
+        return [self.server.tests[test_id] for test_id in sorted(self.server.tests)]
+
+    def AddItem(self, item_data):
+        """Create a test (saved by Test.Post)
+        :param item_data None"""
+        self.server.call("TestFactory.AddItem")
+        if self.folder is None:
+            raise OTAError("Test folder is not defined")
+        return SimulatedTest(self.server, TestRecord(None, "", self.folder, None))
+
+    def wrap(self, record):
+        return SimulatedTest(self.server, record)
+
+class SimulatedRun(SimulatedObject):
+    """SimulatedRun Class"""
+    OTA_CLASS = "Run"
+    PROPERTIES = {'ID': lambda self: self.record.run_id,
+                  'Name': lambda self: self.record.name,
+                  'Status': lambda self: self.record.status,
+                  'TestId': lambda self: self.record.test_id}
+    FIELDS = {'RN_RUN_ID': 'run_id', 'RN_TEST_ID': 'test_id', \
+              'RN_RUN_NAME': 'name', 'RN_STATUS': 'status'}
+
+class SimulatedRunFactory(SimulatedFactory):
+    """SimulatedRunFactory Class"""
+    OTA_CLASS = "RunFactory"
+    FIELDS = SimulatedRun.FIELDS
+    ID_FIELD = "RN_RUN_ID"
+
+    def get_records(self):
+        return self.server.runs
+
+    def get_records_between(self, low, high):
+        return self.server.get_runs_between(float("-inf") if low is None else low, \
+                                            float("inf") if high is None else high)
+
+    def wrap(self, record):
+        return SimulatedRun(self.server, record)
+
+class SimulatedTestFolderFactory(SimulatedObject):
+    """SimulatedTestFolderFactory Class"""
+    OTA_CLASS = "TestFolderFactory"
+
+class CommandRecord(object):
+    """CommandRecord Class"""
+    def __init__(self):
+        self.text = ""
+
+class SimulatedCommand(SimulatedObject):
+    """SimulatedCommand Class
+    Runs SQL on a snapshot of the records (see SimulatedServer.get_database)"""
+    OTA_CLASS = "Command"
+    PROPERTIES = {'CommandText': lambda self: self.record.text}
+    WRITABLE = {'CommandText': 'text'}
+
+    def Execute(self):
+        """Run the CommandText query (returns a Recordset)"""
+        self.server.call("Command.Execute")
+        columns, rows = self.server.execute_sql(self.record.text)
+        return SimulatedRecordset(self.server, columns, rows)
+
+class SimulatedRecordset(SimulatedObject):
+    """SimulatedRecordset Class
+    Records fetched by Command.Execute (calls are counted, but they are not
+    round trips to the server)"""
+    OTA_CLASS = "Recordset"
+    ROUND_TRIP = False
+    PROPERTIES = {'RecordCount': lambda self: len(self.rows),
+                  'ColCount': lambda self: len(self.columns),
+                  'BOR': lambda self: self.position < 0,
+                  'EOR': lambda self: self.position >= len(self.rows)}
+
+    def __init__(self, server, columns, rows):
+        """SimulatedRecordset Constructor
+        :param server simulated server
+        :param columns column names
+        :param rows list of records (tuples)"""
+        SimulatedObject.__init__(self, server)
+        self.columns = columns
+        self.column_indexes = dict([(column, idx) for idx, column in enumerate(columns)])
+        self.rows = rows
+        self.position = 0
+
+    def First(self):
+        """Move to the first record"""
+        self.server.call("Recordset.First", False)
+        self.position = 0
+
+    def Next(self):
+        """Move to the next record"""
+        self.server.call("Recordset.Next", False)
+        self.position += 1
+
+    def ColName(self, idx):
+        """Get a column name
+        :param idx column index (0-based)"""
+        self.server.call("Recordset.ColName", False)
+        return self.columns[idx]
+
+    def FieldValue(self, key):
+        """Get a field of the current record
+        :param key column name or index (0-based)"""
+        self.server.call("Recordset.FieldValue", False)
+        if not 0 <= self.position < len(self.rows):
+            raise OTAError("No current record")
+        if not isinstance(key, (int, long)):
+            try:
+                key = self.column_indexes[key.upper()]
+            except KeyError:
+                raise OTAError("Invalid column name: %s" % key)
+        return self.rows[self.position][key]
@@ -11,89 +11,648 @@ __author__ = 'Galego, João (jgalego1990@gmail.com)'
 __copyright__ = 'Copyright (c) 2017 João Galego'
 __version__ = '0.0.1 (Hallucigenia)'
 
+import os
 import re
+import mmap
 import logging
-from copy import copy
+from cPickle import dump
+from cPickle import load
+from cPickle import HIGHEST_PROTOCOL
+from hashlib import sha1
+from collections import OrderedDict
+from fnmatch import fnmatch
+from multiprocessing import Pool
+from multiprocessing import cpu_count
+from tspec import DEFAULT_TEST_SPEC_NAME
 from tspec import TestSpec
 from tspec import CustomTest
 from tspec import TestStep
+from tspec import TestSpecWriter
 
 # Log Configuration
 FORMAT = "%(levelname)-4s %(message)s"
 logging.basicConfig(format=FORMAT, level=logging.WARN)
 
-LEXER = {'BLANK_LINE': r"[\s\b\t\n]+|$^",
-         'COMMENT': r"# (?P<comment>.*)",
-         'TSPEC_NAME': r"TSPEC (?P<name>.*)",
-         'ASSIGNMENT': r"(?P<var>.*)=(?P<value>.*)",
-         'START_TEST': r"START_TEST (?P<test_id>.*)",
-         'START_STEP': r"START_STEP (?P<step_id>.*)",
-         'END_STEP': r"END_STEP.*",
-         'DESCRIPTION': r"DESCRIPTION (?P<description>.*)",
-         'RESULT': r"RESULT (?P<result>.*)",
-         'END_TEST': r"END_TEST.*"}
+# Directives by priority (ASSIGNMENT must come after the keyword directives)
+# Lines are matched without their leading whitespace (indented directives)
+LEXER = OrderedDict([('BLANK_LINE', r"\s*$"),
+                     ('COMMENT', r"# (?P<comment>.*)"),
+                     ('TSPEC_NAME', r"TSPEC (?P<name>.*)"),
+                     ('START_TEST', r"START_TEST (?P<test_id>.*)"),
+                     ('START_STEP', r"START_STEP (?P<step_id>.*)"),
+                     ('END_STEP', r"END_STEP.*"),
+                     ('DESCRIPTION', r"DESCRIPTION (?P<description>.*)"),
+                     ('RESULT', r"RESULT (?P<result>.*)"),
+                     ('END_TEST', r"END_TEST.*"),
+                     ('FOREACH', r"FOREACH (?P<loop_vars>.*?) IN (?P<loop_values>.*)"),
+                     ('END_FOREACH', r"END_FOREACH.*"),
+                     ('INCLUDE', r"INCLUDE (?P<include_path>.*)"),
+                     ('ASSIGNMENT', r"(?P<var>.*)=(?P<value>.*)")])
+
+def compile_lexer(lexer):
+    """Compile the lexer into a single alternation (one match per line)
+    :param lexer ordered directive -> pattern mapping
+    :return (master pattern, directive -> argument names)"""
+    master_pattern = re.compile("|".join(["(?P<%s>%s)" % (directive, pattern) \
+                                          for directive, pattern in lexer.iteritems()]))
+    directive_args = {}
+    for directive, pattern in lexer.iteritems():
+        directive_args[directive] = re.compile(pattern).groupindex.keys()
+    return master_pattern, directive_args
+
+LEXER_PATTERN, LEXER_ARGS = compile_lexer(LEXER)
+IGNORED_DIRECTIVES = frozenset(["BLANK_LINE", "COMMENT"])
+
+# FOREACH loop variables, e.g. "START_TEST {subject}_{calculator}"
+LOOP_VARIABLE = re.compile(r"\{(\w+)\}")
+
+def compile_scanner(lexer):
+    """Compile the lexer into a scanner that matches one whole line at a time
+    over a buffer, skipping its leading whitespace (unknown lines match the
+    UNKNOWN group)
+    :param lexer ordered directive -> pattern mapping"""
+    alternatives = []
+    for directive, pattern in lexer.iteritems():
+        if directive == 'BLANK_LINE':
+            # Whitespace up to the end of the line (zero-width, the line is consumed below)
+            pattern = r"(?=[^\S\n]*(?:\n|\Z))"
+        alternatives.append("(?P<%s>%s)" % (directive, pattern))
+    alternatives.append("(?P<UNKNOWN>)")
+    return re.compile(r"[ \t]*(?:%s)[^\n]*\n?" % "|".join(alternatives))
+
+LINE_SCANNER = compile_scanner(LEXER)
+
+# Parsed config cache (bump the format version whenever the grammar changes,
+# it is part of the cache keys)
+CACHE_FORMAT_VERSION = "4"
+DEFAULT_CACHE_SIZE = 256 * 2**20
 
 def get_directive(line):
-    """Parse line and get directive"""
-    for directive, pattern in LEXER.iteritems():
-        match = re.match(pattern, line)
-        if match:
-            return directive, match.groupdict()
+    """Parse line and get directive (leading whitespace is ignored)"""
+    match = LEXER_PATTERN.match(line.lstrip(" \t"))
+    if match:
+        directive = match.lastgroup
+        return directive, dict([(arg, match.group(arg)) for arg in LEXER_ARGS[directive]])
     return None
 
+class TestSpecConfigCache(object):
+    """TestSpecConfigCache Class
+    On-disk cache of parsed config files, keyed on the file path, the file
+    content hash and the parser version (error messages and INCLUDE paths
+    depend on the file path). Each entry is a stream of pickled parser events
+    (written and replayed one at a time). Least recently used entries are
+    evicted when the cache grows over max_size bytes"""
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        """TestSpecConfigCache Constructor
+        :param cache_dir cache directory
+        :param max_size cache size limit (bytes)"""
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Cache size (bytes), None until the cache directory is scanned
+        self.size = None
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_key(self, test_config, with_path=True):
+        """Get the cache key of a config file
+        :param test_config config file path
+        :param with_path include the absolute path of the config file (the
+        keys of included config files only depend on their content)"""
+        digest = sha1("%s:%s:" % (__version__, CACHE_FORMAT_VERSION))
+        if with_path:
+            digest.update("%s:" % os.path.normcase(os.path.abspath(test_config)))
+        with open(test_config, 'rb') as config:
+            for chunk in iter(lambda: config.read(2**20), ''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_entry_path(self, key):
+        """Get the path of a cache entry
+        :param key cache key"""
+        return os.path.join(self.cache_dir, key + ".tspecc")
+
+    def load(self, key):
+        """Get the events of a cache entry (None if there is no such entry or
+        if one of its included config files has changed)
+        :param key cache key"""
+        entry_path = self.get_entry_path(key)
+        try:
+            entry = open(entry_path, 'rb')
+        except (OSError, IOError):
+            return None
+        if os.path.exists(entry_path + ".deps"):
+            with open(entry_path + ".deps", 'rb') as deps:
+                dependencies = load(deps)
+            for test_config, dependency_key in dependencies:
+                if not os.path.exists(test_config) or \
+                   self.get_key(test_config, with_path=False) != dependency_key:
+                    entry.close()
+                    return None
+        # Mark entry as recently used
+        os.utime(entry_path, None)
+        return self.iter_events(entry)
+
+    def iter_events(self, entry):
+        """Generate the events of an open cache entry
+        :param entry cache entry file"""
+        with entry:
+            while True:
+                try:
+                    yield load(entry)
+                except EOFError:
+                    break
+
+    def create(self, key):
+        """Create a new cache entry
+        :param key cache key"""
+        return TestSpecConfigCacheEntry(self, self.get_entry_path(key))
+
+    def store(self, entry):
+        """Publish a new cache entry
+        :param entry TestSpecConfigCacheEntry object
+        :return size of the entry (bytes)"""
+        size = entry.commit()
+        self.add_size(size)
+        return size
+
+    def add_size(self, size):
+        """Account for entries added to the cache (e.g. by other processes)
+        :param size size of the entries (bytes)"""
+        if self.size is not None:
+            self.size += size
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_size
+        (the cache directory is only scanned if the cache size is unknown or
+        over max_size)"""
+        if self.size is not None and self.size <= self.max_size:
+            return
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".tspecc"):
+                entry_path = os.path.join(self.cache_dir, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                size = stat.st_size
+                if os.path.exists(entry_path + ".deps"):
+                    size += os.path.getsize(entry_path + ".deps")
+                entries.append((stat.st_mtime, size, entry_path))
+        total_size = sum([size for _, size, _ in entries])
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+                if os.path.exists(entry_path + ".deps"):
+                    os.remove(entry_path + ".deps")
+            except OSError:
+                continue
+            total_size -= size
+        self.size = total_size
+
+
+class TestSpecConfigCacheEntry(object):
+    """TestSpecConfigCacheEntry Class
+    Cache entry being written (temporary file, renamed on commit)"""
+    def __init__(self, cache, entry_path):
+        """TestSpecConfigCacheEntry Constructor
+        :param cache TestSpecConfigCache object
+        :param entry_path cache entry path"""
+        self.cache = cache
+        self.entry_path = entry_path
+        self.temp_path = "%s.%d.tmp" % (entry_path, os.getpid())
+        self.entry = open(self.temp_path, 'wb')
+        # included config file path -> cache key (hashed once per file)
+        self.dependencies = OrderedDict()
+
+    def add_dependency(self, test_config):
+        """Add an included config file (the entry is stale once it changes)
+        :param test_config included config file path"""
+        test_config = os.path.abspath(test_config)
+        if test_config not in self.dependencies:
+            self.dependencies[test_config] = self.cache.get_key(test_config, with_path=False)
+
+    def record(self, *event):
+        """Append an event
+        :param event event tuple"""
+        dump(event, self.entry, HIGHEST_PROTOCOL)
+
+    def commit(self):
+        """Close and publish the entry
+        :return size of the entry and its dependencies (bytes)"""
+        self.entry.close()
+        deps_path = self.entry_path + ".deps"
+        try:
+            size = os.path.getsize(self.temp_path)
+            if self.dependencies:
+                with open(deps_path, 'wb') as deps:
+                    dump(self.dependencies.items(), deps, HIGHEST_PROTOCOL)
+                size += os.path.getsize(deps_path)
+            elif os.path.exists(deps_path):
+                os.remove(deps_path)
+            os.rename(self.temp_path, self.entry_path)
+        except OSError:
+            # Entry already written by another process (Windows)
+            self.discard()
+            return 0
+        return size
+
+    def discard(self):
+        """Close and delete the entry"""
+        self.entry.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
 class TestSpecConfigParser(object):
     """TestSpecConfigParser Class"""
-    def __init__(self, test_config):
+    def __init__(self, test_config, cache=None, evict_cache=True, use_mmap=False):
+        """TestSpecConfigParser Constructor
+        :param test_config config file path
+        :param cache TestSpecConfigCache object (optional)
+        :param evict_cache evict old cache entries after adding a new one
+        :param use_mmap scan a memory-mapped config file instead of reading lines"""
         self.test_config = test_config
+        self.use_mmap = use_mmap
         self.choose_from = ""
+        self.tspec_name = None
+        self.test_line = None
+        self.errors = []
+        # Config variables (var=value lines)
+        self.variables = {}
+        self.cache = cache
+        self.evict_cache = evict_cache
+        self.cache_entry = None
+        # Size of the cache entries added by this parser (bytes)
+        self.cache_added = 0
+        self.source = None
+
+    def report_error(self, line_number, message, *args):
+        """Log (and keep) a config error
+        :param line_number config file line number (of self.source)
+        :param message error message"""
+        if args:
+            message = message % args
+        if self.source is not None and self.source != self.test_config:
+            # Error in an included config file
+            message = "%s:%d: %s" % (self.source, line_number, message)
+            logging.error("%s: %s", self.test_config, message)
+        else:
+            logging.error("%s:%d: %s", self.test_config, line_number, message)
+        self.errors.append((line_number, message))
+        if self.cache_entry is not None:
+            self.cache_entry.record('error', line_number, message)
+
+    def iter_directives(self, skip_ignored=False):
+        """Generate (line number, directive type, directive args) one line at a time
+        :param skip_ignored leave out blank lines and comments"""
+        if self.use_mmap:
+            for directive in self.iter_directives_mmap(skip_ignored):
+                yield directive
+            return
+        with open(self.test_config) as config:
+            for line_number, line in enumerate(config, 1):
+                is_directive = get_directive(line)
+                if is_directive:
+                    if skip_ignored and is_directive[0] in IGNORED_DIRECTIVES:
+                        continue
+                    yield line_number, is_directive[0], is_directive[1]
+                else:
+                    yield line_number, None, line
+
+    def iter_directives_mmap(self, skip_ignored=False):
+        """Generate (line number, directive type, directive args) by matching the
+        lexer directly over a memory-mapped config file (no string per line)
+        :param skip_ignored leave out blank lines and comments"""
+        with open(self.test_config, 'rb') as config:
+            if os.fstat(config.fileno()).st_size == 0:
+                return
+            buf = mmap.mmap(config.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                size = len(buf)
+                line_number = 0
+                for match in LINE_SCANNER.finditer(buf):
+                    if match.start() == size:
+                        break
+                    line_number += 1
+                    directive_type = match.lastgroup
+                    if directive_type == 'UNKNOWN':
+                        yield line_number, None, match.group()
+                    elif not skip_ignored or directive_type not in IGNORED_DIRECTIVES:
+                        yield line_number, directive_type, \
+                              dict([(arg, match.group(arg)) for arg in LEXER_ARGS[directive_type]])
+            finally:
+                buf.close()
 
     def check_directives(self):
         """Get a list of directives"""
-        config = open(self.test_config)
-        directive_list = []
-        for line in config:
-            directive_list.append(get_directive(line))
-        return directive_list
+        return [(directive_type, directive_args) if directive_type else None \
+                for _, directive_type, directive_args in self.iter_directives()]
+
+    def iter_tests(self):
+        """Generate tests one at a time (single pass, constant memory)
+        Config errors are reported with their line number (see self.errors)"""
+        self.errors = []
+        self.variables = {}
+        self.test_line = None
+        if self.cache is None:
+            for test in self.parse_tests():
+                yield test
+            return
+        cache_key = self.cache.get_key(self.test_config)
+        events = self.cache.load(cache_key)
+        if events is not None:
+            for test in self.replay_tests(events):
+                yield test
+            return
+        self.cache_entry = self.cache.create(cache_key)
+        try:
+            for test in self.parse_tests():
+                yield test
+        except:
+            self.cache_entry.discard()
+            raise
+        else:
+            self.cache_added += self.cache.store(self.cache_entry)
+            if self.evict_cache:
+                self.cache.evict()
+        finally:
+            self.cache_entry = None
+
+    def replay_tests(self, events):
+        """Generate tests from cached parser events
+        :param events cached events"""
+        for event in events:
+            if event[0] == 'test':
+                _, self.test_line, test_id, steps = event
+                test = CustomTest()
+                test.set_id(test_id)
+                for step_id, description, expected_result in steps:
+                    test.append_test_step(TestStep(step_id, description, expected_result), \
+                                          adopt=True)
+                yield test
+            elif event[0] == 'error':
+                self.report_error(event[1], event[2])
+            elif event[0] == 'name':
+                self.tspec_name = event[1]
+            elif event[0] == 'assign':
+                self.variables[event[1]] = event[2]
+
+    def substitute(self, directive_args, variables):
+        """Replace loop variables in the directive arguments
+        :param directive_args directive arguments
+        :param variables loop variables"""
+        replace = lambda match: variables.get(match.group(1), match.group(0))
+        return dict([(arg, LOOP_VARIABLE.sub(replace, value) if value else value) \
+                     for arg, value in directive_args.iteritems()])
+
+    def read_loop_body(self, directives, line_number):
+        """Read the directives of a FOREACH loop (up to the matching END_FOREACH)
+        :param directives directive iterator
+        :param line_number FOREACH line number"""
+        body = []
+        depth = 1
+        for directive in directives:
+            if directive[1] == "FOREACH":
+                depth += 1
+            elif directive[1] == "END_FOREACH":
+                depth -= 1
+                if depth == 0:
+                    return body
+            body.append(directive)
+        self.report_error(line_number, "Missing END_FOREACH")
+        return body
+
+    def parse_loop(self, line_number, directive_args):
+        """Get the variables and rows of a FOREACH loop, e.g.
+        FOREACH calculator, price IN Casio, 100; Texas Instruments, 200
+        :param line_number FOREACH line number
+        :param directive_args FOREACH arguments"""
+        loop_vars = [var.strip() for var in directive_args['loop_vars'].split(',')]
+        loop_rows = []
+        for row in directive_args['loop_values'].split(';'):
+            values = [value.strip() for value in row.split(',')]
+            if len(values) != len(loop_vars):
+                self.report_error(line_number, "Expected %d values for (%s), got '%s'", \
+                                  len(loop_vars), ", ".join(loop_vars), row.strip())
+                return loop_vars, []
+            loop_rows.append(values)
+        return loop_vars, loop_rows
+
+    def expand_directives(self, directives, variables, include_stack):
+        """Expand FOREACH loops and INCLUDE directives lazily (only one loop
+        body per nesting level is kept in memory, never the combinations)
+        :param directives directive iterator
+        :param variables loop variables
+        :param include_stack config files being included (innermost last)"""
+        source = include_stack[-1]
+        directives = iter(directives)
+        for line_number, directive_type, directive_args in directives:
+            self.source = source
+            if variables and directive_type is not None:
+                directive_args = self.substitute(directive_args, variables)
+            if directive_type == "FOREACH":
+                body = self.read_loop_body(directives, line_number)
+                loop_vars, loop_rows = self.parse_loop(line_number, directive_args)
+                for row in loop_rows:
+                    loop_variables = dict(variables)
+                    loop_variables.update(zip(loop_vars, row))
+                    for directive in self.expand_directives(body, loop_variables, include_stack):
+                        yield directive
+            elif directive_type == "END_FOREACH":
+                self.report_error(line_number, "END_FOREACH without FOREACH")
+            elif directive_type == "INCLUDE":
+                include_path = os.path.join(os.path.dirname(source), \
+                                            directive_args['include_path'].strip())
+                if os.path.abspath(include_path) in map(os.path.abspath, include_stack):
+                    self.report_error(line_number, "Recursive INCLUDE of '%s'", include_path)
+                elif not os.path.isfile(include_path):
+                    self.report_error(line_number, "Unable to INCLUDE '%s'", include_path)
+                else:
+                    if self.cache_entry is not None:
+                        self.cache_entry.add_dependency(include_path)
+                    included = TestSpecConfigParser(include_path, use_mmap=self.use_mmap)
+                    for directive in self.expand_directives(included.iter_directives(True), \
+                                                            variables, \
+                                                            include_stack + [include_path]):
+                        yield directive
+            else:
+                yield line_number, directive_type, directive_args
+
+    def parse_tests(self):
+        """Generate tests from the config file (tests with a duplicated test ID
+        are reported and left out)"""
+        temp_test = None
+        temp_step = None
+        test_line = None
+        duplicated = False
+        # test ID -> (config file, line number), only the IDs are kept in memory
+        test_locations = {}
+        for line_number, directive_type, directive_args in \
+                self.expand_directives(self.iter_directives(True), {}, [self.test_config]):
+            if directive_type is None:
+                self.report_error(line_number, "Unknown directive '%s'", directive_args.strip())
+            elif directive_type in ["BLANK_LINE", "COMMENT"]:
+                pass # ignore
+            elif directive_type == "TSPEC_NAME":
+                self.tspec_name = directive_args['name']
+                if self.cache_entry is not None:
+                    self.cache_entry.record('name', self.tspec_name)
+            elif directive_type == "ASSIGNMENT":
+                self.variables[directive_args['var']] = directive_args['value']
+                if self.cache_entry is not None:
+                    self.cache_entry.record('assign', directive_args['var'], \
+                                            directive_args['value'])
+            elif directive_type == "START_TEST":
+                if temp_test is not None:
+                    self.report_error(line_number, "Missing END_TEST for test '%s' (line %d)", \
+                                      temp_test.get_id(), test_line)
+                temp_test = CustomTest()
+                temp_test.set_id(directive_args['test_id'])
+                temp_test.translate_name()
+                test_line = line_number
+                location = test_locations.get(temp_test.get_id())
+                duplicated = location is not None
+                if duplicated:
+                    self.report_error(line_number, \
+                                      "Duplicated test ID '%s' (first defined at %s:%d)", \
+                                      temp_test.get_id(), location[0], location[1])
+                else:
+                    test_locations[temp_test.get_id()] = (self.source, line_number)
+            elif directive_type == "END_TEST":
+                if temp_test is None:
+                    self.report_error(line_number, "END_TEST without START_TEST")
+                elif not duplicated:
+                    self.test_line = test_line
+                    if self.cache_entry is not None:
+                        self.cache_entry.record('test', test_line, temp_test.get_id(), \
+                                                [(step.step_id, step.description, \
+                                                  step.expected_result) \
+                                                 for step in temp_test.get_test_steps()])
+                    yield temp_test
+                temp_test = None
+            elif directive_type == "START_STEP":
+                if temp_test is None:
+                    self.report_error(line_number, "START_STEP outside of a test")
+                temp_step = TestStep(str(directive_args['step_id']))
+            elif temp_step is None:
+                self.report_error(line_number, "%s outside of a step", directive_type)
+            elif directive_type == "DESCRIPTION":
+                temp_step.set_description(directive_args['description'])
+            elif directive_type == "RESULT":
+                temp_step.set_expected_result(directive_args['result'])
+            elif directive_type == "END_STEP":
+                if isinstance(temp_test, CustomTest):
+                    temp_test.append_test_step(temp_step, adopt=True)
+                temp_step = None
+        if temp_test is not None:
+            self.source = None
+            self.report_error(test_line, "Missing END_TEST for test '%s'", temp_test.get_id())
+        self.source = None
 
     def validate_config(self):
-        """Validate directives"""
-        directive_list = [directive[0] for directive in self.check_directives()]
-        return directive_list
+        """Validate directives (same single pass as generate_tspec)
+        :return True if the config has no errors"""
+        for _ in self.iter_tests():
+            pass
+        return len(self.errors) == 0
 
     def generate_tspec(self):
         """Generate test spec from config file"""
-        config = open(self.test_config)
         tspec = TestSpec()
-        # Get TestSpec info
-        temp_test = None
-        temp_step = None
-        for line in config:
-            # debug
-            is_directive = get_directive(line)
-            if is_directive:
-                directive_type = is_directive[0]
-                directive_args = is_directive[1]
-                if directive_type in ["BLANK_LINE", "COMMENT"]:
-                    pass # ignore
-                elif directive_type == "TSPEC_NAME":
-                    tspec.set_name(directive_args['name'])
-                elif directive_type == "ASSIGNMENT":
-                    setattr(self, directive_args['var'], directive_args['value'])
-                elif directive_type == "START_TEST":
-                    temp_test = CustomTest()
-                    temp_test.set_id(directive_args['test_id'])
-                    temp_test.translate_name()
-                elif directive_type == "END_TEST":
-                    tspec.add_test(copy(temp_test))
-                    temp_test = None
-                elif directive_type == "START_STEP":
-                    temp_step = TestStep(str(directive_args['step_id']))
-                elif directive_type == "DESCRIPTION":
-                    temp_step.set_description(directive_args['description'])
-                elif directive_type == "RESULT":
-                    temp_step.set_expected_result(directive_args['result'])
-                elif directive_type == "END_STEP":
-                    if isinstance(temp_test, CustomTest):
-                        temp_test.append_test_step(copy(temp_step))
-                    temp_step = None
+        for test in self.iter_tests():
+            tspec.add_test(test, adopt=True)
+        if self.tspec_name is not None:
+            tspec.set_name(self.tspec_name)
+        return tspec
+
+    def generate_csv(self, csv_path="./tspec.csv", delimiter=','):
+        """Stream tests from config file to a CSV file (constant memory)
+        :param csv_path new tspec csv path
+        :param delimiter csv delimiter"""
+        with TestSpecWriter(csv_path, delimiter) as writer:
+            for test in self.iter_tests():
+                writer.add_test(test)
+        return len(self.errors) == 0
+
+
+def parse_config_file(args):
+    """Parse a config file (process pool worker)
+    :param args (config file path, TestSpecConfigCache object or None)
+    :return (tspec name, [(line number, test), ...], [(line number, error), ...],
+    size of the new cache entry)"""
+    test_config, cache = args
+    parser = TestSpecConfigParser(test_config, cache, evict_cache=False)
+    tests = []
+    for test in parser.iter_tests():
+        tests.append((parser.test_line, test))
+    return parser.tspec_name, tests, parser.errors, parser.cache_added
+
+class TestSpecConfigDirParser(object):
+    """TestSpecConfigDirParser Class
+    Parses a directory of config files in a process pool and merges them
+    into a single test spec (files are merged in sorted path order)"""
+    def __init__(self, config_dir, pattern="*.tspec", cache=None):
+        """TestSpecConfigDirParser Constructor
+        :param config_dir config files directory (searched recursively)
+        :param pattern config file name pattern
+        :param cache TestSpecConfigCache object (optional)"""
+        self.config_dir = config_dir
+        self.pattern = pattern
+        self.cache = cache
+        self.errors = []
+
+    def get_config_paths(self):
+        """Get the (sorted) list of config files"""
+        config_paths = []
+        for root, _, file_names in os.walk(self.config_dir):
+            for file_name in file_names:
+                if fnmatch(file_name, self.pattern):
+                    config_paths.append(os.path.join(root, file_name))
+        return sorted(config_paths)
+
+    def report_error(self, test_config, line_number, message, *args):
+        """Log (and keep) a config error
+        :param test_config config file path
+        :param line_number config file line number
+        :param message error message"""
+        message = message % args
+        logging.error("%s:%d: %s", test_config, line_number, message)
+        self.errors.append((test_config, line_number, message))
+
+    def generate_tspec(self, processes=None):
+        """Generate test spec from all config files
+        :param processes number of worker processes (default: cpu count)"""
+        self.errors = []
+        config_paths = self.get_config_paths()
+        tspec = TestSpec()
+        test_locations = {}
+        pool = Pool(processes or cpu_count())
+        try:
+            # imap returns the results in config path order
+            for test_config, (tspec_name, tests, errors, cache_added) in \
+                    zip(config_paths, pool.imap(parse_config_file, \
+                                                [(path, self.cache) for path in config_paths])):
+                for line_number, message in errors:
+                    self.errors.append((test_config, line_number, message))
+                if self.cache is not None:
+                    self.cache.add_size(cache_added)
+                if tspec_name is not None and tspec.get_name() == DEFAULT_TEST_SPEC_NAME:
+                    tspec.set_name(tspec_name)
+                for line_number, test in tests:
+                    location = test_locations.get(test.get_id())
+                    if location is not None:
+                        self.report_error(test_config, line_number, \
+                                          "Duplicated test ID '%s' (first defined at %s:%d)", \
+                                          test.get_id(), location[0], location[1])
+                        continue
+                    test_locations[test.get_id()] = (test_config, line_number)
+                    tspec.add_test(test, adopt=True)
+        finally:
+            pool.close()
+            pool.join()
+        if self.cache is not None:
+            self.cache.evict()
         return tspec
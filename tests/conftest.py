@@ -9,4 +9,10 @@
 """
 from __future__ import print_function, absolute_import, division
 
+import os
+import sys
 import pytest
+
+# Experimental modules (tspec_config_parser, qc_connector, qc_simulator)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                                os.pardir, "experimental"))
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 """TSpec Tests"""
 
+import csv
+import copy
 import pytest
 import tspec
 
@@ -62,3 +64,346 @@ def test_teststep_reset():
     test_step.reset()
     assert test_step.get_description() == tspec.DEFAULT_STEP_DESCRIPTION
     assert test_step.get_expected_result() == tspec.DEFAULT_STEP_EXPECTED_RESULT
+
+def test_basictest_step_id_index():
+    """BasicTest Step ID Index"""
+    basic_test = tspec.BasicTest("Dummy")
+    for step_id in range(1, 4):
+        basic_test.add_step(step_id)
+    assert basic_test.validate_step_id(4)
+    assert not basic_test.validate_step_id(2)
+    basic_test.insert_test_step(tspec.TestStep(0), 0)
+    assert [step.get_id() for step in basic_test.get_test_steps()] == [0, 1, 2, 3]
+    assert basic_test.get_step_index() == {0: 0, 1: 1, 2: 2, 3: 3}
+    basic_test.remove_test_step_by_id(0)
+    assert basic_test.get_step_index() == {1: 0, 2: 1, 3: 2}
+    basic_test.move_test_step_by_id(3, 0)
+    assert [step.get_id() for step in basic_test.get_test_steps()] == [3, 1, 2]
+    assert basic_test.get_test_step_by_id(2).get_id() == 2
+    basic_test.move_test_step_by_index(0, -1)
+    assert basic_test.get_step_index() == {1: 0, 2: 1, 3: 2}
+    assert basic_test.get_test_step_by_id(4) is None
+
+def test_basictest_step_id_index_rename():
+    """BasicTest Step ID Index (renamed steps)"""
+    basic_test = tspec.BasicTest("Dummy")
+    for step_id in range(1, 4):
+        basic_test.add_step(step_id)
+    basic_test.get_test_step_by_index(0).set_id(5)
+    assert not basic_test.validate_step_id(5)
+    assert basic_test.get_test_step_by_id(5).get_id() == 5
+    assert basic_test.get_test_step_by_id(1) is None
+    basic_test.add_step(1)
+    assert [step.get_id() for step in basic_test.get_test_steps()] == [5, 2, 3, 1]
+    basic_test.get_test_steps()[1].step_id = 6
+    assert basic_test.get_step_index() == {5: 0, 6: 1, 3: 2, 1: 3}
+
+def test_basictest_step_id_index_scope():
+    """BasicTest Step ID Index (renames only invalidate the owning test)"""
+    basic_test = tspec.BasicTest("Dummy")
+    other_test = tspec.BasicTest("Other")
+    for step_id in range(3):
+        basic_test.add_step(step_id)
+        other_test.add_step(step_id)
+    step_index = basic_test.get_step_index()
+    test_step = tspec.TestStep()
+    test_step.set_id(3)
+    other_test.get_test_step_by_index(0).set_id(4)
+    basic_test.append_test_step(test_step)
+    assert basic_test.get_step_index() is step_index
+    assert basic_test.step_index_version == basic_test.steps.version
+    assert other_test.step_index_version is None
+    assert other_test.get_step_index() == {4: 0, 1: 1, 2: 2}
+
+def test_basictest_step_id_index_direct_changes():
+    """BasicTest Step ID Index (list of steps changed directly)"""
+    basic_test = tspec.BasicTest("Dummy")
+    for step_id in range(3):
+        basic_test.add_step(step_id)
+    basic_test.steps[0] = tspec.TestStep(9)
+    assert not basic_test.validate_step_id(9)
+    assert basic_test.validate_step_id(0)
+    basic_test.get_test_steps().reverse()
+    assert basic_test.get_test_step_by_id(9).get_id() == 9
+    assert basic_test.get_step_index() == {2: 0, 1: 1, 9: 2}
+    # Step shared with another test (adopt=True) renamed through the other test
+    other_test = tspec.BasicTest("Other")
+    other_test.append_test_step(basic_test.get_test_step_by_index(0), adopt=True)
+    other_test.get_test_step_by_index(0).set_id(5)
+    assert basic_test.get_test_step_by_id(2) is None
+    assert basic_test.get_test_step_by_id(5).get_id() == 5
+    # Copies keep their own index
+    test_copy = copy.deepcopy(basic_test)
+    test_copy.get_test_step_by_index(0).set_id(6)
+    assert test_copy.get_test_step_by_id(6).get_id() == 6
+    assert basic_test.get_test_step_by_id(6) is None
+
+def test_testspec_test_id_index():
+    """TestSpec Test ID Index"""
+    test_spec = tspec.TestSpec()
+    for test_id in ("A", "B", "C"):
+        test_spec.add_test(tspec.BasicTest(test_id))
+    test_spec.add_test(tspec.BasicTest("B"))
+    assert len(test_spec.tests) == 3
+    assert test_spec.get_test_by_id("B").get_id() == "B"
+    test_spec.remove_test_by_id("A")
+    assert test_spec.test_index == {"B": 0, "C": 1}
+    test_spec.get_test_by_id("C").set_id("D")
+    assert test_spec.get_test_by_id("C") is None
+    assert test_spec.get_test_by_id("D").get_id() == "D"
+    test_spec.get_test_by_id("D").set_id("B")
+    assert test_spec.get_test_by_id("D").get_id() == "D"
+    test_spec.remove_test_by_index(0)
+    assert test_spec.test_index == {"D": 0}
+    assert test_spec.validate_test_id("B")
+
+def test_testspec_convert_to_csv(tmpdir):
+    """TestSpec Convert to CSV"""
+    test_spec = tspec.TestSpec()
+    for test_id in ("A", "B"):
+        test = tspec.QCTest("Subject", "Level", "Area")
+        test.set_id(test_id)
+        test.add_step(1, "Description 1", "Result 1")
+        test.add_step(2, "Description 2", "Result 2")
+        test_spec.add_test(test)
+    csv_path = str(tmpdir.join("tspec.csv"))
+    test_spec.convert_to_csv(csv_path)
+    with open(csv_path) as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == tspec.CSV_CORE_COLUMNS + ['is_automated', 'test_area', \
+                                                'test_level', 'test_subject']
+    assert rows[1] == ['A', '1', 'Description 1', 'Result 1', 'False', 'Area', 'Level', 'Subject']
+    assert rows[2] == ['', '2', 'Description 2', 'Result 2', '', '', '', '']
+    assert rows[3][0] == 'B'
+    assert len(rows) == 5
+
+def test_testspecwriter(tmpdir):
+    """TestSpecWriter Streaming Export"""
+    test_spec = tspec.TestSpec()
+    spec_path = str(tmpdir.join("tspec.csv"))
+    writer_path = str(tmpdir.join("writer.csv"))
+    with tspec.TestSpecWriter(writer_path) as writer:
+        for test_id in ("A", "B", "A"):
+            test = tspec.BasicTest(test_id)
+            test.add_step(1, "Description", "Result")
+            writer.add_test(test)
+            test_spec.add_test(test)
+        writer.add_test(tspec.QCTest())
+        assert writer.test_ids == set(["A", "B"])
+    test_spec.convert_to_csv(spec_path)
+    assert open(writer_path).read() == open(spec_path).read()
+
+def test_teststep_custom_attributes():
+    """TestStep Custom Attributes"""
+    test_step = tspec.TestStep(1, owner="John")
+    assert not hasattr(test_step, '__dict__')
+    assert test_step.owner == "John"
+    test_step.priority = 1
+    assert test_step.get_extras() == {'owner': "John", 'priority': 1}
+    step_copy = copy.copy(test_step)
+    step_copy.priority = 2
+    assert test_step.priority == 1
+    with pytest.raises(AttributeError):
+        tspec.TestStep().owner
+    test_step = tspec.TestStep(1, extras="Extra")
+    assert test_step.extras == "Extra"
+    test_step.extras = 5
+    assert test_step.get_extras() == {'extras': 5}
+
+def failing_batch(items):
+    """Generate a batch of items, then fail"""
+    for item in items:
+        yield item
+    raise ValueError("Batch failed")
+
+def test_basictest_append_test_steps():
+    """BasicTest Append Test Steps (batch)"""
+    basic_test = tspec.BasicTest("Dummy")
+    assert basic_test.append_test_steps(tspec.TestStep(idx) for idx in range(3))
+    assert not basic_test.append_test_steps([tspec.TestStep(3), tspec.TestStep(3)])
+    assert not basic_test.append_test_steps([tspec.TestStep(3), "4"])
+    assert not basic_test.append_test_steps(tspec.TestStep(3))
+    assert basic_test.get_step_index() == {0: 0, 1: 1, 2: 2}
+    with pytest.raises(ValueError):
+        basic_test.append_test_steps(failing_batch([tspec.TestStep(3), tspec.TestStep(4)]))
+    assert [step.get_id() for step in basic_test.get_test_steps()] == [0, 1, 2]
+    assert basic_test.get_step_index() == {0: 0, 1: 1, 2: 2}
+    assert basic_test.validate_step_id(3)
+
+def test_testspec_add_tests():
+    """TestSpec Add Tests (batch)"""
+    test_spec = tspec.TestSpec()
+    assert test_spec.add_tests(tspec.BasicTest(str(idx)) for idx in range(3))
+    assert not test_spec.add_tests([tspec.BasicTest("3"), tspec.BasicTest("3")])
+    assert not test_spec.add_tests([tspec.BasicTest("3"), tspec.QCTest()])
+    assert test_spec.test_index == {"0": 0, "1": 1, "2": 2}
+    assert len(test_spec.tests) == 3
+    with pytest.raises(ValueError):
+        test_spec.add_tests(failing_batch([tspec.BasicTest("a"), tspec.BasicTest("b")]))
+    assert [test.get_id() for test in test_spec.get_tests()] == ["0", "1", "2"]
+    assert test_spec.test_index == {"0": 0, "1": 1, "2": 2}
+
+def test_adopt_mode():
+    """Zero-copy (adopt) mode"""
+    shared_step = tspec.TestStep(1, "Shared Description", "Shared Result")
+    test_spec = tspec.TestSpec()
+    for test_id in ("A", "B"):
+        test = tspec.BasicTest(test_id)
+        test.append_test_step(shared_step, adopt=True)
+        test_spec.add_test(test, adopt=True)
+        assert test_spec.get_test_by_id(test_id) is test
+    assert test_spec.tests[0].steps[0] is test_spec.tests[1].steps[0]
+    test_spec.tests[0].set_id("B")
+    assert test_spec.tests[0].get_id() == "A"
+    test_spec.tests[0].insert_test_step(tspec.TestStep(0), 0)
+    test_spec.tests[0].move_test_step_by_id(0, 1)
+    assert test_spec.tests[0].steps[0] is shared_step
+    # Tests owned by another spec are copied
+    other_spec = tspec.TestSpec()
+    other_spec.add_test(test_spec.tests[0], adopt=True)
+    assert other_spec.tests[0] is not test_spec.tests[0]
+    test_spec.tests[0].set_id("C")
+    assert test_spec.get_test_by_id("A") is None
+    assert other_spec.get_test_by_id("A").get_id() == "A"
+
+SUBJECTS = ("John", "Paul", "Ringo", "George")
+CALCULATOR_BRAND_PRICES = (("Casio", "100"), ("Texas Instruments", "200"))
+
+def test_testtemplate(tmpdir):
+    """TestTemplate Lazy Rendering"""
+    test_spec = tspec.TestSpec()
+    for subject in SUBJECTS:
+        for (calculator, price) in CALCULATOR_BRAND_PRICES:
+            test = tspec.BasicTest("%s_%s" % (subject, calculator))
+            test.translate_name()
+            test.add_step(1, "%s goes into the store" % subject, "%s is inside the store" % subject)
+            test.add_step(2, "%s buys a %s calculator" % (subject, calculator), \
+                             "The calculator costs %s" % price)
+            test_spec.add_test(test)
+    template = tspec.TestTemplate("{subject}_{calculator}", \
+                                  [("{subject} goes into the store", "{subject} is inside the store"), \
+                                   ("{subject} buys a {calculator} calculator", \
+                                    "The calculator costs {price}")], \
+                                  [("subject", SUBJECTS), \
+                                   (("calculator", "price"), CALCULATOR_BRAND_PRICES)])
+    template_spec = tspec.TestSpec()
+    assert template_spec.add_template(template)
+    assert template_spec.count_tests() == 8
+    assert template.has_test_id("Ringo_Texas_Instruments")
+    assert not template.has_test_id("Ringo_Texas Instruments")
+    assert template_spec.get_test_by_id("Paul_Casio").steps[1].get_description() == \
+           "Paul buys a Casio calculator"
+    spec_path = str(tmpdir.join("tspec.csv"))
+    template_path = str(tmpdir.join("template.csv"))
+    test_spec.convert_to_csv(spec_path)
+    template_spec.convert_to_csv(template_path)
+    assert open(spec_path).read() == open(template_path).read()
+    # Test ID collisions
+    template_spec.add_test(tspec.BasicTest("John_Casio"))
+    assert template_spec.count_tests() == 8
+    assert not template_spec.add_template(template)
+    assert not tspec.TestSpec().add_template(tspec.TestTemplate("{subject}", [], \
+                                             [("subject", SUBJECTS), ("other", (1, 2))]))
+    # Indexed fields and fields that are not parameters
+    indexed_template = tspec.TestTemplate("{calculator[0]}_{calculator[1]}", [], \
+                                          [("calculator", CALCULATOR_BRAND_PRICES)])
+    assert tspec.TestSpec().add_template(indexed_template)
+    assert indexed_template.parse_id("Texas_Instruments_200") == (1,)
+    assert not tspec.TestSpec().add_template(tspec.TestTemplate("{other}", [], \
+                                                                [("subject", SUBJECTS)]))
+
+def test_testspec_convert_to_csv_parallel(tmpdir):
+    """TestSpec Convert to CSV (parallel)"""
+    test_spec = tspec.TestSpec()
+    for idx in range(25):
+        test = tspec.QCTest("Subject", "Level %d" % idx, "Area, \"quoted\"")
+        test.set_id("Test_%d" % idx)
+        for step_id in range(idx % 4):
+            test.add_step(step_id, "Description %d" % step_id)
+        test_spec.add_test(test)
+    test_spec.add_template(tspec.TestTemplate("Template_{idx}", [("Step {idx}", "Result")], \
+                                              [("idx", range(5))], tspec.QCTest, \
+                                              test_subject="Subject", test_level="Level {idx}", \
+                                              test_area="Area", is_automated=False))
+    serial_path = str(tmpdir.join("serial.csv"))
+    parallel_path = str(tmpdir.join("parallel.csv"))
+    test_spec.convert_to_csv(serial_path)
+    assert test_spec.convert_to_csv_parallel(parallel_path, processes=2, shard_size=3) == \
+           [parallel_path]
+    assert open(serial_path).read() == open(parallel_path).read()
+    shard_paths = test_spec.convert_to_csv_parallel(parallel_path, processes=2, \
+                                                    shard_size=3, merge=False)
+    assert len(shard_paths) == 11
+    assert "".join([open(path).read() for path in shard_paths]) == open(serial_path).read()
+
+def test_testspec_from_csv(tmpdir):
+    """TestSpec From CSV"""
+    test_spec = tspec.TestSpec()
+    for test_id in ("A", "B"):
+        test = tspec.QCTest("Subject", "Level, 1", "Area")
+        test.set_id(test_id)
+        test.add_step("1", "Description 1", "Result 1")
+        test.add_step("2", "Description\n2", "Result 2")
+        test_spec.add_test(test)
+    csv_path = str(tmpdir.join("tspec.csv"))
+    copy_path = str(tmpdir.join("copy.csv"))
+    test_spec.convert_to_csv(csv_path)
+    csv_spec = tspec.TestSpec.from_csv(csv_path, name="Copy")
+    assert csv_spec.get_name() == "Copy"
+    assert [test.get_id() for test in csv_spec.tests] == ["A", "B"]
+    assert isinstance(csv_spec.tests[0], tspec.CustomTest)
+    assert csv_spec.get_test_by_id("B").test_level == "Level, 1"
+    assert csv_spec.get_test_by_id("B").get_test_step_by_id("2").get_description() == \
+           "Description\n2"
+    csv_spec.convert_to_csv(copy_path)
+    assert open(csv_path).read() == open(copy_path).read()
+    # Duplicated test IDs and unexpected columns
+    with open(copy_path, 'a') as csv_file:
+        csv_file.write("A,1,Description,Result,,,,\n")
+    assert tspec.TestSpec.from_csv(copy_path) is None
+    with open(copy_path, 'w') as csv_file:
+        csv_file.write("id,description\n")
+    assert tspec.TestSpec.from_csv(copy_path) is None
+    with pytest.raises(ValueError):
+        list(tspec.read_csv_tests(copy_path))
+
+def test_sqlitetestspec(tmpdir):
+    """SQLiteTestSpec Store"""
+    db_path = str(tmpdir.join("tspec.db"))
+    test_spec = tspec.TestSpec("Memory")
+    sqlite_spec = tspec.SQLiteTestSpec("SQLite", db_path)
+    for idx in range(6):
+        test = tspec.QCTest("Subject", "Level %d" % idx, "Area", idx % 2 == 0)
+        test.set_id("Test_%d" % idx)
+        test.add_step(1, "Description %d" % idx, "Result")
+        test.append_test_step(tspec.TestStep("2", owner="John"))
+        test_spec.add_test(test)
+        sqlite_spec.add_test(test)
+    sqlite_spec.add_test(test)
+    assert not sqlite_spec.add_tests([tspec.QCTest(), tspec.BasicTest("Other")])
+    assert sqlite_spec.count_tests() == 6
+    new_test = tspec.QCTest("Subject")
+    new_test.set_id("Test_6")
+    with pytest.raises(ValueError):
+        sqlite_spec.add_tests(failing_batch([new_test]))
+    sqlite_spec.add_test(test)
+    assert sqlite_spec.count_tests() == 6
+    for spec in (test_spec, sqlite_spec):
+        spec.remove_test_by_id("Test_0")
+        spec.remove_test_by_index(-1)
+        spec.get_test_by_id("Test_3").set_id("Test_1")
+        spec.get_test_by_id("Test_3").set_id("Test_33")
+    sqlite_spec.close()
+    sqlite_spec = tspec.SQLiteTestSpec(db_path=db_path)
+    assert sqlite_spec.get_name() == "SQLite"
+    assert [test.get_id() for test in sqlite_spec.iter_tests()] == \
+           ["Test_1", "Test_2", "Test_33", "Test_4"]
+    assert sqlite_spec.get_test_by_id("Test_2").steps[1].owner == "John"
+    memory_path = str(tmpdir.join("memory.csv"))
+    sqlite_path = str(tmpdir.join("sqlite.csv"))
+    test_spec.convert_to_csv(memory_path)
+    sqlite_spec.convert_to_csv(sqlite_path)
+    assert open(memory_path).read() == open(sqlite_path).read()
+    sqlite_spec.convert_to_csv_parallel(sqlite_path, processes=2, shard_size=1)
+    assert open(memory_path).read() == open(sqlite_path).read()
+    sqlite_spec.close()
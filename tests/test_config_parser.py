@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""TSpec Config Parser Tests"""
+
+import pytest
+import tspec_config_parser
+
+__author__ = "João Galego"
+__copyright__ = "João Galego (2017)"
+__license__ = "none"
+
+def write_config(tmpdir, name, lines):
+    """Write a config file
+    :param tmpdir pytest tmpdir
+    :param name config file name
+    :param lines config lines"""
+    config = tmpdir.join(name)
+    config.write("\n".join(lines) + "\n")
+    return str(config)
+
+def get_steps(test):
+    """Get the (ID, description, expected result) of the steps of a test"""
+    return [(step.get_id(), step.get_description(), step.get_expected_result()) \
+            for step in test.get_test_steps()]
+
+def test_get_directive_indented():
+    """Indented directives and whitespace-only lines"""
+    assert tspec_config_parser.get_directive("\n")[0] == "BLANK_LINE"
+    assert tspec_config_parser.get_directive(" \t \n")[0] == "BLANK_LINE"
+    assert tspec_config_parser.get_directive("    START_STEP 1\n") == \
+           ("START_STEP", {'step_id': "1"})
+    assert tspec_config_parser.get_directive("\tDESCRIPTION Wake up\n") == \
+           ("DESCRIPTION", {'description': "Wake up"})
+    assert tspec_config_parser.get_directive("  Wake up\n") is None
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_parser_indented_config(tmpdir, use_mmap):
+    """Indented config (line and mmap modes)"""
+    test_config = write_config(tmpdir, "indented.tspec", \
+                               ["TSPEC Indented",
+                                "START_TEST Indented Test",
+                                "    START_STEP 1",
+                                "        DESCRIPTION Wake up",
+                                "        RESULT Subject is awake",
+                                "    END_STEP",
+                                "  \t",
+                                "    Get out of bed",
+                                "END_TEST"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, use_mmap=use_mmap)
+    test_spec = parser.generate_tspec()
+    assert test_spec.get_name() == "Indented"
+    tests = test_spec.get_tests()
+    assert [test.get_id() for test in tests] == ["Indented_Test"]
+    assert get_steps(tests[0]) == [("1", "Wake up", "Subject is awake")]
+    assert [line_number for line_number, _ in parser.errors] == [8]
+    assert not parser.validate_config()
+
+def test_parser_duplicated_test_id(tmpdir):
+    """Duplicated test IDs (validate_config, generate_tspec and generate_csv agree)"""
+    test_config = write_config(tmpdir, "duplicated.tspec", \
+                               ["TSPEC Duplicated",
+                                "START_TEST Test 1",
+                                "END_TEST",
+                                "START_TEST Test 1",
+                                "END_TEST",
+                                "START_TEST Test 2",
+                                "END_TEST"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config)
+    assert not parser.validate_config()
+    assert [line_number for line_number, _ in parser.errors] == [4]
+    test_spec = parser.generate_tspec()
+    assert [test.get_id() for test in test_spec.get_tests()] == ["Test_1", "Test_2"]
+    assert len(parser.errors) == 1
+    assert not parser.generate_csv(str(tmpdir.join("duplicated.csv")))
+    assert len(parser.errors) == 1
+
+def test_parser_variables(tmpdir):
+    """Config variables are kept apart from the parser attributes"""
+    test_config = write_config(tmpdir, "variables.tspec", \
+                               ["TSPEC Variables",
+                                "errors=1",
+                                "author=Galego",
+                                "START_TEST Test 1",
+                                "END_TEST"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config)
+    assert parser.validate_config()
+    assert parser.errors == []
+    assert parser.variables == {'errors': "1", 'author': "Galego"}
+    cache = tspec_config_parser.TestSpecConfigCache(str(tmpdir.join("cache")))
+    for _ in range(2):
+        parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+        assert parser.validate_config()
+        assert parser.variables == {'errors': "1", 'author': "Galego"}
+
+def test_dir_parser(tmpdir):
+    """Directory of config files (merged in path order, cross-file duplicates)"""
+    write_config(tmpdir, "a.tspec", ["TSPEC FeatureA",
+                                     "START_TEST Test 1",
+                                     "END_TEST",
+                                     "START_TEST Test 2",
+                                     "END_TEST"])
+    tmpdir.mkdir("b")
+    write_config(tmpdir, "b/b.tspec", ["TSPEC FeatureB",
+                                       "START_TEST Test 3",
+                                       "END_TEST",
+                                       "START_TEST Test 1",
+                                       "END_TEST"])
+    write_config(tmpdir, "c.txt", ["START_TEST Test 4",
+                                   "END_TEST"])
+    dir_parser = tspec_config_parser.TestSpecConfigDirParser(str(tmpdir))
+    test_spec = dir_parser.generate_tspec(2)
+    assert test_spec.get_name() == "FeatureA"
+    assert [test.get_id() for test in test_spec.get_tests()] == ["Test_1", "Test_2", "Test_3"]
+    assert [(test_config, line_number) for test_config, line_number, _ in dir_parser.errors] == \
+           [(str(tmpdir.join("b", "b.tspec")), 4)]
+
+def test_parser_cache(tmpdir, monkeypatch):
+    """Cached config (replayed tests and errors, invalidated on change)"""
+    lines = ["TSPEC Cached",
+             "START_TEST Test 1",
+             "START_STEP 1",
+             "DESCRIPTION Wake up",
+             "RESULT Subject is awake",
+             "END_STEP",
+             "END_TEST",
+             "Get out of bed"]
+    test_config = write_config(tmpdir, "cached.tspec", lines)
+    cache = tspec_config_parser.TestSpecConfigCache(str(tmpdir.join("cache")))
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+    cold_tests = [(test.get_id(), get_steps(test)) for test in parser.iter_tests()]
+    cold_errors = parser.errors
+    assert cold_tests == [("Test_1", [("1", "Wake up", "Subject is awake")])]
+    assert len(cold_errors) == 1
+    assert len(tmpdir.join("cache").listdir()) == 1
+    # Warm run: the config file is not parsed again
+    parse_tests = tspec_config_parser.TestSpecConfigParser.parse_tests
+    monkeypatch.setattr(tspec_config_parser.TestSpecConfigParser, "parse_tests", None)
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+    assert [(test.get_id(), get_steps(test)) for test in parser.iter_tests()] == cold_tests
+    assert parser.errors == cold_errors
+    assert parser.tspec_name == "Cached"
+    # Changed config file
+    monkeypatch.setattr(tspec_config_parser.TestSpecConfigParser, "parse_tests", parse_tests)
+    test_config = write_config(tmpdir, "cached.tspec", lines[:-1])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+    assert parser.validate_config()
+    assert len(tmpdir.join("cache").listdir()) == 2
+
+def test_parser_cache_paths(tmpdir):
+    """Identical config files in different directories have their own entries"""
+    lines = ["START_TEST T", "END_TEST", "START_TEST T", "END_TEST"]
+    cache = tspec_config_parser.TestSpecConfigCache(str(tmpdir.join("cache")))
+    for config_dir in ("a", "b"):
+        tmpdir.mkdir(config_dir)
+        test_config = write_config(tmpdir, "%s/x.tspec" % config_dir, lines)
+        for _ in range(2):
+            parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+            assert not parser.validate_config()
+            assert parser.errors == \
+                   [(3, "Duplicated test ID 'T' (first defined at %s:1)" % test_config)]
+
+def test_parser_cache_evict(tmpdir):
+    """Least recently used cache entries are evicted"""
+    cache = tspec_config_parser.TestSpecConfigCache(str(tmpdir.join("cache")), max_size=0)
+    test_config = write_config(tmpdir, "evicted.tspec", ["START_TEST Test 1", "END_TEST"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+    assert parser.validate_config()
+    assert tmpdir.join("cache").listdir() == []
+
+@pytest.mark.parametrize("content", ["",
+                                     "\n",
+                                     "START_TEST Test 1\nEND_TEST",
+                                     "# Comment\r\nSTART_TEST Test 1\r\n\r\nEND_TEST\r\n",
+                                     "START_TEST Test 1\n\n\nUnknown\nEND_TEST\n\n"])
+def test_parser_mmap(tmpdir, content):
+    """Memory-mapped config file (same directives as the line mode)"""
+    config = tmpdir.join("mmap.tspec")
+    config.write(content)
+    line_parser = tspec_config_parser.TestSpecConfigParser(str(config))
+    mmap_parser = tspec_config_parser.TestSpecConfigParser(str(config), use_mmap=True)
+    assert list(mmap_parser.iter_directives(True)) == list(line_parser.iter_directives(True))
+    assert mmap_parser.check_directives() == line_parser.check_directives()
+    assert [test.get_id() for test in mmap_parser.iter_tests()] == \
+           [test.get_id() for test in line_parser.iter_tests()]
+    assert mmap_parser.errors == line_parser.errors
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_parser_foreach(tmpdir, use_mmap):
+    """Nested FOREACH loops"""
+    test_config = write_config(tmpdir, "foreach.tspec", \
+                               ["FOREACH subject IN Add; Sub",
+                                "  FOREACH calculator, price IN Casio, 100; Texas, 200",
+                                "    START_TEST {subject} {calculator}",
+                                "    START_STEP 1",
+                                "    DESCRIPTION {subject} on a {calculator} ({price})",
+                                "    RESULT {price}",
+                                "    END_STEP",
+                                "    END_TEST",
+                                "  END_FOREACH",
+                                "END_FOREACH"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, use_mmap=use_mmap)
+    tests = parser.generate_tspec().get_tests()
+    assert parser.errors == []
+    assert [test.get_id() for test in tests] == \
+           ["Add_Casio", "Add_Texas", "Sub_Casio", "Sub_Texas"]
+    assert get_steps(tests[3]) == [("1", "Sub on a Texas (200)", "200")]
+
+def test_parser_foreach_errors(tmpdir):
+    """FOREACH errors"""
+    test_config = write_config(tmpdir, "foreach.tspec", \
+                               ["FOREACH calculator, price IN Casio, 100; Texas",
+                                "START_TEST {calculator}",
+                                "END_TEST",
+                                "END_FOREACH",
+                                "END_FOREACH",
+                                "FOREACH calculator IN Casio",
+                                "START_TEST {calculator}",
+                                "END_TEST"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config)
+    assert [test.get_id() for test in parser.iter_tests()] == ["Casio"]
+    assert [line_number for line_number, _ in parser.errors] == [1, 5, 6]
+
+def test_parser_include(tmpdir):
+    """INCLUDE (relative to the including file, inside FOREACH loops)"""
+    tmpdir.mkdir("common")
+    write_config(tmpdir, "common/steps.tspec", \
+                 ["START_STEP 1",
+                  "DESCRIPTION Turn on the {calculator}",
+                  "RESULT {calculator} is on",
+                  "END_STEP",
+                  "Unknown"])
+    test_config = write_config(tmpdir, "include.tspec", \
+                               ["FOREACH calculator IN Casio; Texas",
+                                "START_TEST {calculator}",
+                                "INCLUDE common/steps.tspec",
+                                "END_TEST",
+                                "END_FOREACH",
+                                "INCLUDE missing.tspec"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config)
+    tests = parser.generate_tspec().get_tests()
+    assert [get_steps(test) for test in tests] == \
+           [[("1", "Turn on the Casio", "Casio is on")],
+            [("1", "Turn on the Texas", "Texas is on")]]
+    # Errors in the included file are reported once per inclusion
+    included_error = "%s:5" % tmpdir.join("common", "steps.tspec")
+    missing_error = "Unable to INCLUDE '%s'" % tmpdir.join("missing.tspec")
+    assert [message.split(": ")[0] for _, message in parser.errors] == \
+           [included_error, included_error, missing_error]
+
+def test_parser_recursive_include(tmpdir):
+    """Recursive INCLUDE"""
+    write_config(tmpdir, "a.tspec", ["INCLUDE b.tspec"])
+    write_config(tmpdir, "b.tspec", ["INCLUDE a.tspec"])
+    parser = tspec_config_parser.TestSpecConfigParser(str(tmpdir.join("a.tspec")))
+    assert not parser.validate_config()
+    assert len(parser.errors) == 1
+    assert "Recursive INCLUDE" in parser.errors[0][1]
+
+def test_parser_cache_include(tmpdir):
+    """Cached config is stale once an included config file changes"""
+    write_config(tmpdir, "steps.tspec", ["START_STEP 1", "END_STEP"])
+    test_config = write_config(tmpdir, "include.tspec", \
+                               ["START_TEST Test 1", "INCLUDE steps.tspec", "END_TEST"])
+    cache = tspec_config_parser.TestSpecConfigCache(str(tmpdir.join("cache")))
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+    assert [len(test.get_test_steps()) for test in parser.iter_tests()] == [1]
+    write_config(tmpdir, "steps.tspec", ["START_STEP 1", "END_STEP", "START_STEP 2", "END_STEP"])
+    parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+    assert [len(test.get_test_steps()) for test in parser.iter_tests()] == [2]
+
+def test_parser_cache_size(tmpdir, monkeypatch):
+    """Cache size accounting (entries and dependencies, scanned only when needed)"""
+    write_config(tmpdir, "steps.tspec", ["START_STEP 1", "END_STEP"])
+    cache_dir = tmpdir.join("cache")
+    cache = tspec_config_parser.TestSpecConfigCache(str(cache_dir))
+    listdir = tspec_config_parser.os.listdir
+    scans = []
+    def count_scans(path):
+        """Count cache directory scans"""
+        scans.append(path)
+        return listdir(path)
+    monkeypatch.setattr(tspec_config_parser.os, "listdir", count_scans)
+    for idx in range(3):
+        test_config = write_config(tmpdir, "%d.tspec" % idx, \
+                                   ["START_TEST Test %d" % idx, "INCLUDE steps.tspec", "END_TEST"])
+        assert tspec_config_parser.TestSpecConfigParser(test_config, cache).validate_config()
+    assert len(scans) == 1
+    monkeypatch.undo()
+    assert cache.size == sum([entry.size() for entry in cache_dir.listdir()])
+    assert len(cache_dir.listdir()) == 6
+    # Over max_size: least recently used entries (and their dependencies) are deleted
+    cache.max_size = cache.size - 1
+    cache.evict()
+    assert len(cache_dir.listdir()) == 4
+    assert cache.size == sum([entry.size() for entry in cache_dir.listdir()])
+
+def test_parser_cache_include_paths(tmpdir, monkeypatch):
+    """INCLUDE paths of cached configs (relative to each file, hashed once)"""
+    lines = ["FOREACH idx IN %s" % "; ".join([str(idx) for idx in range(200)]),
+             "START_TEST Test {idx}",
+             "INCLUDE steps.tspec",
+             "END_TEST",
+             "END_FOREACH"]
+    cache = tspec_config_parser.TestSpecConfigCache(str(tmpdir.join("cache")))
+    tmpdir.mkdir("a")
+    tmpdir.mkdir("b")
+    write_config(tmpdir, "a/steps.tspec", ["START_STEP A", "END_STEP"])
+    write_config(tmpdir, "b/steps.tspec", ["START_STEP B1", "END_STEP",
+                                           "START_STEP B2", "END_STEP"])
+    get_key = tspec_config_parser.TestSpecConfigCache.get_key
+    keys = []
+    def count_keys(self, test_config, with_path=True):
+        """Count config file hashes"""
+        keys.append(test_config)
+        return get_key(self, test_config, with_path)
+    monkeypatch.setattr(tspec_config_parser.TestSpecConfigCache, "get_key", count_keys)
+    for config_dir, step_ids in (("a", ["A"]), ("b", ["B1", "B2"])):
+        test_config = write_config(tmpdir, "%s/include.tspec" % config_dir, lines)
+        for _ in range(2):
+            del keys[:]
+            parser = tspec_config_parser.TestSpecConfigParser(test_config, cache)
+            tests = parser.generate_tspec().get_tests()
+            assert len(tests) == 200
+            assert [step.get_id() for step in tests[-1].get_test_steps()] == step_ids
+            # Config file and included file
+            assert len(keys) == 2
+    monkeypatch.undo()
+    include_path = str(tmpdir.join("b", "steps.tspec"))
+    with open(cache.get_entry_path(cache.get_key(test_config)) + ".deps", 'rb') as deps:
+        assert tspec_config_parser.load(deps) == \
+               [(include_path, cache.get_key(include_path, False))]
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""QC Connector Tests (simulated OTA server)"""
+
+import csv
+import sys
+import threading
+import pytest
+import tspec
+import qc_connector
+import qc_simulator
+
+__author__ = "João Galego"
+__copyright__ = "João Galego (2017)"
+__license__ = "none"
+
+def create_session(server):
+    """Open a logged-in session on the simulated server"""
+    session = qc_connector.QCConnector("http://qc.example.com/qcbin", server.connect())
+    session.login_and_connect("user", "password", "DOMAIN", "PROJECT")
+    return session
+
+def read_file(path):
+    """Read a whole file"""
+    with open(str(path), 'rb') as exported:
+        return exported.read()
+
+def get_test_ids(csv_content):
+    """Get the test IDs of an exported CSV file (in file order)"""
+    return [int(row[1]) for row in csv.reader(csv_content.splitlines()[1:]) \
+            if len(row) > 2 and row[1]]
+
+def export_serial(server, tmpdir, node_path=None):
+    """Export a subtree with export_tests (returns the CSV content)"""
+    csv_path = tmpdir.join("serial.csv")
+    create_session(server).export_tests(node_path or server.root, str(csv_path))
+    return read_file(csv_path)
+
+@pytest.mark.parametrize("split_depth", [1, 2, 4])
+@pytest.mark.parametrize("sessions", [1, 3])
+def test_export_tests_concurrent(tmpdir, split_depth, sessions):
+    """Concurrent export writes the same CSV file as the serial export"""
+    server = qc_simulator.SimulatedServer(fanout=3, depth=3, tests_per_folder=2, steps_per_test=2)
+    serial_csv = export_serial(server, tmpdir)
+    assert sorted(get_test_ids(serial_csv)) == sorted(server.tests)
+    csv_path = tmpdir.join("concurrent.csv")
+    create_session(server).export_tests_concurrent(server.root, lambda: create_session(server), \
+                                                   str(csv_path), sessions, split_depth)
+    assert read_file(csv_path) == serial_csv
+
+def test_export_tests_concurrent_subtree(tmpdir):
+    """Concurrent export of a subtree and of a leaf folder"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=3)
+    subtree = server.root_folder.children[1]
+    leaf = subtree.children[0]
+    for node_path in (subtree.path, leaf.path):
+        serial_csv = export_serial(server, tmpdir, node_path)
+        csv_path = tmpdir.join("concurrent.csv")
+        create_session(server).export_tests_concurrent(node_path, \
+                                                       lambda: create_session(server), \
+                                                       str(csv_path), 2)
+        assert read_file(csv_path) == serial_csv
+
+def test_export_tests_incremental(tmpdir):
+    """Incremental export after tests were changed and removed"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=3, steps_per_test=2)
+    session = create_session(server)
+    manifest_path = str(tmpdir.join("tests.manifest"))
+    csv_path = tmpdir.join("incremental.csv")
+    assert session.export_tests_incremental(server.root, manifest_path, str(csv_path))
+    assert read_file(csv_path) == export_serial(server, tmpdir)
+    server.modify_test(2, name="Changed Test")
+    server.modify_test(5, step_description="<p>Changed</p>")
+    server.remove_test(7)
+    server.reset_calls()
+    assert session.export_tests_incremental(server.root, manifest_path, str(csv_path))
+    # Only the changed tests are fetched again
+    assert server.calls["DesignStepFactory.NewList"] == 2
+    assert read_file(csv_path) == export_serial(server, tmpdir)
+    manifest = qc_connector.QCExportManifest(manifest_path)
+    assert manifest.get_test(7) is None
+    assert manifest.get_test(5) is not None
+    manifest.close()
+    # The manifest belongs to the exported node
+    assert not session.export_tests_incremental(server.root_folder.children[0].path, \
+                                                manifest_path, str(csv_path))
+
+def test_export_tests_incremental_resume(tmpdir, monkeypatch):
+    """Interrupted incremental export resumes from its last checkpoint"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=3, steps_per_test=2)
+    session = create_session(server)
+    manifest_path = str(tmpdir.join("tests.manifest"))
+    csv_path = tmpdir.join("incremental.csv")
+    new_list = qc_simulator.SimulatedDesignStepFactory.NewList
+    fetched = []
+    def interrupted_new_list(self, filt):
+        """Lose the connection after 5 tests"""
+        if len(fetched) >= 5:
+            raise qc_simulator.OTAError("Connection lost")
+        fetched.append(self.record.test_id)
+        return new_list(self, filt)
+    monkeypatch.setattr(qc_simulator.SimulatedDesignStepFactory, "NewList", interrupted_new_list)
+    with pytest.raises(qc_simulator.OTAError):
+        session.export_tests_incremental(server.root, manifest_path, str(csv_path))
+    # The previous CSV file is only replaced by a complete export
+    assert not csv_path.check()
+    assert not tmpdir.join("incremental.csv.tmp").check()
+    monkeypatch.setattr(qc_simulator.SimulatedDesignStepFactory, "NewList", new_list)
+    server.reset_calls()
+    assert session.export_tests_incremental(server.root, manifest_path, str(csv_path))
+    assert server.calls["DesignStepFactory.NewList"] == len(server.tests) - len(fetched)
+    assert read_file(csv_path) == export_serial(server, tmpdir)
+    assert not tmpdir.join("incremental.csv.tmp").check()
+    # A failed export leaves the previous CSV file in place
+    def failed_new_list(self, filt):
+        """Lose the connection"""
+        raise qc_simulator.OTAError("Connection lost")
+    server.modify_test(1, name="Changed")
+    monkeypatch.setattr(qc_simulator.SimulatedDesignStepFactory, "NewList", failed_new_list)
+    exported = read_file(csv_path)
+    with pytest.raises(qc_simulator.OTAError):
+        session.export_tests_incremental(server.root, manifest_path, str(csv_path))
+    assert read_file(csv_path) == exported
+    assert not tmpdir.join("incremental.csv.tmp").check()
+
+@pytest.mark.parametrize("sessions", [None, 3])
+def test_upload_tspec(sessions):
+    """Upload folders, tests and design steps (serial and over a session pool)"""
+    server = qc_simulator.SimulatedServer(fanout=1, depth=1, tests_per_folder=0)
+    test_spec = tspec.TestSpec("Upload")
+    test_subjects = ["Subject\\Upload\\A", "Subject\\Upload\\A", "Subject\\Upload\\A", \
+                     "Subject\\Upload\\B\\C", "", "Subject\\Upload\\A"]
+    for test_idx, test_subject in enumerate(test_subjects):
+        test = tspec.QCTest(test_subject, "Level %d" % test_idx, "", test_idx % 2 == 1)
+        test.set_id("Upload_Test_%d" % test_idx)
+        test.add_step(1, "Do step 1", "")
+        test.add_step(2, "Do step 2", "Step 2 is done")
+        test_spec.add_test(test)
+    node_path = server.root_folder.children[0].path
+    session = create_session(server)
+    create = None if sessions is None else lambda: create_session(server)
+    assert session.upload_tspec(test_spec, node_path, create, sessions or 1, 2)
+    assert session.get_test_uploader().num_folders == 4
+    expected = {"Subject\\Upload\\A": ["Upload_Test_0", "Upload_Test_1", "Upload_Test_2", \
+                                       "Upload_Test_5"],
+                "Subject\\Upload\\B\\C": ["Upload_Test_3"],
+                node_path: ["Upload_Test_4"]}
+    for folder_path, test_ids in expected.iteritems():
+        folder = server.find_folder(folder_path)
+        assert folder is not None
+        assert sorted([server.tests[test_id].name for test_id in folder.tests]) == test_ids
+    for test in server.tests.itervalues():
+        assert [(step.name, step.description, step.expected_result) for step in test.steps] == \
+               [("1", "Do step 1", ""), ("2", "Do step 2", "Step 2 is done")]
+        # Test level and automation flag (the empty test area is not sent)
+        test_idx = int(test.name.rsplit("_", 1)[1])
+        assert test.fields == {'TS_USER_01': "Level %d" % test_idx,
+                               'TS_USER_03': 'Y' if test_idx % 2 == 1 else 'N'}
+    assert len(server.tests) == len(test_subjects)
+
+@pytest.mark.parametrize("allow_command", [True, False])
+def test_export_tests_bulk(tmpdir, allow_command):
+    """Bulk export writes the same CSV file as the serial export (and falls
+    back to the serial export if Command is not allowed)"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=3, \
+                                          steps_per_test=2, allow_command=allow_command)
+    server.modify_test(4, name="Changed 'Test'")
+    session = create_session(server)
+    csv_path = tmpdir.join("bulk.csv")
+    for node_path in (server.root, server.root_folder.children[1].path):
+        serial_csv = export_serial(server, tmpdir, node_path)
+        server.reset_calls()
+        session.export_tests(node_path, str(csv_path), bulk=True)
+        assert read_file(csv_path) == serial_csv
+        num_tests = len(get_test_ids(serial_csv))
+        if allow_command:
+            assert server.calls["DesignStepFactory.NewList"] == 0
+        else:
+            assert server.calls["DesignStepFactory.NewList"] == num_tests
+
+def make_run_history(num_runs, sparse_runs=0):
+    """Simulated server with a run history (run IDs up to sparse_runs are sparse)
+    :param num_runs number of runs
+    :param sparse_runs number of run IDs where only one in a thousand is kept"""
+    server = qc_simulator.SimulatedServer(fanout=1, depth=0, tests_per_folder=1, \
+                                          steps_per_test=0, runs_per_test=num_runs)
+    server.runs = [run for run in server.runs if run.run_id > sparse_runs or run.run_id % 1000 == 0]
+    server.database = None
+    return server
+
+@pytest.mark.parametrize("sparse_runs", [0, 50000])
+def test_iter_id_windows(sparse_runs):
+    """Run history paging by ID windows (dense and sparse ranges)"""
+    server = make_run_history(sparse_runs + 5000, sparse_runs)
+    run_factory = create_session(server).get_run_factory()
+    server.reset_calls()
+    pages = list(run_factory.iter_pages('', ['RN_RUN_ID'], page_size=100))
+    assert [record.RN_RUN_ID for page in pages for record in page] == \
+           [run.run_id for run in server.runs]
+    assert set([len(page) for page in pages[:-1]]) == set([100])
+    assert server.largest_list <= qc_connector.ID_WINDOW_GROWTH * 100
+    # Filtered list
+    pages = list(run_factory.iter_pages('[Filter]{RN_STATUS:Failed}', ['RN_RUN_ID'], 100))
+    assert [record.RN_RUN_ID for page in pages for record in page] == \
+           [run.run_id for run in server.runs if run.status == "Failed"]
+
+def test_iter_pages_whole_list():
+    """Run history paging without the Command object (whole list)"""
+    server = make_run_history(1000)
+    server.allow_command = False
+    run_factory = create_session(server).get_run_factory()
+    server.reset_calls()
+    pages = list(run_factory.iter_pages('', ['RN_RUN_ID', 'RN_STATUS'], page_size=300))
+    assert [len(page) for page in pages] == [300, 300, 300, 100]
+    assert server.largest_list == 1000
+    assert server.calls["RunFactory.NewList"] == 1
+
+def test_page_prefetcher():
+    """Background prefetch (same records, early stop)"""
+    server = make_run_history(2000)
+    run_factory = create_session(server).get_run_factory()
+    records = list(run_factory.iter_records('', ['RN_RUN_ID'], 100, \
+                                            lambda: create_session(server)))
+    assert [record.RN_RUN_ID for record in records] == [run.run_id for run in server.runs]
+    server.reset_calls()
+    prefetcher = qc_connector.QCPagePrefetcher(lambda: create_session(server), "RunFactory", \
+                                               '', ['RN_RUN_ID'], 100, 1)
+    pages = prefetcher.iter_pages()
+    assert len(next(pages)) == 100
+    pages.close()
+    assert not prefetcher.worker.is_alive()
+    # The worker session was closed before all the windows were fetched
+    assert server.calls["TDConnection.Logout"] == 1
+    assert server.calls["RunFactory.NewList"] < 20
+
+def test_page_prefetcher_error(monkeypatch):
+    """Background prefetch errors are raised by the consumer"""
+    server = make_run_history(2000)
+    run_factory = create_session(server).get_run_factory()
+    new_list = qc_simulator.SimulatedRunFactory.NewList
+    def failing_new_list(self, filt):
+        """Lose the connection after 3 lists"""
+        if server.calls["RunFactory.NewList"] >= 3:
+            raise qc_simulator.OTAError("Connection lost")
+        return new_list(self, filt)
+    monkeypatch.setattr(qc_simulator.SimulatedRunFactory, "NewList", failing_new_list)
+    records = []
+    with pytest.raises(qc_simulator.OTAError):
+        for record in run_factory.iter_records('', ['RN_RUN_ID'], 100, \
+                                               lambda: create_session(server)):
+            records.append(record)
+    assert 0 < len(records) < 2000
+
+@pytest.mark.parametrize("id_type", [str, long])
+def test_export_tests_bulk_id_types(tmpdir, monkeypatch, id_type):
+    """Bulk export with record set and node IDs of another type (COM)"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=3, steps_per_test=2)
+    serial_csv = export_serial(server, tmpdir)
+    field_value = qc_simulator.SimulatedRecordset.FieldValue
+    def convert_field_value(self, key):
+        """Get integer fields as id_type"""
+        value = field_value(self, key)
+        return id_type(value) if isinstance(value, (int, long)) else value
+    monkeypatch.setattr(qc_simulator.SimulatedRecordset, "FieldValue", convert_field_value)
+    monkeypatch.setitem(qc_simulator.SimulatedSubjectNode.PROPERTIES, 'NodeID', \
+                        lambda self: long(self.record.folder_id))
+    csv_path = tmpdir.join("bulk.csv")
+    server.reset_calls()
+    create_session(server).export_tests(server.root, str(csv_path), bulk=True)
+    assert read_file(csv_path) == serial_csv
+    assert server.calls["DesignStepFactory.NewList"] == 0
+
+def test_export_tests_bulk_mismatch(tmpdir, monkeypatch):
+    """Bulk export falls back to the serial export if fetched tests are not exported"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=3, steps_per_test=2)
+    serial_csv = export_serial(server, tmpdir)
+    monkeypatch.setitem(qc_simulator.SimulatedSubjectNode.PROPERTIES, 'NodeID', \
+                        lambda self: self.record.folder_id + 1000)
+    monkeypatch.setattr(qc_connector, "BULK_FOLDER_QUERY", \
+                        "SELECT AL_ABSOLUTE_PATH FROM ALL_LISTS WHERE AL_ITEM_ID + 1000 = %d")
+    csv_path = tmpdir.join("bulk.csv")
+    server.reset_calls()
+    create_session(server).export_tests(server.root, str(csv_path), bulk=True)
+    assert read_file(csv_path) == serial_csv
+    assert server.calls["DesignStepFactory.NewList"] == len(server.tests)
+
+def test_lookup_cache(monkeypatch):
+    """Cached node lookups (hit/miss counters and TTL expiry)"""
+    server = qc_simulator.SimulatedServer(fanout=2, depth=2, tests_per_folder=1)
+    lookup_cache = qc_connector.QCLookupCache(max_size=16, ttl=60)
+    session = qc_connector.QCConnector("http://qc.example.com/qcbin", server.connect(), \
+                                       lookup_cache)
+    session.login_and_connect("user", "password", "DOMAIN", "PROJECT")
+    session.get_tree_manager()
+    now = [1000.0]
+    monkeypatch.setattr(qc_connector.time, "time", lambda: now[0])
+    node_path = server.root_folder.children[0].path
+    for _ in range(3):
+        assert session.get_node_by_path(node_path).Path == node_path
+        assert session.get_children_count(node_path) == 2
+    assert server.calls["TreeManager.NodeByPath"] == 1
+    assert server.calls["SubjectNode.Count"] == 1
+    # The children count is loaded through the cached node
+    assert (lookup_cache.hits, lookup_cache.misses) == (5, 2)
+    # Expired entries are loaded again
+    now[0] += 61
+    assert session.get_children_count(node_path) == 2
+    assert server.calls["TreeManager.NodeByPath"] == 2
+    assert server.calls["SubjectNode.Count"] == 2
+    assert (lookup_cache.hits, lookup_cache.misses) == (5, 4)
+    lookup_cache.clear()
+    assert (lookup_cache.hits, lookup_cache.misses, lookup_cache.evictions) == (0, 0, 0)
+    assert len(lookup_cache.entries) == 0
+
+def test_lookup_cache_lru():
+    """Least recently used lookups are evicted at capacity"""
+    server = qc_simulator.SimulatedServer(fanout=3, depth=1, tests_per_folder=1)
+    lookup_cache = qc_connector.QCLookupCache(max_size=2)
+    session = qc_connector.QCConnector("http://qc.example.com/qcbin", server.connect(), \
+                                       lookup_cache)
+    session.get_tree_manager()
+    node_a, node_b, node_c = [folder.path for folder in server.root_folder.children]
+    for node_path in (node_a, node_b, node_a, node_c):
+        session.get_node_by_path(node_path)
+    assert lookup_cache.entries.keys() == [('node', node_a), ('node', node_c)]
+    assert lookup_cache.evictions == 1
+    server.reset_calls()
+    session.get_node_by_path(node_a)
+    assert server.calls["TreeManager.NodeByPath"] == 0
+    session.get_node_by_path(node_b)
+    assert server.calls["TreeManager.NodeByPath"] == 1
+    # Disabled cache
+    lookup_cache = qc_connector.QCLookupCache(max_size=0)
+    assert lookup_cache.get('key', lambda: 1) == lookup_cache.get('key', lambda: 2) - 1
+    assert len(lookup_cache.entries) == 0
+
+def test_lookup_cache_invalidate_path():
+    """Invalidated subtrees (nodes and children counts)"""
+    lookup_cache = qc_connector.QCLookupCache()
+    keys = [('node', "Subject\\Folder_1"), ('count', "Subject\\Folder_1"),
+            ('node', "Subject\\Folder_1\\Folder_2"), ('node', "Subject\\Folder_10"),
+            ('node', "Subject"), ('tests', "[Filter]{TS_NAME:Subject\\Folder_1}")]
+    for key in keys:
+        lookup_cache.get(key, lambda: key)
+    lookup_cache.invalidate_path("Subject\\Folder_1")
+    assert lookup_cache.entries.keys() == keys[3:]
+    lookup_cache.invalidate(keys[3])
+    assert lookup_cache.entries.keys() == keys[4:]
+    lookup_cache.invalidate()
+    assert len(lookup_cache.entries) == 0
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_export_tests_csv_quoting(tmpdir, bulk):
+    """Fields with commas, quotes and line breaks are read back unchanged"""
+    server = qc_simulator.SimulatedServer(fanout=1, depth=1, tests_per_folder=2, steps_per_test=1)
+    folder = server.root_folder.children[0]
+    folder.description = '<p>Folder "A", then <i>B</i></p>'
+    server.modify_test(1, name='Say "hello", then "bye"')
+    server.modify_test(2, name='Line 1\nLine 2, "3"')
+    server.database = None
+    csv_path = tmpdir.join("quoting.csv")
+    create_session(server).export_tests(server.root, str(csv_path), bulk)
+    with open(str(csv_path), 'rb') as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows == [qc_connector.EXPORT_CSV_HEADER,
+                    ['Subject', 'Root folder'],
+                    [folder.name, 'Folder "A", then B'],
+                    ['', '1', 'Say "hello", then "bye"'],
+                    ['', '', '', '', 'Step 1', 'Run test 1, then type 1', 'The result is "1"'],
+                    ['', '2', 'Line 1\nLine 2, "3"'],
+                    ['', '', '', '', 'Step 1', 'Run test 2, then type 1', 'The result is "1"'],
+                    []]
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_export_tests_deep_tree(tmpdir, bulk):
+    """Trees deeper than the recursion limit are exported depth-first"""
+    depth = sys.getrecursionlimit() + 10
+    server = qc_simulator.SimulatedServer(fanout=1, depth=depth, tests_per_folder=1, \
+                                          steps_per_test=1)
+    csv_path = tmpdir.join("deep.csv")
+    create_session(server).export_tests(server.root, str(csv_path), bulk)
+    with open(str(csv_path), 'rb') as csv_file:
+        rows = list(csv.reader(csv_file))
+    folder_rows = [['Subject', 'Root folder']] + \
+                  [['Folder_%d' % idx, 'Folder Folder_%d' % idx] for idx in range(1, depth + 1)]
+    assert rows == [qc_connector.EXPORT_CSV_HEADER] + folder_rows + \
+                   [['', '1', 'Test 1'],
+                    ['', '', '', '', 'Step 1', 'Run test 1, then type 1', 'The result is "1"']] + \
+                   [[]] * depth
+
+def test_tag_stripper_reuse():
+    """A reused stripper is reset between fields (malformed and unclosed tags)"""
+    stripper = qc_connector.TagStripper(cache_size=0)
+    fields = [('<html><body>Type <b>1</b></body></html>', 'Type 1'),
+              ('Unclosed <i>tag', 'Unclosed tag'),
+              ('Unterminated <b', 'Unterminated <b'),
+              ('Next field', 'Next field'),
+              ('<p>Open comment <!-- x', 'Open comment <!-- x'),
+              ('</b>Stray end tags</i>', 'Stray end tags'),
+              ('a < b and c > d', 'a < b and c > d'),
+              ('Tom &amp; Jerry &', 'Tom & Jerry &'),
+              ('<![bogus[x]]> parse error', '<![bogus[x]]> parse error'),
+              (u'<p>Caf\xe9</p>', 'Caf\xc3\xa9'),
+              ('', '')]
+    for _ in range(2):
+        for html, data in fields:
+            assert stripper.strip_tags(html) == data
+    assert (stripper.hits, stripper.misses) == (0, 2 * len(fields))
+    assert len(stripper.cache) == 0
+
+def test_tag_stripper_cache():
+    """Stripped fields are kept in an LRU cache"""
+    stripper = qc_connector.TagStripper(cache_size=2)
+    for html in ('<b>A</b>', '<b>B</b>', '<b>A</b>', '<b>C</b>'):
+        stripper.strip_tags(html)
+    assert stripper.cache.keys() == ['<b>A</b>', '<b>C</b>']
+    assert (stripper.hits, stripper.misses) == (1, 3)
+    assert stripper.strip_tags('<b>B</b>') == 'B'
+    assert stripper.cache.keys() == ['<b>C</b>', '<b>B</b>']
+    assert (stripper.hits, stripper.misses) == (1, 4)
+    stripper.clear()
+    assert (stripper.hits, stripper.misses, len(stripper.cache)) == (0, 0, 0)
+
+def test_tag_stripper_threads():
+    """Concurrent calls (one stripper per thread, shared cache)"""
+    stripper = qc_connector.TagStripper(cache_size=64)
+    fields = ['<p>Step <b>%d</b> of <i>%d' % (idx, idx % 7) for idx in range(200)]
+    errors = []
+    strippers = []
+    def strip_fields():
+        try:
+            for html in fields:
+                assert stripper.strip_tags(html) == html.replace('<p>', '') \
+                    .replace('<b>', '').replace('</b>', '').replace('<i>', '')
+            strippers.append(stripper.get_stripper())
+        except AssertionError as err:
+            errors.append(err)
+    threads = [threading.Thread(target=strip_fields) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(set(id(thread_stripper) for thread_stripper in strippers)) == len(threads)
+    assert stripper.hits + stripper.misses == len(threads) * len(fields)
+    assert len(stripper.cache) == 64
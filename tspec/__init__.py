@@ -14,8 +14,23 @@ __version__ = '0.0.1 (Hallucigenia)'
 
 # Modules
 import csv
+import os
+import re
+import sqlite3
+from collections import deque
 from copy import copy
+from cPickle import dumps
+from cPickle import loads
+from cPickle import HIGHEST_PROTOCOL
+from cStringIO import StringIO
+from multiprocessing import Pool
+from multiprocessing import cpu_count
+from itertools import chain
+from itertools import islice
+from itertools import product
+from operator import attrgetter
 from string import maketrans
+from string import Formatter
 import logging
 
 # Log Configuration
@@ -28,18 +43,93 @@ DEFAULT_TEST_ID = "<EMPTY>"
 DEFAULT_STEP_ID = 0
 DEFAULT_STEP_DESCRIPTION = "<EMPTY>"
 DEFAULT_STEP_EXPECTED_RESULT = "N/A"
+CSV_CORE_COLUMNS = ['test_id', 'step_id', 'description', 'expected_result']
+CSV_CHUNK_SIZE = 1000
+CSV_SHARD_SIZE = 5000
+TRANSLATE_INTAB = "!#*|$<>%.&/()=?+ ;:\\"
+TRANSLATE_OUTTAB = "____________________"
 
 class TestStep(object):
-    """TestStep Class"""
+    """TestStep Class
+    Standard fields are stored in __slots__, custom attributes (**kwargs)
+    are kept in a separate dict which is only allocated when needed.
+    The test which indexed the step last is told when the step is renamed"""
+    __slots__ = ('step_id', 'description', 'expected_result', '_extras', '_test')
+
     def __init__(self, step_id=DEFAULT_STEP_ID, \
                 description=DEFAULT_STEP_DESCRIPTION, \
                 expected_result=DEFAULT_STEP_EXPECTED_RESULT, **kwargs):
         """TestStep constructor"""
-        self.step_id = step_id
-        self.description = description
-        self.expected_result = expected_result
-        for key, value in kwargs.items():
-            setattr(self, key, value)
+        SET_STEP_ID(self, step_id)
+        SET_STEP_DESCRIPTION(self, description)
+        SET_STEP_EXPECTED_RESULT(self, expected_result)
+        SET_STEP_EXTRAS(self, kwargs or None)
+        SET_STEP_TEST(self, None)
+
+    def __getattr__(self, key):
+        """Get custom attribute
+        :param key attribute name"""
+        extras = GET_STEP_EXTRAS(self)
+        if extras is not None and key in extras:
+            return extras[key]
+        raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, key))
+
+    def __setattr__(self, key, value):
+        """Set standard field or custom attribute
+        :param key attribute name
+        :param value attribute value"""
+        if key in STEP_FIELDS:
+            if key == 'step_id':
+                test = GET_STEP_TEST(self)
+                if test is not None:
+                    # Step ID index of the owning test is stale
+                    test.step_index_version = None
+            object.__setattr__(self, key, value)
+        else:
+            extras = GET_STEP_EXTRAS(self)
+            if extras is None:
+                extras = {}
+                SET_STEP_EXTRAS(self, extras)
+            extras[key] = value
+
+    def __delattr__(self, key):
+        """Delete custom attribute
+        :param key attribute name"""
+        extras = GET_STEP_EXTRAS(self)
+        if extras is not None and key in extras:
+            del extras[key]
+        elif key in STEP_FIELDS:
+            object.__delattr__(self, key)
+        else:
+            raise AttributeError(key)
+
+    def __copy__(self):
+        """Shallow copy (custom attributes dict is copied, not shared)"""
+        step = TestStep.__new__(self.__class__)
+        SET_STEP_ID(step, self.step_id)
+        SET_STEP_DESCRIPTION(step, self.description)
+        SET_STEP_EXPECTED_RESULT(step, self.expected_result)
+        extras = GET_STEP_EXTRAS(self)
+        SET_STEP_EXTRAS(step, dict(extras) if extras else None)
+        SET_STEP_TEST(step, None)
+        return step
+
+    def __getstate__(self):
+        """Pickle state"""
+        return (self.step_id, self.description, self.expected_result, GET_STEP_EXTRAS(self))
+
+    def __setstate__(self, state):
+        """Unpickle state
+        :param state pickled state"""
+        SET_STEP_ID(self, state[0])
+        SET_STEP_DESCRIPTION(self, state[1])
+        SET_STEP_EXPECTED_RESULT(self, state[2])
+        SET_STEP_EXTRAS(self, state[3])
+        SET_STEP_TEST(self, None)
+
+    def get_extras(self):
+        """Get custom attributes"""
+        return dict(GET_STEP_EXTRAS(self) or {})
 
     def __str__(self):
         """TestStep String Representation"""
@@ -78,6 +168,51 @@ class TestStep(object):
         self.set_description(DEFAULT_STEP_DESCRIPTION)
         self.set_expected_result(DEFAULT_STEP_EXPECTED_RESULT)
 
+# Standard fields (other attribute names are custom attributes)
+STEP_FIELDS = frozenset(['step_id', 'description', 'expected_result'])
+
+# Slot accessors (bypass TestStep.__setattr__)
+SET_STEP_ID = TestStep.step_id.__set__
+SET_STEP_DESCRIPTION = TestStep.description.__set__
+SET_STEP_EXPECTED_RESULT = TestStep.expected_result.__set__
+SET_STEP_EXTRAS = TestStep._extras.__set__
+GET_STEP_EXTRAS = TestStep._extras.__get__
+SET_STEP_TEST = TestStep._test.__set__
+GET_STEP_TEST = TestStep._test.__get__
+
+
+class TestStepList(list):
+    """TestStepList Class
+    List of the steps of a test which counts its changes (the step ID index
+    of the test is rebuilt after the list was changed directly)"""
+    __slots__ = ('version',)
+
+    def __init__(self, steps=()):
+        """TestStepList Constructor
+        :param steps initial steps"""
+        list.__init__(self, steps)
+        self.version = 0
+
+    def __reduce__(self):
+        """Pickle/copy state (the version is not kept)"""
+        return (self.__class__, (list(self),))
+
+def count_step_list_changes(method):
+    """Wrap a list method so that it bumps TestStepList.version
+    :param method list method"""
+    def changed(self, *args, **kwargs):
+        """Changed list"""
+        self.version += 1
+        return method(self, *args, **kwargs)
+    changed.__name__ = method.__name__
+    changed.__doc__ = method.__doc__
+    return changed
+
+for LIST_METHOD in ('__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__', \
+                    '__imul__', 'append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort'):
+    setattr(TestStepList, LIST_METHOD, count_step_list_changes(getattr(list, LIST_METHOD)))
+del LIST_METHOD
+
 
 class BasicTest(object):
     """BasicTest Class"""
@@ -91,7 +226,11 @@ class BasicTest(object):
             logging.debug("Casting '%s' as a string", str(test_id))
             self.test_id = str(test_id)
         self.basic_test_info = []
-        self.steps = []
+        self.steps = TestStepList()
+        self.step_index = {}
+        # Version of self.steps the step ID index matches (None if it is stale)
+        self.step_index_version = 0
+        self.test_spec = None
 
     def __str__(self):
         """BasicTest String Representation"""
@@ -99,6 +238,15 @@ class BasicTest(object):
         self.basic_test_info.insert(0, "\nTest ID: " + self.test_id)
         return "\t\n".join(map(str, self.basic_test_info))
 
+    def __getstate__(self):
+        """Pickle/copy state (the owning test spec and the step ID index are
+        left out, copies build their own index)"""
+        state = self.__dict__.copy()
+        state['test_spec'] = None
+        state['step_index'] = {}
+        state['step_index_version'] = None
+        return state
+
     def get_id(self):
         """Get Test ID"""
         return self.test_id
@@ -107,27 +255,64 @@ class BasicTest(object):
         """Set Test ID
         :param test_id unique string identifier"""
         if isinstance(test_id, str):
-            self.test_id = test_id
+            if self.test_spec is None or self.test_spec.rename_test(self, test_id):
+                self.test_id = test_id
         else:
             logging.error("Test ID must be a string")
 
+    def reindex_steps(self, start=0):
+        """Rebuild the step ID index from a given position onwards
+        :param start first step position to be reindexed"""
+        if start == 0:
+            self.step_index.clear()
+        for idx in range(start, len(self.steps)):
+            step = self.steps[idx]
+            SET_STEP_TEST(step, self)
+            self.step_index[step.get_id()] = idx
+        self.step_index_version = getattr(self.steps, 'version', None)
+
+    def get_step_index(self):
+        """Get Step ID index (rebuilt if the list of steps was changed directly
+        or if one of its steps was renamed)"""
+        if self.step_index_version is None or \
+           self.step_index_version != getattr(self.steps, 'version', None):
+            self.reindex_steps()
+        return self.step_index
+
+    def get_step_position(self, step_id):
+        """Get the position of a step (None if there is no such step). The
+        index is rebuilt if it points to another step (e.g. a step shared with
+        another test was renamed)
+        :param step_id unique step identifier"""
+        step_idx = self.get_step_index().get(step_id)
+        if step_idx is not None and \
+           (step_idx >= len(self.steps) or self.steps[step_idx].get_id() != step_id):
+            self.reindex_steps()
+            step_idx = self.step_index.get(step_id)
+        return step_idx
+
+    def store_test_step(self, step):
+        """Append a validated step (the step ID index is up to date)
+        :param step TestStep object"""
+        self.steps.append(step)
+        SET_STEP_TEST(step, self)
+        self.step_index[step.get_id()] = len(self.steps) - 1
+        self.step_index_version = self.steps.version
+
     def validate_step_id(self, new_step_id):
         """Check if a candidate Step ID is valid
         :param new_step_id candidate step id"""
-        is_valid = True
-        for step in self.steps:
-            if new_step_id == step.get_id():
-                is_valid = False
-                logging.error("Duplicated step ID '%s'", str(new_step_id))
-                break
-        return is_valid
+        if self.get_step_position(new_step_id) is not None:
+            logging.error("Duplicated step ID '%s'", str(new_step_id))
+            return False
+        return True
 
     def get_test_step_by_id(self, step_id):
         """Get Test Step by ID
         :param step_id unique step identifier"""
-        for step in self.steps:
-            if step_id == step.get_id():
-                return copy(step)
+        step_idx = self.get_step_position(step_id)
+        if step_idx is not None:
+            return copy(self.steps[step_idx])
 
     def get_test_step_by_index(self, step_index):
         """Get Test Step by Index
@@ -142,64 +327,92 @@ class BasicTest(object):
         :param description step description
         :param expected_result step expected result"""
         if self.validate_step_id(step_id):
-            self.steps.append(TestStep(step_id, description, expected_result))
+            self.store_test_step(TestStep(step_id, description, expected_result))
 
-    def append_test_step(self, step):
+    def append_test_step(self, step, adopt=False):
         """Append TestStep object
-        :param step TestStep object"""
+        :param step TestStep object
+        :param adopt store the object itself instead of a copy"""
         if isinstance(step, TestStep):
             if self.validate_step_id(step.get_id()):
-                self.steps.append(copy(step))
+                self.store_test_step(step if adopt else copy(step))
         else:
             logging.error("Expected %s object", TestStep)
 
-    def append_test_steps(self, step_list):
-        """Append a list of TestStep objects
-        :param step_list list of TestStep objects"""
-        if isinstance(step_list, list):
-            validate_steps = [isinstance(step, TestStep) for step in step_list]
-            all_valid_steps = all(validate_steps)
-            if all_valid_steps:
-                for step in step_list:
-                    self.append_test_step(step)
-            else:
-                for is_valid in validate_steps:
-                    if not is_valid:
-                        invalid_step_idx = validate_steps.index(is_valid)
-                        logging.error("ERROR: Test step #%d is invalid (Got: %s, Expected: %s)", \
-                                invalid_step_idx, type(step_list[invalid_step_idx]), TestStep)
-        else:
+    def append_test_steps(self, step_list, adopt=False):
+        """Append a batch of TestStep objects (all or nothing, the steps are
+        also removed if step_list raises an exception)
+        :param step_list iterable of TestStep objects (list, generator, ...)
+        :param adopt store the objects themselves instead of copies"""
+        if isinstance(step_list, basestring) or not hasattr(step_list, '__iter__'):
             logging.error("Got: %s, Expected: %s", type(step_list), list)
+            return False
+        self.get_step_index()
+        start = len(self.steps)
+        try:
+            for idx, step in enumerate(step_list):
+                if not isinstance(step, TestStep):
+                    logging.error("Test step #%d is invalid (Got: %s, Expected: %s)", \
+                                  idx, type(step), TestStep)
+                elif self.validate_step_id(step.get_id()):
+                    self.store_test_step(step if adopt else copy(step))
+                    continue
+                self.rollback_test_steps(start)
+                logging.error("Failed to append test steps")
+                return False
+        except:
+            self.rollback_test_steps(start)
+            raise
+        return True
 
+    def rollback_test_steps(self, start):
+        """Remove the steps appended from a given position onwards
+        :param start position of the first appended step"""
+        for new_step in self.steps[start:]:
+            self.step_index.pop(new_step.get_id(), None)
+            if GET_STEP_TEST(new_step) is self:
+                SET_STEP_TEST(new_step, None)
+        del self.steps[start:]
+        self.step_index_version = self.steps.version
 
-    def insert_test_step(self, step, step_index=-1):
+    def insert_test_step(self, step, step_index=-1, adopt=False):
         """Insert TestStep object
         :param step TestStep object
-        :param step_index target step position"""
+        :param step_index target step position
+        :param adopt store the object itself instead of a copy"""
         if self.validate_step_id(step.get_id()):
-            if step_index == -1:
-                self.steps.insert(len(self.steps), copy(step))
+            if not adopt:
+                step = copy(step)
+            if step_index == -1 or step_index >= len(self.steps):
+                self.store_test_step(step)
             else:
-                self.steps.insert(step_index, copy(step))
+                if step_index < 0:
+                    step_index = max(len(self.steps) + step_index, 0)
+                self.steps.insert(step_index, step)
+                self.reindex_steps(step_index)
 
     def remove_test_step_by_id(self, step_id):
         """Remove Test Step by ID
         :param step_id unique step identifier"""
-        del_idx = None
-        for idx in range(len(self.steps)):
-            if step_id == self.steps[idx].get_id():
-                del_idx = idx
-                break
-
-        if del_idx:
-            del self.steps[del_idx]
+        del_idx = self.get_step_position(step_id)
+        if del_idx is not None:
+            self.remove_test_step_by_index(del_idx)
         else:
             logging.error("Found no test-step with ID '%s'", str(step_id))
 
     def remove_test_step_by_index(self, step_index):
         """Remove Test Step by Index
         :param step_index step position in the list of steps"""
+        # Bring the index up to date before it is partially rebuilt
+        self.get_step_index()
+        if step_index < 0:
+            step_index += len(self.steps)
+        step = self.steps[step_index]
         del self.steps[step_index]
+        self.step_index.pop(step.get_id(), None)
+        if GET_STEP_TEST(step) is self:
+            SET_STEP_TEST(step, None)
+        self.reindex_steps(step_index)
 
     def move_test_step_by_id(self, step_id, new_step_index):
         """Move test step to a new indexed position (ID)
@@ -207,7 +420,7 @@ class BasicTest(object):
         :param new_step_index new step position in the list of steps"""
         step = self.get_test_step_by_id(step_id)
         self.remove_test_step_by_id(step_id)
-        self.insert_test_step(new_step_index, step)
+        self.insert_test_step(step, new_step_index, adopt=True)
 
     def move_test_step_by_index(self, old_step_index, new_step_index):
         """Move test step to a new indexed position (Index)
@@ -215,18 +428,18 @@ class BasicTest(object):
         :param new_step_index new step position in the list of steps"""
         step = self.get_test_step_by_index(old_step_index)
         self.remove_test_step_by_index(old_step_index)
-        self.insert_test_step(new_step_index, step)
+        self.insert_test_step(step, new_step_index, adopt=True)
 
     def get_test_steps(self):
         """Get test steps"""
         return self.steps
 
-    def translate_name(self, intab="!#*|$<>%.&/()=?+ ;:\\", outtab="____________________"):
+    def translate_name(self, intab=TRANSLATE_INTAB, outtab=TRANSLATE_OUTTAB):
         """Replace unwanted characters with maketrans
         :param intab list of unwanted/forbidden characters
         :param outab list of replacement characters"""
         transtab = maketrans(intab, outtab)
-        self.test_id = self.test_id.translate(transtab)
+        self.set_id(self.test_id.translate(transtab))
 
 
 class CustomTest(BasicTest):
@@ -250,6 +463,373 @@ class QCTest(CustomTest):
                                         test_area=test_area, is_automated=is_automated)
 
 
+# Test ID translation table (see BasicTest.translate_name)
+TRANSLATE_TABLE = maketrans(TRANSLATE_INTAB, TRANSLATE_OUTTAB)
+
+# Attributes shared by all tests (excluded from the csv columns)
+BASIC_TEST_ATTRIBUTES = frozenset(BasicTest().__dict__.keys())
+
+def get_test_attributes(test):
+    """Get test suplementary attributes (sorted)
+    :param test Test object"""
+    return sorted([attrib for attrib in test.__dict__.keys() \
+                   if attrib not in BASIC_TEST_ATTRIBUTES])
+
+def get_csv_columns(test_attribs):
+    """Get csv columns (core columns + test suplementary attributes)
+    :param test_attribs list of test suplementary attributes"""
+    return CSV_CORE_COLUMNS + list(test_attribs)
+
+class TestAttributeGetter(object):
+    """TestAttributeGetter Class
+    Precompiled getter for the test suplementary attributes"""
+    def __init__(self, test_attribs):
+        """TestAttributeGetter Constructor
+        :param test_attribs list of test suplementary attributes"""
+        self.test_attribs = list(test_attribs)
+        self.empty_attribs = [None] * len(self.test_attribs)
+        if self.test_attribs:
+            self.getter = attrgetter(*self.test_attribs)
+        else:
+            self.getter = None
+
+    def __call__(self, test):
+        """Get the suplementary attributes of a test
+        :param test Test object"""
+        if self.getter is None:
+            return []
+        if len(self.test_attribs) == 1:
+            return [self.getter(test)]
+        return list(self.getter(test))
+
+    def __getstate__(self):
+        """Pickle the attribute names only (attrgetter is not picklable)"""
+        return self.test_attribs
+
+    def __setstate__(self, state):
+        """Rebuild the getter from the attribute names"""
+        self.__init__(state)
+
+def generate_csv_rows(test, attrib_getter):
+    """Generate the csv rows of a test (one row per step)
+    :param test Test object
+    :param attrib_getter TestAttributeGetter object"""
+    rows = []
+    for step in test.steps:
+        if rows:
+            csv_row = [None, step.step_id, step.description, step.expected_result]
+            csv_row.extend(attrib_getter.empty_attribs)
+        else:
+            csv_row = [test.test_id, step.step_id, step.description, step.expected_result]
+            csv_row.extend(attrib_getter(test))
+        rows.append(csv_row)
+    return rows
+
+def write_csv_rows(writer, tests, attrib_getter, chunk_size=CSV_CHUNK_SIZE):
+    """Write the csv rows of a sequence of tests in chunks
+    :param writer csv writer
+    :param tests iterable of Test objects
+    :param attrib_getter TestAttributeGetter object
+    :param chunk_size number of rows per writerows call"""
+    rows = []
+    for test in tests:
+        rows.extend(generate_csv_rows(test, attrib_getter))
+        if len(rows) >= chunk_size:
+            writer.writerows(rows)
+            rows = []
+    if rows:
+        writer.writerows(rows)
+
+def read_csv_tests(csv_path="./tspec.csv", delimiter=',', test_class=None):
+    """Generate Test objects (one at a time) from a csv file with the layout
+    written by TestSpec.convert_to_csv. Rows with a blank test_id are steps of
+    the previous test, extra columns are test suplementary attributes.
+    Values are read back as strings
+    :param csv_path tspec csv path
+    :param delimiter csv delimiter
+    :param test_class class of the tests (default: CustomTest if there are
+                      extra columns, BasicTest otherwise)
+    Raises ValueError if the csv columns are not the ones written by
+    TestSpec.convert_to_csv"""
+    try:
+        ifile = open(csv_path, 'rb')
+    except (OSError, IOError) as error:
+        logging.error("Unable to open file '%s'", str(csv_path))
+        raise error
+    with ifile:
+        reader = csv.reader(ifile, delimiter=delimiter)
+        csv_columns = next(reader, None)
+        if csv_columns is None or csv_columns[:len(CSV_CORE_COLUMNS)] != CSV_CORE_COLUMNS:
+            logging.error("Unexpected csv columns in file '%s'", str(csv_path))
+            raise ValueError("Unexpected csv columns in file '%s'" % str(csv_path))
+        test_attribs = csv_columns[len(CSV_CORE_COLUMNS):]
+        if test_class is None:
+            test_class = CustomTest if test_attribs else BasicTest
+        test = None
+        for csv_row in reader:
+            if not csv_row:
+                continue
+            if csv_row[0]:
+                if test is not None:
+                    yield test
+                test = test_class()
+                test.set_id(csv_row[0])
+                for attrib, value in zip(test_attribs, csv_row[4:]):
+                    setattr(test, attrib, value)
+            elif test is None:
+                logging.error("Found test-step '%s' with no test", csv_row[1])
+                continue
+            test.append_test_step(TestStep(*csv_row[1:4]), adopt=True)
+        if test is not None:
+            yield test
+
+# SQLiteTestSpec database schema
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS tests (position INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  test_id TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS steps (test_position INTEGER NOT NULL,
+                                  step_position INTEGER NOT NULL,
+                                  step_id, description TEXT, expected_result TEXT,
+                                  extras BLOB,
+                                  PRIMARY KEY (test_position, step_position));
+CREATE INDEX IF NOT EXISTS steps_step_id ON steps (test_position, step_id);
+CREATE TABLE IF NOT EXISTS attributes (test_position INTEGER NOT NULL,
+                                       name TEXT NOT NULL, value BLOB,
+                                       PRIMARY KEY (test_position, name));
+"""
+
+def sqlite_dumps(value):
+    """Serialize a value for a BLOB column
+    :param value python object"""
+    return sqlite3.Binary(dumps(value, HIGHEST_PROTOCOL))
+
+def sqlite_loads(value):
+    """Deserialize a BLOB column value
+    :param value BLOB column value"""
+    return loads(str(value))
+
+# Test spec being exported by a process pool worker (see init_csv_worker)
+CSV_WORKER_SPEC = None
+
+def init_csv_worker(test_spec):
+    """Process pool initializer: workers get the test spec once (inherited
+    when processes are forked) and only receive shard boundaries afterwards
+    :param test_spec TestSpec object"""
+    global CSV_WORKER_SPEC
+    CSV_WORKER_SPEC = test_spec
+
+def format_csv_shard(shard):
+    """Format the csv rows of a shard of tests (process pool worker)
+    :param shard (template index or None for TestSpec.tests, start, stop,
+                  TestAttributeGetter object, delimiter)"""
+    template_idx, start, stop, attrib_getter, delimiter = shard
+    if template_idx is None:
+        tests = CSV_WORKER_SPEC.get_tests(start, stop)
+    else:
+        tests = CSV_WORKER_SPEC.templates[template_idx].iter_tests(start, stop)
+    buf = StringIO()
+    write_csv_rows(csv.writer(buf, delimiter=delimiter), tests, attrib_getter)
+    return buf.getvalue()
+
+
+class TestTemplate(object):
+    """TestTemplate Class
+    Parameterized test that stands for one test per combination of the
+    parameter axes (see itertools.product). Test IDs and steps are str.format
+    templates which are only rendered when the tests are needed (e.g. export)"""
+    def __init__(self, test_id, steps, axes, test_class=BasicTest, translate=True, **kwargs):
+        """TestTemplate Constructor
+        :param test_id test ID template, e.g. "{subject}_{calculator}"
+        :param steps list of TestStep objects or (description, expected_result)
+                     tuples whose description and expected result are templates
+        :param axes list of (name, values) pairs, name can be a tuple of names
+                    when the values are tuples, e.g. (("calculator", "price"), PRICES)
+        :param test_class class of the rendered tests
+        :param translate replace unwanted characters in the test IDs (translate_name)
+        :param kwargs test suplementary attributes (string values are templates)"""
+        self.test_id = test_id
+        self.steps = []
+        for idx, step in enumerate(steps):
+            if not isinstance(step, TestStep):
+                step = TestStep(idx + 1, *step)
+            self.steps.append(step)
+        self.axes = []
+        for names, values in axes:
+            if isinstance(names, basestring):
+                self.axes.append(((names,), [(value,) for value in values]))
+            else:
+                self.axes.append((tuple(names), [tuple(value) for value in values]))
+        self.test_class = test_class
+        self.translate = translate
+        self.test_attribs = kwargs
+        self.formatter = Formatter()
+        self.id_pattern = None
+        self.id_fields = None
+
+    def __len__(self):
+        """Number of tests (parameter combinations)"""
+        count = 1
+        for _, values in self.axes:
+            count *= len(values)
+        return count
+
+    def __iter__(self):
+        """Render tests one by one"""
+        return self.iter_tests()
+
+    def __str__(self):
+        """TestTemplate String Representation"""
+        return "\nTest Template: %s (%d tests)" % (self.test_id, len(self))
+
+    def get_id(self):
+        """Get Test ID Template"""
+        return self.test_id
+
+    def iter_tests(self, start=0, stop=None):
+        """Render tests one by one
+        :param start first combination
+        :param stop last combination (excluded)"""
+        for _, params in self.iter_params(start, stop):
+            yield self.render_test(params)
+
+    def iter_params(self, start=0, stop=None):
+        """Generate (axis value indices, parameters) for every combination
+        :param start first combination
+        :param stop last combination (excluded)"""
+        combinations = product(*[list(enumerate(values)) for _, values in self.axes])
+        for combination in islice(combinations, start, stop):
+            params = {}
+            for (names, _), (_, value) in zip(self.axes, combination):
+                params.update(zip(names, value))
+            yield tuple([idx for idx, _ in combination]), params
+
+    def render_field(self, field, name, value, conversion, format_spec):
+        """Render (and translate) a test ID template field
+        :param field field name, e.g. "calculator" or "calculator[0]"
+        :param name parameter name (first part of the field name)
+        :param value parameter value
+        :param conversion field conversion
+        :param format_spec field format specification"""
+        value = self.formatter.get_field(field, (), {name: value})[0]
+        text = str(self.formatter.format_field( \
+                   self.formatter.convert_field(value, conversion), format_spec))
+        if self.translate:
+            text = text.translate(TRANSLATE_TABLE)
+        return text
+
+    def render_id(self, params):
+        """Render the test ID of a combination
+        :param params parameters"""
+        test_id = str(self.test_id.format(**params))
+        if self.translate:
+            test_id = test_id.translate(TRANSLATE_TABLE)
+        return test_id
+
+    def render_test(self, params):
+        """Render the test of a combination
+        :param params parameters"""
+        test = self.test_class()
+        test.set_id(self.render_id(params))
+        for key, value in self.test_attribs.items():
+            if isinstance(value, basestring):
+                value = value.format(**params)
+            setattr(test, key, value)
+        for step in self.steps:
+            test.append_test_step(TestStep(step.step_id, \
+                                           step.description.format(**params), \
+                                           step.expected_result.format(**params), \
+                                           **step.get_extras()), adopt=True)
+        return test
+
+    def compile_id_pattern(self):
+        """Compile a regular expression that parses rendered test IDs back
+        into axis value indices (returns False if a field is not a parameter)"""
+        axis_by_name = {}
+        for axis_idx, (names, _) in enumerate(self.axes):
+            for name_idx, name in enumerate(names):
+                axis_by_name[name] = (axis_idx, name_idx)
+        pattern = []
+        self.id_fields = []
+        for literal, field, format_spec, conversion in self.formatter.parse(self.test_id):
+            if self.translate:
+                literal = literal.translate(TRANSLATE_TABLE)
+            pattern.append(re.escape(literal))
+            if field is None:
+                continue
+            # Parameter name of fields such as "price[0]" or "price.real"
+            name = field._formatter_field_name_split()[0]
+            if name not in axis_by_name:
+                logging.error("Field '%s' of template '%s' is not a parameter", \
+                              field, self.test_id)
+                self.id_fields = None
+                return False
+            axis_idx, name_idx = axis_by_name[name]
+            # rendered field -> set of axis value indices
+            choices = {}
+            for value_idx, value in enumerate(self.axes[axis_idx][1]):
+                text = self.render_field(field, name, value[name_idx], conversion, format_spec)
+                choices.setdefault(text, set()).add(value_idx)
+            group = "f%d" % len(self.id_fields)
+            alternatives = sorted(choices.keys(), key=len, reverse=True)
+            pattern.append("(?P<%s>%s)" % (group, "|".join(map(re.escape, alternatives))))
+            self.id_fields.append((group, axis_idx, choices))
+        self.id_pattern = re.compile("".join(pattern) + r"\Z")
+        return True
+
+    def parse_id(self, test_id):
+        """Get the axis value indices of a test ID (None if there is no match)
+        :param test_id unique string identifier"""
+        if self.id_pattern is None and not self.compile_id_pattern():
+            return None
+        match = self.id_pattern.match(test_id)
+        if match is None:
+            return None
+        candidates = [None] * len(self.axes)
+        for group, axis_idx, choices in self.id_fields:
+            value_idxs = choices[match.group(group)]
+            if candidates[axis_idx] is None:
+                candidates[axis_idx] = value_idxs
+            else:
+                candidates[axis_idx] = candidates[axis_idx] & value_idxs
+        indices = []
+        for axis_idx, value_idxs in enumerate(candidates):
+            if value_idxs is None:
+                value_idxs = range(len(self.axes[axis_idx][1]))
+            if len(value_idxs) != 1:
+                return None
+            indices.append(list(value_idxs)[0])
+        return tuple(indices)
+
+    def has_test_id(self, test_id):
+        """Check if a test ID belongs to this template
+        :param test_id unique string identifier"""
+        return self.parse_id(test_id) is not None
+
+    def get_test_by_id(self, test_id):
+        """Render the test with a given test ID
+        :param test_id unique string identifier"""
+        indices = self.parse_id(test_id)
+        if indices is not None:
+            params = {}
+            for (names, values), value_idx in zip(self.axes, indices):
+                params.update(zip(names, values[value_idx]))
+            return self.render_test(params)
+
+    def iter_test_ids(self):
+        """Generate test IDs, checking that every combination has its own
+        (rendered IDs must parse back into the same combination)"""
+        if self.id_pattern is None and not self.compile_id_pattern():
+            return
+        for indices, params in self.iter_params():
+            test_id = self.render_id(params)
+            if self.parse_id(test_id) != indices:
+                logging.error("Test ID '%s' is not unique within template '%s'", \
+                              test_id, self.test_id)
+                return
+            yield test_id
+
+
 class TestSpec(object):
     """TestSpec Class"""
     def __init__(self, name=DEFAULT_TEST_SPEC_NAME, **kwargs):
@@ -257,13 +837,35 @@ class TestSpec(object):
         :param name test spec name"""
         self.name = name
         self.tests = []
+        self.test_index = {}
+        self.templates = []
         for key, value in kwargs.items():
             setattr(self, key, value)
 
     def __str__(self):
         """TestSpec String Representation"""
         print(self.name)
-        return "".join(map(str, self.tests))
+        return "".join(map(str, chain(self.get_tests(), self.templates)))
+
+    @classmethod
+    def from_csv(cls, csv_path="./tspec.csv", delimiter=',', name=DEFAULT_TEST_SPEC_NAME, \
+                 test_class=None):
+        """Create TSpec object from a CSV file (see read_csv_tests)
+        :param csv_path tspec csv path
+        :param delimiter csv delimiter
+        :param name test spec name
+        :param test_class class of the tests
+        :return TestSpec object (None if the tests could not be loaded)"""
+        test_spec = cls(name)
+        try:
+            loaded = test_spec.add_tests(read_csv_tests(csv_path, delimiter, test_class), \
+                                         adopt=True)
+        except ValueError:
+            loaded = False
+        if not loaded:
+            logging.error("Unable to load tests from file '%s'", str(csv_path))
+            return None
+        return test_spec
 
     def get_name(self):
         """Get Test Spec Name"""
@@ -279,99 +881,683 @@ class TestSpec(object):
         if not isinstance(new_test_id, str):
             logging.error("Test ID must be a string")
             return False
-        for test in self.tests:
-            if new_test_id == test.get_id():
+        if new_test_id in self.get_test_index():
+            logging.error("Test ID must be unique")
+            return False
+        for template in self.templates:
+            if template.has_test_id(new_test_id):
                 logging.error("Test ID must be unique")
                 return False
         return True
 
+    def reindex_tests(self, start=0):
+        """Rebuild the test ID index from a given position onwards
+        :param start first test position to be reindexed"""
+        if start == 0:
+            self.test_index.clear()
+        for idx in range(start, len(self.tests)):
+            self.test_index[self.tests[idx].get_id()] = idx
+
+    def get_test_index(self):
+        """Get Test ID index (rebuilt if the list of tests was changed directly)"""
+        if len(self.test_index) != len(self.tests):
+            self.reindex_tests()
+        return self.test_index
+
+    def rename_test(self, test, new_test_id):
+        """Update the test ID index before a test is renamed
+        Called by BasicTest.set_id for tests owned by this spec
+        :param test Test object
+        :param new_test_id new unique string identifier"""
+        test_idx = self.test_index.get(test.get_id())
+        if test_idx is None or self.tests[test_idx] is not test:
+            return True
+        if new_test_id == test.get_id():
+            return True
+        if not self.validate_test_id(new_test_id):
+            return False
+        del self.test_index[test.get_id()]
+        self.test_index[new_test_id] = test_idx
+        return True
+
+    def get_test_by_id(self, test_id):
+        """Get Test by Test ID
+        :param test_id unique string identifier"""
+        test_idx = self.get_test_index().get(test_id)
+        if test_idx is not None:
+            return self.tests[test_idx]
+        for template in self.templates:
+            test = template.get_test_by_id(test_id)
+            if test is not None:
+                return test
+
+    def get_test_class(self):
+        """Get the class shared by all tests (None if the spec is empty)"""
+        if len(self.tests) > 0:
+            return self.tests[0].__class__
+        if len(self.templates) > 0:
+            return self.templates[0].test_class
+        return None
+
+    def get_tests(self, start=0, stop=None):
+        """Get added tests (templates not included)
+        :param start first test position
+        :param stop last test position (excluded)"""
+        return self.tests[start:stop]
+
+    def iter_tests(self):
+        """Generate all tests: added tests first, then the (rendered) tests
+        of each template"""
+        for test in self.get_tests():
+            yield test
+        for template in self.templates:
+            for test in template:
+                yield test
+
+    def count_tests(self, templates=True):
+        """Number of tests
+        :param templates include template tests"""
+        count = len(self.tests)
+        if templates:
+            count += sum([len(template) for template in self.templates])
+        return count
+
     def validate_test(self, test):
         """Validate Test
         :param test Test object"""
         if self.validate_test_id(test.get_id()):
-            if len(self.tests) > 0:
-                if test.__class__ != self.tests[0].__class__:
-                    logging.error("All tests must belong to the same class")
-                    return False
-                else:
-                    return True
+            test_class = self.get_test_class()
+            if test_class is not None and test.__class__ != test_class:
+                logging.error("All tests must belong to the same class")
+                return False
             else:
                 return True
         else:
             return False
 
-    def add_test(self, test):
+    def add_template(self, template):
+        """Add a TestTemplate object (tests are rendered lazily)
+        :param template TestTemplate object"""
+        test_class = self.get_test_class()
+        if test_class is not None and template.test_class != test_class:
+            logging.error("All tests must belong to the same class")
+            logging.error("Failed to add template")
+            return False
+        count = 0
+        for test_id in template.iter_test_ids():
+            if not self.validate_test_id(test_id):
+                logging.error("Failed to add template")
+                return False
+            count += 1
+        if count != len(template):
+            logging.error("Failed to add template")
+            return False
+        self.templates.append(template)
+        return True
+
+    def add_test(self, test, adopt=False):
         """Add a Test object
-        :param test Test object"""
+        :param test Test object
+        :param adopt store the object itself instead of a copy (the spec
+                     takes ownership of the test, tests owned by another spec
+                     are still copied)"""
         if self.validate_test(test):
-            self.tests.append(copy(test))
+            new_test = self.adopt_test(test) if adopt else copy(test)
+            new_test.test_spec = self
+            self.test_index[new_test.get_id()] = len(self.tests)
+            self.tests.append(new_test)
         else:
             logging.error("Failed to add test")
 
+    def add_tests(self, tests, adopt=False):
+        """Add a batch of Test objects (all or nothing, the tests are also
+        removed if tests raises an exception)
+        :param tests iterable of Test objects (list, generator, ...)
+        :param adopt store the objects themselves instead of copies"""
+        start = len(self.tests)
+        test_index = self.get_test_index()
+        try:
+            for test in tests:
+                if self.validate_test(test):
+                    new_test = self.adopt_test(test) if adopt else copy(test)
+                    new_test.test_spec = self
+                    test_index[new_test.get_id()] = len(self.tests)
+                    self.tests.append(new_test)
+                    continue
+                self.rollback_tests(start)
+                logging.error("Failed to add tests")
+                return False
+        except:
+            self.rollback_tests(start)
+            raise
+        return True
+
+    def rollback_tests(self, start):
+        """Remove the tests added from a given position onwards
+        :param start position of the first added test"""
+        for new_test in self.tests[start:]:
+            self.test_index.pop(new_test.get_id(), None)
+            new_test.test_spec = None
+        del self.tests[start:]
+
+    def adopt_test(self, test):
+        """Get the object to be stored for an adopted test (a copy if the
+        test is owned by another spec, whose test ID index must stay valid)
+        :param test Test object"""
+        if test.test_spec is not None and test.test_spec is not self:
+            logging.debug("Test '%s' is owned by another spec, adding a copy", test.get_id())
+            return copy(test)
+        return test
+
     def remove_test_by_id(self, test_id):
         """Remove Test by Test ID
         :param test_id unique string identifier"""
-        del_idx = None
-        for idx in range(len(self.tests)):
-            if test_id == self.tests[idx].get_id():
-                del_idx = idx
-                break
-        if del_idx:
-            del self.tests[del_idx]
+        del_idx = self.get_test_index().get(test_id)
+        if del_idx is not None:
+            self.remove_test_by_index(del_idx)
         else:
             logging.error("Found no test with ID '%s'", test_id)
 
     def remove_test_by_index(self, test_idx):
         """Remove Test by Test Index
         :param test_idx test position in the list of tests"""
+        if test_idx < 0:
+            test_idx += len(self.tests)
+        test = self.tests[test_idx]
         del self.tests[test_idx]
+        self.test_index.pop(test.get_id(), None)
+        test.test_spec = None
+        self.reindex_tests(test_idx)
 
     def convert_to_csv(self, csv_path="./tspec.csv", delimiter=','):
         """Convert TSpec object to CSV file
         :param csv_path new tspec csv path
         :param delimiter csv delimiter"""
-        if len(self.tests) > 0:
-            # Get test suplementary attributes
-            test_attribs = self.tests[0].__dict__.keys()
-            test_attribs = sorted([c for c in test_attribs if c not in BasicTest().__dict__.keys()])
-            csv_columns = copy(test_attribs)
-            # Add core columns
-            csv_columns.insert(0, 'test_id')
-            csv_columns.insert(1, 'step_id')
-            csv_columns.insert(2, 'description')
-            csv_columns.insert(3, 'expected_result')
-            # http://www.pythonforbeginners.com/systems-programming/using-the-csv-module-in-python/
-            try:
-                ofile = open(csv_path, 'wt')
-            except (OSError, IOError) as error:
-                logging.error("Unable to open file '%s'", str(csv_path))
-                raise error
-            # csv writer
+        if self.get_test_class() is not None:
+            with TestSpecWriter(csv_path, delimiter) as writer:
+                writer.write_tests(self.iter_tests())
+        else:
+            logging.error("Test Spec contains no tests")
+
+    def convert_to_csv_parallel(self, csv_path="./tspec.csv", delimiter=',', \
+                                processes=None, shard_size=CSV_SHARD_SIZE, merge=True):
+        """Convert TSpec object to CSV file(s), formatting the rows of each
+        shard of tests in a process pool. Shards are written in order, so the
+        merged file is the same as the one from convert_to_csv
+        :param csv_path new tspec csv path
+        :param delimiter csv delimiter
+        :param processes number of worker processes (default: cpu count)
+        :param shard_size number of tests per shard
+        :param merge write a single file, otherwise one file per shard
+                     (<csv_path>.<shard>.csv, the header is in the first one)
+        :return list of csv paths"""
+        first_test = next(self.iter_tests(), None)
+        if first_test is None:
+            logging.error("Test Spec contains no tests")
+            return []
+        processes = processes or cpu_count()
+        csv_root, csv_ext = os.path.splitext(csv_path)
+        csv_paths = []
+        writer = TestSpecWriter(csv_path, delimiter) if merge else None
+        test_attribs = get_test_attributes(first_test)
+        attrib_getter = TestAttributeGetter(test_attribs)
+        # Shard boundaries: (template index or None for self.tests, start, stop)
+        sources = [(None, self.count_tests(templates=False))]
+        sources.extend([(idx, len(template)) for idx, template in enumerate(self.templates)])
+        shards = [(source, start, min(start + shard_size, count)) \
+                  for source, count in sources for start in range(0, count, shard_size)]
+
+        def write_shard(shard_idx, result):
+            """Write formatted shard (in order)"""
+            if merge:
+                writer.ofile.write(result.get())
+            else:
+                shard_path = "%s.%04d%s" % (csv_root, shard_idx, csv_ext)
+                with open(shard_path, 'wt') as shard_file:
+                    if shard_idx == 0:
+                        csv.writer(shard_file, delimiter=delimiter).writerow( \
+                            get_csv_columns(test_attribs))
+                    shard_file.write(result.get())
+                csv_paths.append(shard_path)
+
+        if merge:
+            writer.open()
+            writer.write_header(first_test)
+            csv_paths.append(csv_path)
+        pool = Pool(processes, init_csv_worker, (self,))
+        try:
+            pending = deque()
+            for shard_idx, (source, start, stop) in enumerate(shards):
+                shard = (source, start, stop, attrib_getter, delimiter)
+                pending.append((shard_idx, pool.apply_async(format_csv_shard, (shard,))))
+                # Keep a bounded number of shards in flight
+                if len(pending) >= 2 * processes:
+                    write_shard(*pending.popleft())
+            while pending:
+                write_shard(*pending.popleft())
+        finally:
+            pool.close()
+            pool.join()
+            if merge:
+                writer.close()
+        return csv_paths
+
+
+class TestSpecWriter(object):
+    """TestSpecWriter Class
+    Streaming csv sink: tests are validated like in TestSpec.add_test and
+    their rows are written right away, only the test IDs and the csv columns
+    are kept in memory"""
+    def __init__(self, csv_path="./tspec.csv", delimiter=','):
+        """TestSpecWriter Constructor
+        :param csv_path new tspec csv path
+        :param delimiter csv delimiter"""
+        self.csv_path = csv_path
+        self.delimiter = delimiter
+        self.ofile = None
+        self.writer = None
+        self.test_ids = set()
+        self.test_class = None
+        self.test_attribs = None
+        self.attrib_getter = None
+
+    def __enter__(self):
+        """Open the csv file"""
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the csv file"""
+        self.close()
+
+    def open(self):
+        """Open the csv file and create the csv writer"""
+        # http://www.pythonforbeginners.com/systems-programming/using-the-csv-module-in-python/
+        try:
+            self.ofile = open(self.csv_path, 'wt')
+        except (OSError, IOError) as error:
+            logging.error("Unable to open file '%s'", str(self.csv_path))
+            raise error
+        # csv writer
+        try:
+            self.writer = csv.writer(self.ofile, delimiter=self.delimiter)
+        except (OSError, IOError) as error:
+            self.ofile.close()
+            logging.error("Unable to create csv.writer for file '%s'", str(self.csv_path))
+            raise error
+
+    def close(self):
+        """Close the csv file"""
+        if self.ofile is not None:
+            if self.test_class is None:
+                logging.error("Test Spec contains no tests")
+            self.ofile.close()
+            self.ofile = None
+            self.writer = None
+
+    def write_header(self, test):
+        """Get the csv columns from the first test and write them
+        :param test Test object"""
+        self.test_class = test.__class__
+        self.test_attribs = get_test_attributes(test)
+        self.attrib_getter = TestAttributeGetter(self.test_attribs)
+        self.writer.writerow(get_csv_columns(self.test_attribs))
+
+    def validate_test(self, test):
+        """Validate Test (same rules as TestSpec.validate_test)
+        :param test Test object"""
+        test_id = test.get_id()
+        if not isinstance(test_id, str):
+            logging.error("Test ID must be a string")
+            return False
+        if test_id in self.test_ids:
+            logging.error("Test ID must be unique")
+            return False
+        if self.test_class is not None and test.__class__ != self.test_class:
+            logging.error("All tests must belong to the same class")
+            return False
+        return True
+
+    def add_test(self, test):
+        """Validate a Test object and write its test-steps
+        :param test Test object"""
+        if self.validate_test(test):
+            if self.test_class is None:
+                self.write_header(test)
+            self.test_ids.add(test.get_id())
+            self.writer.writerows(generate_csv_rows(test, self.attrib_getter))
+        else:
+            logging.error("Failed to add test")
+
+    def write_tests(self, tests):
+        """Write the test-steps of already validated tests (no ID tracking)
+        :param tests iterable of Test objects"""
+        tests = iter(tests)
+        if self.test_class is None:
+            for test in tests:
+                self.write_header(test)
+                self.writer.writerows(generate_csv_rows(test, self.attrib_getter))
+                break
+        write_csv_rows(self.writer, tests, self.attrib_getter)
+
+
+class SQLiteTestSpec(TestSpec):
+    """SQLiteTestSpec Class
+    TestSpec whose tests, steps and suplementary attributes are kept in a
+    local SQLite file instead of memory (templates are still kept in memory).
+    Tests returned by get_test_by_id/get_tests are loaded from the database:
+    renaming them with set_id is stored, other changes are not"""
+    def __init__(self, name=DEFAULT_TEST_SPEC_NAME, db_path="./tspec.db", **kwargs):
+        """SQLiteTestSpec Constructor
+        :param name test spec name (default: name stored in the database)
+        :param db_path sqlite database path (":memory:" is not shared with
+                       the convert_to_csv_parallel workers)"""
+        TestSpec.__init__(self, name, **kwargs)
+        self.db_path = db_path
+        self.connection = None
+        self.connection_pid = None
+        self.test_class = None
+        self.open()
+
+    def __getstate__(self):
+        """Pickle state (the connection is reopened on demand)"""
+        state = self.__dict__.copy()
+        state['connection'] = None
+        state['connection_pid'] = None
+        return state
+
+    def __enter__(self):
+        """Context manager"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the database"""
+        self.close()
+
+    def open(self):
+        """Open (or create) the database"""
+        connection = self.get_connection()
+        connection.executescript(SQLITE_SCHEMA)
+        stored_name = self.get_meta('name')
+        if stored_name is None or self.name != DEFAULT_TEST_SPEC_NAME:
+            self.set_meta('name', self.name)
+        else:
+            self.name = stored_name
+        self.test_class = self.get_meta('test_class')
+        connection.commit()
+
+    def close(self):
+        """Close the database"""
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def get_connection(self):
+        """Get the database connection (one per process)"""
+        if self.connection is None or self.connection_pid != os.getpid():
             try:
-                writer = csv.writer(ofile, delimiter=delimiter)
-            except (OSError, IOError) as error:
-                ofile.close()
-                logging.error("Unable to create csv.writer for file '%s'", str(csv_path))
+                self.connection = sqlite3.connect(self.db_path)
+            except sqlite3.Error as error:
+                logging.error("Unable to open database '%s'", str(self.db_path))
                 raise error
-            # Write columns
-            writer.writerow(csv_columns)
-            for test in self.tests:
-                for step in test.steps:
-                    if test.steps.index(step) == 0:
-                        csv_row = [test.get_id(), step.get_id(), \
-                                                  step.get_description(), \
-                                                  step.get_expected_result()]
-                        for attrib in test_attribs:
-                            csv_row.append(getattr(test, attrib))
-                    else:
-                        csv_row = [None, step.get_id(), \
-                                         step.get_description(), \
-                                         step.get_expected_result()]
-                        for attrib in test_attribs:
-                            csv_row.append(None)
-                    # Write test-step
-                    writer.writerow(csv_row)
-            # Close csv file
-            ofile.close()
+            self.connection.text_factory = str
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    def get_meta(self, key):
+        """Get stored test spec property
+        :param key property name"""
+        row = self.get_connection().execute("SELECT value FROM meta WHERE key = ?", \
+                                            (key,)).fetchone()
+        return sqlite_loads(row[0]) if row else None
+
+    def set_meta(self, key, value):
+        """Store test spec property
+        :param key property name
+        :param value property value"""
+        self.get_connection().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", \
+                                      (key, sqlite_dumps(value)))
+
+    def set_name(self, name):
+        """Set Test Spec Name"""
+        self.name = name
+        self.set_meta('name', name)
+        self.get_connection().commit()
+
+    def get_test_class(self):
+        """Get the class shared by all tests (None if the spec is empty)"""
+        if self.test_class is not None:
+            return self.test_class
+        if len(self.templates) > 0:
+            return self.templates[0].test_class
+        return None
+
+    def validate_test_id(self, new_test_id):
+        """Validate Test ID
+        :param test_id unique string identifier"""
+        if not isinstance(new_test_id, str):
+            logging.error("Test ID must be a string")
+            return False
+        if self.get_test_position(new_test_id) is not None:
+            logging.error("Test ID must be unique")
+            return False
+        for template in self.templates:
+            if template.has_test_id(new_test_id):
+                logging.error("Test ID must be unique")
+                return False
+        return True
+
+    def get_test_position(self, test_id):
+        """Get the database position of a test (None if there is no such test)
+        :param test_id unique string identifier"""
+        row = self.get_connection().execute("SELECT position FROM tests WHERE test_id = ?", \
+                                            (test_id,)).fetchone()
+        return row[0] if row else None
+
+    def rename_test(self, test, new_test_id):
+        """Rename a stored test (called by BasicTest.set_id)
+        :param test Test object
+        :param new_test_id new unique string identifier"""
+        if new_test_id == test.get_id() or self.get_test_position(test.get_id()) is None:
+            return True
+        if not self.validate_test_id(new_test_id):
+            return False
+        connection = self.get_connection()
+        connection.execute("UPDATE tests SET test_id = ? WHERE test_id = ?", \
+                           (new_test_id, test.get_id()))
+        connection.commit()
+        return True
+
+    def insert_test(self, test):
+        """Insert a (validated) test in the database
+        :param test Test object"""
+        connection = self.get_connection()
+        if self.test_class is None:
+            self.test_class = test.__class__
+            self.set_meta('test_class', self.test_class)
+        position = connection.execute("INSERT INTO tests (test_id) VALUES (?)", \
+                                      (test.get_id(),)).lastrowid
+        connection.executemany("INSERT INTO attributes (test_position, name, value) " \
+                               "VALUES (?, ?, ?)", \
+                               [(position, attrib, sqlite_dumps(getattr(test, attrib))) \
+                                for attrib in get_test_attributes(test)])
+        connection.executemany("INSERT INTO steps (test_position, step_position, step_id, " \
+                               "description, expected_result, extras) VALUES (?, ?, ?, ?, ?, ?)", \
+                               [(position, step_position, step.step_id, step.description, \
+                                 step.expected_result, \
+                                 sqlite_dumps(step.get_extras()) if GET_STEP_EXTRAS(step) else None) \
+                                for step_position, step in enumerate(test.steps)])
+
+    def add_test(self, test, adopt=False):
+        """Add a Test object
+        :param test Test object
+        :param adopt kept for compatibility (tests are always stored as copies)"""
+        if self.validate_test(test):
+            self.insert_test(test)
+            self.get_connection().commit()
         else:
-            logging.error("Test Spec contains no tests")
+            logging.error("Failed to add test")
+
+    def add_tests(self, tests, adopt=False):
+        """Add a batch of Test objects (all or nothing, in a single transaction
+        which is also rolled back if tests raises an exception)
+        :param tests iterable of Test objects (list, generator, ...)
+        :param adopt kept for compatibility (tests are always stored as copies)"""
+        connection = self.get_connection()
+        test_class = self.test_class
+        try:
+            for test in tests:
+                if self.validate_test(test):
+                    self.insert_test(test)
+                    continue
+                # Rollback
+                connection.rollback()
+                self.test_class = test_class
+                logging.error("Failed to add tests")
+                return False
+        except:
+            connection.rollback()
+            self.test_class = test_class
+            raise
+        connection.commit()
+        return True
+
+    def remove_test_by_id(self, test_id):
+        """Remove Test by Test ID
+        :param test_id unique string identifier"""
+        position = self.get_test_position(test_id)
+        if position is not None:
+            self.delete_test(position)
+        else:
+            logging.error("Found no test with ID '%s'", test_id)
+
+    def remove_test_by_index(self, test_idx):
+        """Remove Test by Test Index
+        :param test_idx test position in the list of tests"""
+        if test_idx < 0:
+            test_idx += self.count_tests(templates=False)
+        row = None
+        if test_idx >= 0:
+            row = self.get_connection().execute("SELECT position FROM tests ORDER BY position " \
+                                                "LIMIT 1 OFFSET ?", (test_idx,)).fetchone()
+        if row is None:
+            raise IndexError("test index out of range")
+        self.delete_test(row[0])
+
+    def delete_test(self, position):
+        """Delete a test from the database
+        :param position database position of the test"""
+        connection = self.get_connection()
+        connection.execute("DELETE FROM steps WHERE test_position = ?", (position,))
+        connection.execute("DELETE FROM attributes WHERE test_position = ?", (position,))
+        connection.execute("DELETE FROM tests WHERE position = ?", (position,))
+        if connection.execute("SELECT 1 FROM tests LIMIT 1").fetchone() is None:
+            self.test_class = None
+            connection.execute("DELETE FROM meta WHERE key = 'test_class'")
+        connection.commit()
+
+    def get_test_by_id(self, test_id):
+        """Get Test by Test ID
+        :param test_id unique string identifier"""
+        position = self.get_test_position(test_id)
+        if position is not None:
+            return next(self.load_tests("WHERE position = ?", (position,)))
+        for template in self.templates:
+            test = template.get_test_by_id(test_id)
+            if test is not None:
+                return test
+
+    def get_tests(self, start=0, stop=None):
+        """Generate stored tests (templates not included)
+        :param start first test position
+        :param stop last test position (excluded)"""
+        limit = -1 if stop is None else max(stop - start, 0)
+        return self.load_tests("ORDER BY position LIMIT ? OFFSET ?", (limit, start))
+
+    def count_tests(self, templates=True):
+        """Number of tests
+        :param templates include template tests"""
+        count = self.get_connection().execute("SELECT COUNT(*) FROM tests").fetchone()[0]
+        if templates:
+            count += sum([len(template) for template in self.templates])
+        return count
+
+    def load_tests(self, where, params):
+        """Load tests from the database (streaming from cursors)
+        :param where SQL clause applied to the tests table
+        :param params SQL parameters"""
+        connection = self.get_connection()
+        test_class = self.test_class
+        selection = "SELECT position FROM tests " + where
+        for position, test_id in connection.execute( \
+                "SELECT position, test_id FROM tests WHERE position IN (%s) ORDER BY position" \
+                % selection, params):
+            test = test_class.__new__(test_class)
+            BasicTest.__init__(test, test_id)
+            for name, value in connection.execute("SELECT name, value FROM attributes " \
+                                                  "WHERE test_position = ?", (position,)):
+                setattr(test, name, sqlite_loads(value))
+            for step_id, description, expected_result, extras in connection.execute( \
+                    "SELECT step_id, description, expected_result, extras FROM steps " \
+                    "WHERE test_position = ? ORDER BY step_position", (position,)):
+                kwargs = sqlite_loads(extras) if extras is not None else {}
+                test.append_test_step(TestStep(step_id, description, expected_result, \
+                                               **kwargs), adopt=True)
+            test.test_spec = self
+            yield test
+
+    def iter_csv_rows(self):
+        """Generate the csv rows of the stored tests straight from the database"""
+        connection = self.get_connection()
+        first_test = connection.execute("SELECT position FROM tests ORDER BY position " \
+                                        "LIMIT 1").fetchone()
+        test_attribs = sorted([name for (name,) in connection.execute( \
+            "SELECT name FROM attributes WHERE test_position = ?", first_test)])
+        empty_attribs = [None] * len(test_attribs)
+        attributes = connection.execute("SELECT test_position, name, value FROM attributes " \
+                                        "ORDER BY test_position, name")
+        attribute = next(attributes, None)
+        previous_position = None
+        for position, test_id, step_id, description, expected_result in connection.execute( \
+                "SELECT steps.test_position, tests.test_id, steps.step_id, steps.description, " \
+                "steps.expected_result FROM steps JOIN tests " \
+                "ON tests.position = steps.test_position " \
+                "ORDER BY steps.test_position, steps.step_position"):
+            if position == previous_position:
+                csv_row = [None, step_id, description, expected_result]
+                csv_row.extend(empty_attribs)
+            else:
+                previous_position = position
+                # Merge join with the (ordered) attributes cursor
+                values = {}
+                while attribute is not None and attribute[0] <= position:
+                    if attribute[0] == position:
+                        values[attribute[1]] = sqlite_loads(attribute[2])
+                    attribute = next(attributes, None)
+                csv_row = [test_id, step_id, description, expected_result]
+                csv_row.extend([values.get(attrib) for attrib in test_attribs])
+            yield csv_row
+
+    def convert_to_csv(self, csv_path="./tspec.csv", delimiter=','):
+        """Convert TSpec object to CSV file (stored tests are streamed from
+        the database)
+        :param csv_path new tspec csv path
+        :param delimiter csv delimiter"""
+        if self.test_class is None:
+            TestSpec.convert_to_csv(self, csv_path, delimiter)
+            return
+        with TestSpecWriter(csv_path, delimiter) as writer:
+            first_test = next(self.get_tests(0, 1))
+            writer.write_header(first_test)
+            rows = []
+            for csv_row in self.iter_csv_rows():
+                rows.append(csv_row)
+                if len(rows) >= CSV_CHUNK_SIZE:
+                    writer.writer.writerows(rows)
+                    rows = []
+            writer.writer.writerows(rows)
+            for template in self.templates:
+                writer.write_tests(template)